@@ -0,0 +1,23 @@
+-- Add tree_state column to customer_settings table
+-- 'partial' = Skeleton-Tree aus sync_structure.py --progressive (nur Assets und Hierarchie)
+-- 'complete' = vollständiger Tree inkl. Devices und Attribute
+-- NULL = Tree aus der Zeit vor dieser Spalte (vollständig); jeder spätere vollständige Sync schreibt 'complete'
+
+-- Check if column exists, if not add it
+IF NOT EXISTS (
+    SELECT * 
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_NAME = 'customer_settings' 
+    AND COLUMN_NAME = 'tree_state'
+)
+BEGIN
+    ALTER TABLE customer_settings
+    ADD tree_state NVARCHAR(20) NULL;
+    
+    PRINT 'Column tree_state added to customer_settings table';
+END
+ELSE
+BEGIN
+    PRINT 'Column tree_state already exists in customer_settings table';
+END
+GO
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark der Downsampling-Verfahren aus telemetry_arrays.py
+Vergleicht LTTB und Min/Max-Buckets mit der Stichprobenbildung der API (jeder n-te Punkt,
+docs/PERFORMANCE_OPTIMIZATION.md) nach Laufzeit und visuellem Fehler.
+Ohne --input wird ein synthetischer Temperaturverlauf mit Spitzen und Ventil-Sprüngen erzeugt.
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Dict, Any
+
+import numpy as np
+
+from telemetry_arrays import DOWNSAMPLERS, to_columns, downsample, reconstruction_error
+
+def synthetic_series(points: int, seed: int = 42) -> tuple:
+    """Raumtemperatur im 1-Minuten-Raster: Tagesgang, Rauschen, kurze Fenster-Lüftungen und Sprünge"""
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + np.arange(points, dtype=np.int64) * 60_000
+    minutes = np.arange(points)
+    values = 20.5 + 1.5 * np.sin(minutes * 2 * np.pi / 1440) + rng.normal(0, 0.1, points)
+    # Lüften: kurze Einbrüche von 3-6 K über 5-15 Minuten
+    for start in rng.integers(0, points - 15, max(1, points // 5000)):
+        values[start:start + rng.integers(5, 15)] -= rng.uniform(3, 6)
+    # Sollwert-/Ventilwechsel: Stufen
+    for start in rng.integers(0, points, max(1, points // 20000)):
+        values[start:] += rng.choice([-1.0, 1.0])
+    return timestamps, values
+
+def run_benchmark(timestamps: np.ndarray, values: np.ndarray, target: int, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for method in DOWNSAMPLERS:
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            sampled_ts, sampled_values = downsample(timestamps, values, target, method)
+            durations.append(time.perf_counter() - started)
+        results[method] = {
+            'points': int(sampled_ts.size),
+            'milliseconds': round(min(durations) * 1000, 2),
+            **{key: round(value, 4) for key, value in reconstruction_error(timestamps, values, sampled_ts, sampled_values).items()}
+        }
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark: LTTB und Min/Max gegen Stride-Downsampling')
+    parser.add_argument('--points', type=int, default=1_000_000, help='Anzahl synthetischer Punkte (Standard: 1000000)')
+    parser.add_argument('--target', type=int, default=1000, help='Ziel-Punktanzahl (Standard: 1000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Wiederholungen für die Zeitmessung (Standard: 3)')
+    parser.add_argument('--input', help='Telemetrie-JSON ({key: [{ts, value}]}) statt synthetischer Daten')
+    parser.add_argument('--key', default='sensorTemperature', help='Key aus --input (Standard: sensorTemperature)')
+    parser.add_argument('--json', action='store_true', help='Ergebnis als JSON ausgeben')
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            data = json.load(f)
+        if args.key not in data:
+            print(f"❌ Key {args.key} nicht in {args.input}")
+            return 1
+        timestamps, values = to_columns(data[args.key])
+        source = f"{args.input} ({args.key})"
+    else:
+        timestamps, values = synthetic_series(args.points)
+        source = 'synthetisch'
+
+    results = run_benchmark(timestamps, values, args.target, args.repeat)
+    if args.json:
+        print(json.dumps({'source': source, 'inputPoints': int(timestamps.size), 'target': args.target,
+                          'results': results}, indent=2))
+        return 0
+
+    print(f"📊 Downsampling {timestamps.size} → {args.target} Punkte ({source})")
+    print("=" * 86)
+    print(f"{'Verfahren':<10} {'Punkte':>7} {'ms':>9} {'RMSE':>8} {'Max-Fehler':>11} {'Hülle':>8} {'Spitze':>8} {'Tal':>8}")
+    for method, result in results.items():
+        print(f"{method:<10} {result['points']:>7} {result['milliseconds']:>9} {result['rmse']:>8} "
+              f"{result['maxError']:>11} {result['envelopeError']:>8} {result['peakLoss']:>8} {result['troughLoss']:>8}")
+    print("Hülle = mittlere Abweichung der Min/Max-Hülle pro Pixelspalte; Spitze/Tal = verlorene Extremwerte")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
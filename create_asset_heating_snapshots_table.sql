@@ -0,0 +1,37 @@
+-- Tabelle für vorberechnete Raum-Snapshots erstellen
+-- sync_structure.py --room-snapshots schreibt pro Asset die aktuellen Werte (Temperatur, Sollwert,
+-- Ventil, Batterie) aus der letzten ThingsBoard-Telemetrie aller relatedDevices.
+-- Übersichtsseiten lesen damit alle Räume eines Kunden mit einer einzigen Abfrage.
+
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='asset_heating_snapshots' AND xtype='U')
+BEGIN
+    CREATE TABLE asset_heating_snapshots (
+        customer_id UNIQUEIDENTIFIER NOT NULL,  -- Customer ID wie in customer_settings
+        asset_id NVARCHAR(36) NOT NULL,  -- ThingsBoard Asset ID
+        operational_mode INT NULL,
+        sensor_temperature FLOAT NULL,  -- Raumwert (extern oder Mittelwert)
+        target_temperature FLOAT NULL,
+        percent_valve_open FLOAT NULL,
+        min_battery_voltage FLOAT NULL,  -- Niedrigste Batteriespannung der Devices im Raum
+        device_count INT NOT NULL,
+        latest_ts BIGINT NULL,  -- Jüngster Telemetrie-Zeitstempel (ms)
+        snapshot NVARCHAR(MAX) NOT NULL,  -- Vollständiger Snapshot als JSON (room, devices, external_temperature_device)
+        updated_at DATETIME2 DEFAULT GETDATE(),
+
+        CONSTRAINT PK_asset_heating_snapshots PRIMARY KEY (customer_id, asset_id)
+    );
+
+    PRINT 'Tabelle asset_heating_snapshots wurde erfolgreich erstellt.';
+END
+ELSE
+BEGIN
+    PRINT 'Tabelle asset_heating_snapshots existiert bereits.';
+END
+
+-- Beispiel-Abfragen für die Verwendung:
+PRINT '';
+PRINT 'Beispiel-Abfragen:';
+PRINT '-- Alle Räume eines Customers:';
+PRINT 'SELECT asset_id, sensor_temperature, target_temperature, percent_valve_open, min_battery_voltage, updated_at FROM asset_heating_snapshots WHERE customer_id = ''CUSTOMER_ID_HIER'';';
+
+GO
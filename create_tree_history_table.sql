@@ -0,0 +1,37 @@
+-- Tabelle für versionierte Tree-Snapshots erstellen
+-- sync_structure.py speichert bei jeder Änderung des Trees einen kompakten Snapshot
+-- (msgpack bzw. JSON, zlib-komprimiert, internierte Strings) und den Diff zur Vorversion.
+-- Clients laden über /api/config/customers/[id]/tree-changes?since=N nur die Änderungen.
+
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='customer_tree_history' AND xtype='U')
+BEGIN
+    CREATE TABLE customer_tree_history (
+        id BIGINT IDENTITY(1,1) PRIMARY KEY,
+        customer_id UNIQUEIDENTIFIER NOT NULL,  -- Customer ID wie in customer_settings
+        version INT NOT NULL,  -- Fortlaufende Version pro Customer (ab 1)
+        snapshot VARBINARY(MAX) NOT NULL,  -- Kompakter Snapshot des vollständigen Trees
+        encoding NVARCHAR(20) NOT NULL,  -- 'msgpack+zlib' oder 'json+zlib'
+        diff NVARCHAR(MAX) NOT NULL,  -- Änderungen zur Vorversion als JSON (added, removed, moved, renamed, attributes, devices)
+        node_count INT NOT NULL,  -- Anzahl Assets im Tree
+        created_at DATETIME2 DEFAULT GETDATE(),
+
+        CONSTRAINT UQ_customer_tree_history_customer_version UNIQUE (customer_id, version)
+    );
+
+    PRINT 'Tabelle customer_tree_history wurde erfolgreich erstellt.';
+END
+ELSE
+BEGIN
+    PRINT 'Tabelle customer_tree_history existiert bereits.';
+END
+
+-- Beispiel-Abfragen für die Verwendung:
+PRINT '';
+PRINT 'Beispiel-Abfragen:';
+PRINT '-- Versionen eines Customers:';
+PRINT 'SELECT version, node_count, DATALENGTH(snapshot) AS snapshot_bytes, created_at FROM customer_tree_history WHERE customer_id = ''CUSTOMER_ID_HIER'' ORDER BY version DESC;';
+PRINT '';
+PRINT '-- Alte Versionen löschen (älter als 90 Tage, letzte Version bleibt erhalten):';
+PRINT 'DELETE h FROM customer_tree_history h WHERE created_at < DATEADD(DAY, -90, GETDATE()) AND version < (SELECT MAX(version) FROM customer_tree_history WHERE customer_id = h.customer_id);';
+
+GO
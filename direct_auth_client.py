@@ -6,13 +6,26 @@ Simuliert den kompletten Login-Prozess
 
 import requests
 import json
+import argparse
 from datetime import datetime
 
-def direct_login(username, password, base_url="http://localhost:3000"):
+from telemetry_export import open_exporter, EXPORT_FORMATS
+from session_store import SessionStore, format_expiry
+import tracing
+
+def direct_login(username, password, base_url="http://localhost:3000", session_store=None):
     """
     Direkter Login über NextAuth
+    Mit session_store wird eine gespeicherte, noch gültige Session ohne Login wiederverwendet
     """
-    session = requests.Session()
+    session = tracing.trace_session(requests.Session())
+    
+    if session_store is not None:
+        entry = session_store.load(base_url, username)
+        if entry and entry.get('session'):
+            SessionStore.restore(session, entry)
+            print(f"🔑 Gespeicherte Session wiederverwendet (gültig bis {format_expiry(entry)})")
+            return entry['session'], session
     
     print(f"🔐 Direkte Anmeldung bei {base_url}...")
     
@@ -64,6 +77,12 @@ def direct_login(username, password, base_url="http://localhost:3000"):
             if session_response.status_code == 200:
                 session_data = session_response.json()
                 print(f"✅ Session abgerufen: {json.dumps(session_data, indent=2)}")
+                if session_store is not None and session_data:
+                    token = session_data.get('token') or session_data.get('accessToken')
+                    try:
+                        session_store.save(base_url, username, session, session_data, token)
+                    except OSError as e:
+                        print(f"⚠️  Session konnte nicht gespeichert werden: {e}")
                 return session_data, session
             else:
                 print(f"❌ Session konnte nicht abgerufen werden: {session_response.status_code}")
@@ -77,9 +96,10 @@ def direct_login(username, password, base_url="http://localhost:3000"):
         print(f"❌ Fehler beim direkten Login: {e}")
         return None, session
 
-def get_telemetry_with_session(device_id, session_data, session, base_url="http://localhost:3000"):
+def get_telemetry_with_session(device_id, session_data, session, base_url="http://localhost:3000", relogin=None):
     """
     Ruft Telemetriedaten mit der bestehenden Session ab
+    relogin: optionale Funktion für eine neue Anmeldung bei 401, liefert (session_data, session)
     """
     try:
         # Token aus der Session extrahieren
@@ -135,6 +155,12 @@ def get_telemetry_with_session(device_id, session_data, session, base_url="http:
             data = telemetry_response.json()
             print("✅ Telemetriedaten erfolgreich abgerufen!")
             return data
+        elif telemetry_response.status_code == 401 and relogin:
+            print("🔄 Session abgelaufen, melde neu an...")
+            session_data, session = relogin()
+            if not session_data:
+                return None
+            return get_telemetry_with_session(device_id, session_data, session, base_url)
         else:
             print(f"❌ Fehler beim Abrufen der Telemetriedaten: {telemetry_response.status_code}")
             print(f"Antwort: {telemetry_response.text}")
@@ -192,6 +218,11 @@ def format_data(data):
     return "\n".join(result)
 
 if __name__ == "__main__":
+    # Nur Diagnose-Optionen; alles andere wird abgefragt
+    parser = argparse.ArgumentParser(description="HEATMANAGER Direkter NextAuth-Client (interaktiv)")
+    tracing.add_arguments(parser)
+    tracing.start(parser.parse_args(), "direct_auth_client")
+    
     print("🚀 HEATMANAGER Direkter NextAuth-Client")
     print("=" * 50)
     
@@ -203,23 +234,35 @@ if __name__ == "__main__":
     
     print("\n" + "=" * 50)
     
-    # Direkter Login
-    session_data, session = direct_login(USERNAME, PASSWORD, BASE_URL)
+    # Direkter Login (gespeicherte Session wird wiederverwendet)
+    session_store = SessionStore()
+    with tracing.span("Anmeldung"):
+        session_data, session = direct_login(USERNAME, PASSWORD, BASE_URL, session_store)
+    
+    def relogin():
+        session_store.clear(BASE_URL, USERNAME)
+        return direct_login(USERNAME, PASSWORD, BASE_URL, session_store)
     
     if session_data:
         # Telemetriedaten abrufen
-        telemetry_data = get_telemetry_with_session(DEVICE_ID, session_data, session, BASE_URL)
+        with tracing.span("Abruf"):
+            telemetry_data = get_telemetry_with_session(DEVICE_ID, session_data, session, BASE_URL, relogin)
         
         if telemetry_data:
-            print("\n" + format_data(telemetry_data))
+            with tracing.span("Ausgabe"):
+                print("\n" + format_data(telemetry_data))
             
-            # Option: Rohe Daten speichern
-            save_raw = input("\nRohe JSON-Daten in Datei speichern? (j/n): ").strip().lower()
+            # Option: Rohe Daten speichern (eine Zeile pro Zeitstempel, siehe telemetry_export.py)
+            save_raw = input("\nRohe Daten in Datei speichern? (j/n): ").strip().lower()
             if save_raw in ['j', 'ja', 'y', 'yes']:
-                filename = f"telemetry_{DEVICE_ID}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(telemetry_data, f, indent=2, ensure_ascii=False)
-                print(f"✅ Daten gespeichert in: {filename}")
+                export_format = input(f"Format ({'/'.join(EXPORT_FORMATS)}, Standard: ndjson): ").strip().lower() or "ndjson"
+                filename = f"telemetry_{DEVICE_ID}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+                try:
+                    with open_exporter(filename, list(telemetry_data.keys()), export_format) as exporter:
+                        exporter.write(DEVICE_ID, telemetry_data)
+                    print(f"✅ Daten gespeichert in: {filename}")
+                except (RuntimeError, ValueError, OSError) as e:
+                    print(f"❌ Speichern fehlgeschlagen: {e}")
         else:
             print("❌ Konnte keine Telemetriedaten abrufen.")
     else:
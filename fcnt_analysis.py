@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Auswertung des LoRaWAN-Frame-Counters (fCnt) für viele Geräte
+Berechnet pro Device verlorene Uplinks, doppelte Frames, Zählerrücksetzungen (Rejoin/Neustart),
+Überläufe (16 oder 32 Bit) und Ausfallzeiten und setzt den Verlust in Beziehung zu RSSI, SNR und
+Spreading Factor.
+
+Die Werte einer Gruppe von Devices werden zu einem Array zusammengefügt und gemeinsam mit
+Differenzen, kumulierten Summen und np.bincount ausgewertet (keine Python-Schleife pro Frame).
+Verlust pro Segment (zwischen zwei Rücksetzungen) = Umfang des Zählerbereichs - Anzahl
+verschiedener Zählerstände, so dass Duplikate und vertauschte Frames nicht als Verlust zählen.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from telemetry_client import TelemetryClient, MANY_MAX_CONCURRENCY, RANGE_POINT_INTERVAL_MS, aiohttp
+from telemetry_arrays import response_to_columns
+from subtree_telemetry import needs_login, resolve_devices
+from session_store import SessionStore, DEFAULT_SESSION_FILE
+
+FCNT_KEY = 'fCnt'
+RADIO_KEYS = ('rssi', 'snr', 'sf')
+FCNT_ROLLOVER_WINDOW = 4096  # Sprung von (Zählerbreite - Fenster, Breite) nach [0, Fenster) = Überlauf
+FCNT_REORDER_WINDOW = 16  # kleine Rücksprünge sind vertauschte Frames, keine Rücksetzung
+FCNT_REORDER_MAX_MS = 30 * 1000  # ... sofern sie kurz nach dem Vorgänger eintreffen; später Rücksprung nahe 0 = Neustart
+OUTAGE_FACTOR = 3  # Ausfall: Abstand > Faktor x typischer Sendeabstand des Devices
+OUTAGE_MIN_MS = 60 * 60 * 1000
+OUTAGE_WINDOWS_PER_DEVICE = 5  # längste Ausfälle pro Device im JSON-Ergebnis
+ANALYZE_BATCH_DEVICES = 100  # Devices pro gemeinsamer Auswertung (begrenzt den Speicherbedarf)
+SEGMENT_SHIFT = 36  # Segment-ID << SEGMENT_SHIFT | Zählerstand als eindeutiger Schlüssel
+DEVICE_TS_SHIFT = 42  # Device-Index << DEVICE_TS_SHIFT | ts für ein gemeinsames searchsorted
+
+Columns = Tuple[np.ndarray, np.ndarray]
+
+def _valid(columns: Optional[Columns]) -> Columns:
+    if columns is None:
+        return np.empty(0, np.int64), np.empty(0, np.float64)
+    timestamps, values = columns
+    mask = ~np.isnan(values)
+    return timestamps[mask], values[mask]
+
+def _group_sum(groups: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    return np.bincount(groups, weights=weights, minlength=size)
+
+def _aligned_radio(device_index: np.ndarray, ts: np.ndarray, radio: List[Columns]) -> np.ndarray:
+    """Radio-Wert jedes Frames (gleicher Zeitstempel, sonst NaN) über ein gemeinsames searchsorted"""
+    counts = np.array([r[0].size for r in radio])
+    if not counts.sum() or not ts.size:
+        return np.full(ts.size, np.nan)
+    radio_ts = np.concatenate([r[0] for r in radio])
+    if radio_ts.size == ts.size and np.array_equal(np.bincount(device_index, minlength=len(radio)), counts) \
+            and np.array_equal(radio_ts, ts):
+        # Üblicher Fall: alle Keys eines Uplinks mit demselben Zeitstempel
+        return np.concatenate([r[1] for r in radio])
+    # Schlüssel Device << DEVICE_TS_SHIFT | (ts - Basis) ist über alle Devices aufsteigend sortiert
+    base = min(int(radio_ts.min()), int(ts.min()))
+    radio_keys = (np.repeat(np.arange(len(radio), dtype=np.int64), counts) << DEVICE_TS_SHIFT) + radio_ts - base
+    radio_values = np.concatenate([r[1] for r in radio])
+    frame_keys = (device_index.astype(np.int64) << DEVICE_TS_SHIFT) + ts - base
+    position = np.clip(np.searchsorted(radio_keys, frame_keys), 0, radio_keys.size - 1)
+    return np.where(radio_keys[position] == frame_keys, radio_values[position], np.nan)
+
+def analyze_batch(series: List[Dict[str, Columns]]) -> Tuple[List[Dict[str, Any]], Dict[str, np.ndarray]]:
+    """
+    Wertet fCnt (und RSSI/SNR/SF) einer Gruppe von Devices aus. series: pro Device
+    {key: (ts, Werte)} aufsteigend (z.B. response_to_columns oder TsKvReader.read_columns).
+    Liefert (Ergebnis pro Device, Summen pro SF für die Gesamtauswertung).
+    """
+    frames = [_valid(entry.get(FCNT_KEY)) for entry in series]
+    n = len(frames)
+    counts = np.array([ts.size for ts, _ in frames], dtype=np.int64)
+    device = np.repeat(np.arange(n), counts)
+    ts = np.concatenate([ts for ts, _ in frames]) if n else np.empty(0, np.int64)
+    fcnt = np.concatenate([values for _, values in frames]).astype(np.int64) if n else np.empty(0, np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if n else np.empty(0, np.int64)
+
+    # Zählerbreite pro Device: 32 Bit sobald ein Wert >= 2^16 vorkommt
+    device_max = np.zeros(n, np.int64)
+    np.maximum.at(device_max, device, fcnt)
+    width = np.where(device_max >= 1 << 16, 1 << 32, 1 << 16)
+
+    inner = device[1:] == device[:-1]
+    prev, cur = fcnt[:-1], fcnt[1:]
+    step_width = width[device[1:]]
+    delta = cur - prev
+    gap = np.diff(ts)
+    rollover = inner & (delta < 0) & (prev >= step_width - FCNT_ROLLOVER_WINDOW) & (cur < FCNT_ROLLOVER_WINDOW)
+    restart = (delta < 0) & (cur < FCNT_REORDER_WINDOW) & (gap > FCNT_REORDER_MAX_MS)
+    reset = inner & ((delta < -FCNT_REORDER_WINDOW) | restart) & ~rollover
+
+    # Überläufe aufsummieren (pro Device ab 0), Segmente an Device-Grenzen und Rücksetzungen
+    wrap = np.concatenate(([0], np.where(rollover, step_width, 0))).cumsum()[:fcnt.size]
+    unwrapped = fcnt + wrap - np.repeat(wrap[np.minimum(starts, max(wrap.size - 1, 0))], counts) if fcnt.size else fcnt
+    segment = np.concatenate(([0], (~inner | reset).astype(np.int64))).cumsum()[:fcnt.size]
+    segments = int(segment[-1]) + 1 if segment.size else 0
+
+    seg_min = np.full(segments, np.iinfo(np.int64).max)
+    seg_max = np.full(segments, np.iinfo(np.int64).min)
+    np.minimum.at(seg_min, segment, unwrapped)
+    np.maximum.at(seg_max, segment, unwrapped)
+    # Verschiedene Zählerstände pro Segment: Schlüssel sind fast sortiert, stabiles Sortieren
+    # (Timsort über vorsortierte Läufe) ist hier deutlich schneller als np.unique
+    frame_keys = (segment << SEGMENT_SHIFT) | (unwrapped - seg_min[segment])
+    order = np.argsort(frame_keys, kind='stable')
+    keys = frame_keys[order]
+    distinct = np.concatenate(([True], keys[1:] != keys[:-1]))[:keys.size]
+    seg_unique = np.bincount(keys[distinct] >> SEGMENT_SHIFT, minlength=segments)
+    seg_device = np.zeros(segments, np.int64)
+    seg_device[segment] = device
+    seg_expected = seg_max - seg_min + 1
+
+    unique = _group_sum(seg_device, seg_unique, n)
+    expected = _group_sum(seg_device, seg_expected, n)
+    lost = expected - unique
+    duplicates = counts - unique
+
+    # Ausfälle: Abstände über dem Faktor des typischen Sendeabstands (Zeitspanne / erwartete Frames)
+    span = np.zeros(n)
+    span[counts > 0] = ts[starts[counts > 0] + counts[counts > 0] - 1] - ts[starts[counts > 0]]
+    interval = span / np.maximum(expected - 1, 1)
+    outage = inner & (gap > np.maximum(OUTAGE_MIN_MS, OUTAGE_FACTOR * interval[device[1:]]))
+    outage_steps = np.flatnonzero(outage)  # aufsteigend, also nach Device gruppiert
+    outage_bounds = np.searchsorted(device[1:][outage_steps], np.arange(n + 1))
+
+    radio = {key: _aligned_radio(device, ts, [_valid(entry.get(key)) for entry in series]) for key in RADIO_KEYS}
+    step_delta = np.where(rollover, delta + step_width, delta)
+    forward = inner & ~reset & (step_delta > 0)
+
+    # Verlust pro Frame: nur Frames, die das laufende Maximum ihres Segments erhöhen, buchen erwartete
+    # und verlorene Frames; ein später eintreffender Frame aus einer Lücke (vertauscht) bucht die
+    # Lücke beim Frame zurück, der sie übersprungen hat. Summe pro Device = lost.
+    running_max = np.maximum.accumulate(frame_keys) if fcnt.size else frame_keys
+    segment_start = np.concatenate(([True], segment[1:] != segment[:-1]))[:fcnt.size]
+    previous_max = np.concatenate(([0], running_max[:-1]))[:fcnt.size]
+    advance = np.where(segment_start, frame_keys - (segment << SEGMENT_SHIFT) + 1,
+                       np.maximum(frame_keys - previous_max, 0))
+    first_seen = np.zeros(fcnt.size, bool)
+    first_seen[order[distinct]] = True
+    filled = first_seen & ~segment_start & (advance == 0)
+    skipped_by = np.searchsorted(running_max, frame_keys[filled], side='left')
+    frame_lost = np.maximum(advance - 1, 0) - np.bincount(skipped_by, minlength=fcnt.size)
+    if not np.array_equal(_group_sum(device, frame_lost, n), lost):
+        print("⚠️  fCnt: Verlust pro Frame weicht vom Verlust pro Device ab, Werte pro SF ungenau", file=sys.stderr)
+    after_loss = frame_lost > 0
+
+    # Verlust pro SF der Frames, bei denen er gebucht ist
+    sf = radio['sf']
+    sf_valid = ~np.isnan(sf) & (sf >= 0) & (sf <= 12)
+    sf_bins = sf[sf_valid].astype(np.int64)
+    sf_totals = {
+        'expected': np.bincount(sf_bins, weights=advance[sf_valid], minlength=13),
+        'lost': np.bincount(sf_bins, weights=frame_lost[sf_valid], minlength=13)
+    }
+
+    def device_mean(values: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        valid = ~np.isnan(values) if mask is None else ~np.isnan(values) & mask
+        total = _group_sum(device[valid], values[valid], n)
+        number = np.bincount(device[valid], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(number > 0, total / np.maximum(number, 1), np.nan)
+
+    means = {key: device_mean(values) for key, values in radio.items()}
+    rssi_after_loss = device_mean(radio['rssi'], after_loss)
+    resets = np.bincount(device[1:][reset], minlength=n)
+    rollovers = np.bincount(device[1:][rollover], minlength=n)
+
+    results = []
+    for index in range(n):
+        steps = outage_steps[outage_bounds[index]:outage_bounds[index + 1]]
+        windows = sorted(({'start': int(ts[step]), 'end': int(ts[step + 1]),
+                           'hours': round(float(gap[step]) / 3600000, 2),
+                           'missedFrames': int(max(step_delta[step] - 1, 0)) if forward[step] else None}
+                          for step in steps), key=lambda window: -window['hours'])
+        known = expected[index] > 0
+        results.append({
+            'frames': int(counts[index]),
+            'unique': int(unique[index]),
+            'expected': int(expected[index]),
+            'lost': int(lost[index]),
+            'lossRate': float(lost[index] / expected[index]) if known else None,
+            'duplicates': int(duplicates[index]),
+            'resets': int(resets[index]),
+            'rollovers': int(rollovers[index]),
+            'counterBits': 32 if width[index] == 1 << 32 else 16,
+            'firstTs': int(ts[starts[index]]) if counts[index] else None,
+            'lastTs': int(ts[starts[index] + counts[index] - 1]) if counts[index] else None,
+            'outages': len(windows),
+            'outageHours': round(sum(window['hours'] for window in windows), 2),
+            'longestOutageHours': windows[0]['hours'] if windows else 0,
+            'outageWindows': windows[:OUTAGE_WINDOWS_PER_DEVICE],
+            **{key: (None if np.isnan(means[key][index]) else round(float(means[key][index]), 2)) for key in RADIO_KEYS},
+            'rssiAfterLoss': None if np.isnan(rssi_after_loss[index]) else round(float(rssi_after_loss[index]), 2)
+        })
+    return results, sf_totals
+
+def fleet_summary(results: List[Dict[str, Any]], sf_totals: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Gesamtverlust, Verlust pro SF und Korrelation Verlustrate <-> mittlere Funkwerte über alle Devices"""
+    expected = sum(entry['expected'] for entry in results)
+    lost = sum(entry['lost'] for entry in results)
+    correlation = {}
+    for key in RADIO_KEYS:
+        pairs = np.array([(entry['lossRate'], entry[key]) for entry in results
+                          if entry['lossRate'] is not None and entry[key] is not None], dtype=np.float64)
+        if len(pairs) >= 3 and pairs[:, 0].std() > 0 and pairs[:, 1].std() > 0:
+            correlation[key] = round(float(np.corrcoef(pairs[:, 0], pairs[:, 1])[0, 1]), 3)
+        else:
+            correlation[key] = None
+    by_sf = {int(sf): {'expected': int(sf_totals['expected'][sf]), 'lost': int(sf_totals['lost'][sf]),
+                       'lossRate': float(sf_totals['lost'][sf] / sf_totals['expected'][sf])}
+             for sf in np.flatnonzero(sf_totals['expected'])}
+    return {'devices': len(results), 'expected': expected, 'lost': lost,
+            'lossRate': lost / expected if expected else None,
+            'duplicates': sum(entry['duplicates'] for entry in results),
+            'resets': sum(entry['resets'] for entry in results),
+            'rollovers': sum(entry['rollovers'] for entry in results),
+            'outages': sum(entry['outages'] for entry in results),
+            'bySf': by_sf, 'correlation': correlation}
+
+def format_fcnt_report(results: List[Dict[str, Any]], summary: Dict[str, Any], limit: Optional[int] = None) -> str:
+    """Gesamtübersicht, Verlust pro SF und Devices nach Verlustrate"""
+    def pct(value) -> str:
+        return '-' if value is None else f"{value * 100:.1f}%"
+
+    def fmt(value, digits=1) -> str:
+        return '-' if value is None else f"{value:.{digits}f}"
+
+    lines = [f"📶 {summary['devices']} Devices: {summary['lost']} von {summary['expected']} Uplinks verloren "
+             f"({pct(summary['lossRate'])}), {summary['duplicates']} Duplikate, {summary['resets']} Rücksetzungen, "
+             f"{summary['rollovers']} Überläufe, {summary['outages']} Ausfälle"]
+    if summary['bySf']:
+        lines.append("   Verlust pro SF: " + ', '.join(f"SF{sf} {pct(entry['lossRate'])}"
+                                                       for sf, entry in sorted(summary['bySf'].items())))
+    lines.append("   Korrelation Verlustrate ~ " + ', '.join(f"{key.upper()} {fmt(value, 2)}"
+                                                          for key, value in summary['correlation'].items()))
+    ranked = sorted(results, key=lambda entry: -(entry['lossRate'] or 0))
+    shown = ranked[:limit] if limit else ranked
+    lines.append("")
+    lines.append(f"{'Device':<36} {'Frames':>8} {'Verlust':>8} {'Rate':>7} {'Dup':>6} {'Reset':>5} {'Überl':>5} "
+                 f"{'Ausf':>5} {'max h':>7} {'RSSI':>6} {'SNR':>6} {'SF':>5} {'RSSI n.V.':>9}")
+    lines.append("-" * 130)
+    for entry in shown:
+        name = entry.get('label') or entry.get('name') or entry['deviceId']
+        lines.append(f"{name[:36]:<36} {entry['frames']:>8} {entry['lost']:>8} {pct(entry['lossRate']):>7} "
+                     f"{entry['duplicates']:>6} {entry['resets']:>5} {entry['rollovers']:>5} {entry['outages']:>5} "
+                     f"{entry['longestOutageHours']:>7.1f} {fmt(entry['rssi']):>6} {fmt(entry['snr']):>6} "
+                     f"{fmt(entry['sf']):>5} {fmt(entry['rssiAfterLoss']):>9}")
+    if limit and len(ranked) > limit:
+        lines.append(f"   ... und {len(ranked) - limit} weitere (--limit 0 für alle)")
+    return "\n".join(lines)
+
+def parse_time(value: str) -> int:
+    """ISO-Datum oder -Zeitpunkt als ms-Zeitstempel"""
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+def main():
+    parser = argparse.ArgumentParser(description="HEATMANAGER fCnt-Auswertung: Uplink-Verlust, Duplikate, Ausfälle")
+    parser.add_argument("--url", default="http://localhost:3000",
+                       help="Base URL der API (Standard: http://localhost:3000)")
+    parser.add_argument("--username", help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", help="Passwort für die Anmeldung")
+    parser.add_argument("--device-id", help="Device ID")
+    parser.add_argument("--device-ids", help="Komma-getrennte Liste von Device IDs")
+    parser.add_argument("--device-file", help="Datei mit einer Device ID pro Zeile")
+    parser.add_argument("--asset", help="Alle Devices unterhalb dieses Assets (ID oder Name, Standard: gesamter Tree)")
+    parser.add_argument("--customer-id", help="Tree direkt aus customer_settings laden (MSSQL, wie sync_structure.py)")
+    parser.add_argument("--tree-file", help="Tree aus JSON-Datei laden")
+    parser.add_argument("--hours", type=int, default=30 * 24, help="Zeitbereich bis jetzt in Stunden (Standard: 720)")
+    parser.add_argument("--start", help="Beginn (ISO, z.B. 2025-01-01), ersetzt --hours")
+    parser.add_argument("--end", help="Ende (ISO, Standard: jetzt)")
+    parser.add_argument("--pg", action="store_true",
+                       help="Direkt aus PostgreSQL (ts_kv) lesen, siehe telemetry_pg.py (benötigt psycopg2)")
+    parser.add_argument("--concurrency", type=int, default=MANY_MAX_CONCURRENCY,
+                       help=f"Gleichzeitig abgefragte Devices über die API (Standard: {MANY_MAX_CONCURRENCY})")
+    parser.add_argument("--point-interval", type=int, default=RANGE_POINT_INTERVAL_MS // 1000,
+                       help=f"Erwarteter Abstand zweier Werte in Sekunden (Standard: {RANGE_POINT_INTERVAL_MS // 1000})")
+    parser.add_argument("--limit", type=int, default=50, help="Anzahl ausgegebener Devices (0 = alle, Standard: 50)")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für die gespeicherte Session (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true", help="Immer neu anmelden")
+
+    args = parser.parse_args()
+    login = needs_login(args)
+    if login and not (args.username and args.password):
+        parser.error("--username und --password sind erforderlich (außer mit --pg und Devices aus Liste, Datei oder Datenbank)")
+
+    end_ts = parse_time(args.end) if args.end else int(time.time() * 1000)
+    start_ts = parse_time(args.start) if args.start else end_ts - args.hours * 3600 * 1000
+
+    client = None
+    if login:
+        client = TelemetryClient(args.url, session_store=None if args.no_session_cache else SessionStore(args.session_file))
+        if not client.login(args.username, args.password):
+            print("❌ Anmeldung fehlgeschlagen. Beende Programm.")
+            sys.exit(1)
+
+    devices = resolve_devices(args, client)
+
+    reader = None
+    if args.pg:
+        from telemetry_pg import TsKvReader
+        try:
+            reader = TsKvReader()
+        except Exception as e:
+            print(f"❌ Keine Verbindung zu PostgreSQL: {e}")
+            sys.exit(1)
+    elif aiohttp is None:
+        print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+        sys.exit(1)
+
+    keys = [FCNT_KEY, *RADIO_KEYS]
+    ids = list(devices)
+    print(f"📡 {len(ids)} Devices, {datetime.fromtimestamp(start_ts / 1000):%Y-%m-%d} bis "
+          f"{datetime.fromtimestamp(end_ts / 1000):%Y-%m-%d} ({'ts_kv' if reader else 'API'})...", file=sys.stderr)
+    results: List[Dict[str, Any]] = []
+    sf_totals = {'expected': np.zeros(13), 'lost': np.zeros(13)}
+    fetch_s = analyze_s = 0.0
+    try:
+        for offset in range(0, len(ids), ANALYZE_BATCH_DEVICES):
+            batch = ids[offset:offset + ANALYZE_BATCH_DEVICES]
+            started = time.perf_counter()
+            if reader is not None:
+                series = [reader.read_columns(device_id, keys, start_ts, end_ts) for device_id in batch]
+            else:
+                from subtree_telemetry import fetch_subtree_telemetry
+                telemetry = asyncio.run(fetch_subtree_telemetry(client, batch, keys, start_ts, end_ts,
+                                                                args.concurrency, args.point_interval * 1000))
+                series = [response_to_columns(telemetry[device_id] or {}) for device_id in batch]
+                del telemetry
+            fetched = time.perf_counter()
+            batch_results, batch_sf = analyze_batch(series)
+            analyze_s += time.perf_counter() - fetched
+            fetch_s += fetched - started
+            for device_id, entry in zip(batch, batch_results):
+                results.append({'deviceId': device_id, **devices[device_id], **entry})
+            for key in sf_totals:
+                sf_totals[key] += batch_sf[key]
+            print(f"   {min(offset + ANALYZE_BATCH_DEVICES, len(ids))}/{len(ids)} Devices ausgewertet", file=sys.stderr)
+    finally:
+        if reader is not None:
+            reader.close()
+
+    summary = fleet_summary(results, sf_totals)
+    print(f"⏱️  Abruf {fetch_s:.1f} s, Auswertung {analyze_s:.2f} s", file=sys.stderr)
+    if args.json:
+        print(json.dumps({'startTs': start_ts, 'endTs': end_ts, 'summary': summary, 'devices': results},
+                         indent=2, ensure_ascii=False))
+    else:
+        print(format_fcnt_report(results, summary, args.limit or None))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Zustandsprüfung aller Geräte eines Kunden anhand der letzten Werte
+Nimmt alle Devices aus dem gespeicherten Tree (optional unterhalb eines Assets), lädt nur deren
+letzte Werte (Batterie, RSSI, SNR, Spreading Factor, letzte Meldung) und gibt eine nach
+Schweregrad sortierte Liste auffälliger Geräte aus.
+
+Quellen:
+  sql        eine Abfrage über /api/config/devices-sql (ts_kv_latest aller Devices des Kunden)
+  telemetry  je Device eine Abfrage des letzten Werts, parallel über einen Connection-Pool
+  auto       sql, fehlende Devices (z.B. anderer Teilbaum) per telemetry nachladen
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from telemetry_client import TelemetryClient, aiohttp
+from telemetry_store import parse_value
+from session_store import SessionStore, DEFAULT_SESSION_FILE
+from subtree_telemetry import resolve_devices
+
+HEALTH_KEYS = ('batteryVoltage', 'rssi', 'snr', 'sf', 'signalQuality', 'fCnt')
+HEALTH_SOURCES = ('auto', 'sql', 'telemetry')
+HEALTH_CONCURRENCY = 32  # Abfragen des letzten Werts sind klein, daher mehr parallel als MANY_MAX_CONCURRENCY
+HEALTH_MAX_RETRIES = 2
+
+# Key -> (Richtung, Warnung, kritisch): 'low' = auffällig unterhalb, 'high' = oberhalb der Schwelle
+HEALTH_THRESHOLDS = {
+    'batteryVoltage': ('low', 3.0, 2.8),  # Li-SOCl2 3,6 V: ab ca. 3,0 V Tausch einplanen
+    'rssi': ('low', -115, -120),
+    'snr': ('low', -10, -15),  # Demodulationsgrenze SF12 ca. -20 dB
+    'sf': ('high', 10, 11)  # SF11 Warnung, SF12 kritisch
+}
+HEALTH_STALE_HOURS = (2, 24)  # letzte Meldung älter als (Warnung, kritisch); 24 h wie device_active
+
+SEVERITY_WARNING = 1
+SEVERITY_CRITICAL = 3  # eine kritische Meldung wiegt schwerer als zwei Warnungen
+
+UNITS = {'batteryVoltage': 'V', 'rssi': 'dBm', 'snr': 'dB', 'sf': ''}
+LABELS = {'batteryVoltage': 'Batterie', 'rssi': 'RSSI', 'snr': 'SNR', 'sf': 'SF'}
+
+def latest_from_telemetry(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Letzte Werte aus /api/thingsboard/devices/telemetry (ohne Zeitbereich)"""
+    latest: Dict[str, Any] = {'lastSeen': None}
+    for key, values in (data or {}).items():
+        if not values:
+            continue
+        point = max(values, key=lambda p: p['ts'])
+        latest[key] = point.get('value') if key == 'signalQuality' else parse_value(point.get('value'))
+        latest['lastSeen'] = max(latest['lastSeen'] or 0, point['ts'])
+    return latest
+
+def latest_from_sql(device: Dict[str, Any]) -> Dict[str, Any]:
+    """Letzte Werte aus einem Eintrag von /api/config/devices-sql"""
+    telemetry = device.get('telemetry') or {}
+    latest = {key: telemetry.get(key) for key in HEALTH_KEYS}
+    last_seen = parse_value(device.get('lastActivityTime'))
+    latest['lastSeen'] = int(last_seen) if last_seen else None
+    return latest
+
+def assess(latest: Dict[str, Any], now_ms: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """Bewertet die letzten Werte eines Devices; liefert (Punktzahl, Befunde)"""
+    issues = []
+    for key, (direction, warning, critical) in HEALTH_THRESHOLDS.items():
+        value = latest.get(key)
+        if value is None:
+            continue
+        beyond = (lambda limit: value < limit) if direction == 'low' else (lambda limit: value > limit)
+        if beyond(critical):
+            issues.append({'key': key, 'value': value, 'severity': SEVERITY_CRITICAL})
+        elif beyond(warning):
+            issues.append({'key': key, 'value': value, 'severity': SEVERITY_WARNING})
+    last_seen = latest.get('lastSeen')
+    age_h = (now_ms - last_seen) / 3600000 if last_seen else None
+    if age_h is None:
+        issues.append({'key': 'lastSeen', 'value': None, 'severity': SEVERITY_CRITICAL})
+    elif age_h > HEALTH_STALE_HOURS[1]:
+        issues.append({'key': 'lastSeen', 'value': round(age_h, 1), 'severity': SEVERITY_CRITICAL})
+    elif age_h > HEALTH_STALE_HOURS[0]:
+        issues.append({'key': 'lastSeen', 'value': round(age_h, 1), 'severity': SEVERITY_WARNING})
+    return sum(issue['severity'] for issue in issues), issues
+
+def rank_devices(devices: Dict[str, Dict[str, Any]], latest: Dict[str, Dict[str, Any]],
+                 now_ms: int, include_healthy: bool = False) -> List[Dict[str, Any]]:
+    """Devices nach Punktzahl, bei Gleichstand nach ältester Meldung und niedrigster Batterie"""
+    result = []
+    for device_id, info in devices.items():
+        values = latest.get(device_id) or {'lastSeen': None}
+        score, issues = assess(values, now_ms)
+        if score or include_healthy:
+            result.append({'deviceId': device_id, **info, 'score': score, 'issues': issues,
+                           **{key: values.get(key) for key in HEALTH_KEYS}, 'lastSeen': values.get('lastSeen')})
+    battery = lambda entry: entry['batteryVoltage'] if entry['batteryVoltage'] is not None else float('inf')
+    result.sort(key=lambda entry: (-entry['score'], entry['lastSeen'] or 0, battery(entry)))
+    return result
+
+def format_issue(issue: Dict[str, Any]) -> str:
+    marker = '‼️' if issue['severity'] == SEVERITY_CRITICAL else '⚠️'
+    if issue['key'] == 'lastSeen':
+        return f"{marker} nie gemeldet" if issue['value'] is None else f"{marker} still seit {issue['value']:g} h"
+    return f"{marker} {LABELS[issue['key']]} {issue['value']:g}{UNITS[issue['key']]}"
+
+def format_health_report(ranked: List[Dict[str, Any]], total: int, limit: Optional[int] = None) -> str:
+    """Zusammenfassung pro Befund und Tabelle der auffälligsten Devices"""
+    counts: Dict[str, List[int]] = {}
+    for entry in ranked:
+        for issue in entry['issues']:
+            counts.setdefault(issue['key'], [0, 0])[issue['severity'] == SEVERITY_CRITICAL] += 1
+    flagged = sum(1 for entry in ranked if entry['score'])
+    lines = [f"🩺 {flagged} von {total} Devices auffällig"]
+    for key in list(HEALTH_THRESHOLDS) + ['lastSeen']:
+        if key in counts:
+            warnings, critical = counts[key]
+            lines.append(f"   {LABELS.get(key, 'Letzte Meldung'):<15} {critical:>6} kritisch {warnings:>6} Warnung")
+
+    def fmt(value, digits=1) -> str:
+        return '-' if value is None else f"{value:.{digits}f}"
+
+    shown = ranked[:limit] if limit else ranked
+    if shown:
+        lines.append("")
+        lines.append(f"{'#':>4} {'Device':<24} {'Raum':<40} {'Batt':>5} {'RSSI':>5} {'SNR':>6} {'SF':>3} "
+                     f"{'zuletzt':<16} Befunde")
+        lines.append("-" * 130)
+    for rank, entry in enumerate(shown, 1):
+        last_seen = (datetime.fromtimestamp(entry['lastSeen'] / 1000).strftime('%Y-%m-%d %H:%M')
+                     if entry['lastSeen'] else '-')
+        name = entry['label'] or entry['name'] or entry['deviceId']
+        lines.append(f"{rank:>4} {name[:24]:<24} {entry['room'][-40:]:<40} {fmt(entry['batteryVoltage'], 2):>5} "
+                     f"{fmt(entry['rssi'], 0):>5} {fmt(entry['snr']):>6} {fmt(entry['sf'], 0):>3} {last_seen:<16} "
+                     + ', '.join(format_issue(issue) for issue in entry['issues']))
+    if limit and len(ranked) > limit:
+        lines.append(f"   ... und {len(ranked) - limit} weitere (--limit 0 für alle)")
+    return "\n".join(lines)
+
+def fetch_latest_sql(client: TelemetryClient) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Letzte Werte aller Devices des angemeldeten Kunden in einer Abfrage"""
+    response = client.session.get(f"{client.base_url}/api/config/devices-sql",
+                                  headers={"Authorization": f"Bearer {client.auth_token}"})
+    if response.status_code == 401 and client.relogin():
+        response = client.session.get(f"{client.base_url}/api/config/devices-sql",
+                                      headers={"Authorization": f"Bearer {client.auth_token}"})
+    if response.status_code != 200:
+        print(f"⚠️  /api/config/devices-sql nicht verfügbar: {response.status_code}", file=sys.stderr)
+        return None
+    return {device['id']: latest_from_sql(device) for device in response.json() if device.get('id')}
+
+async def fetch_latest_telemetry(client: TelemetryClient, device_ids: List[str],
+                                 concurrency: int = HEALTH_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+    """Letzter Wert je Device (ohne Zeitbereich), parallel; fehlgeschlagene Devices fehlen im Ergebnis"""
+    latest: Dict[str, Dict[str, Any]] = {}
+    done = 0
+    step = max(1, len(device_ids) // 10)
+    async for device_id, data in client.get_telemetry_many(device_ids, ','.join(HEALTH_KEYS),
+                                                           concurrency=concurrency, max_retries=HEALTH_MAX_RETRIES):
+        done += 1
+        if data is not None:
+            latest[device_id] = latest_from_telemetry(data)
+        if done % step == 0:
+            print(f"   {done}/{len(device_ids)} Devices abgerufen", file=sys.stderr)
+    return latest
+
+def main():
+    parser = argparse.ArgumentParser(description="HEATMANAGER Zustandsprüfung aller Geräte (Batterie, Funk, letzte Meldung)")
+    parser.add_argument("--url", default="http://localhost:3000",
+                       help="Base URL der API (Standard: http://localhost:3000)")
+    parser.add_argument("--username", required=True, help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", required=True, help="Passwort für die Anmeldung")
+    parser.add_argument("--asset", help="ID oder Name des Assets (Standard: gesamter Tree)")
+    parser.add_argument("--customer-id", help="Tree direkt aus customer_settings laden (MSSQL, wie sync_structure.py)")
+    parser.add_argument("--tree-file", help="Tree aus JSON-Datei laden")
+    parser.add_argument("--source", choices=HEALTH_SOURCES, default='auto',
+                       help="Quelle der letzten Werte (Standard: auto)")
+    parser.add_argument("--concurrency", type=int, default=HEALTH_CONCURRENCY,
+                       help=f"Gleichzeitige Abfragen bei --source telemetry (Standard: {HEALTH_CONCURRENCY})")
+    parser.add_argument("--limit", type=int, default=50, help="Anzahl ausgegebener Devices (0 = alle, Standard: 50)")
+    parser.add_argument("--all", action="store_true", help="Auch unauffällige Devices ausgeben")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für die gespeicherte Session (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true", help="Immer neu anmelden")
+
+    args = parser.parse_args()
+
+    client = TelemetryClient(args.url, session_store=None if args.no_session_cache else SessionStore(args.session_file))
+    if not client.login(args.username, args.password):
+        print("❌ Anmeldung fehlgeschlagen. Beende Programm.")
+        sys.exit(1)
+
+    devices = resolve_devices(args, client)
+
+    print(f"📡 Prüfe {len(devices)} Devices (Quelle: {args.source})...", file=sys.stderr)
+    started = time.perf_counter()
+    latest: Dict[str, Dict[str, Any]] = {}
+    if args.source in ('auto', 'sql'):
+        latest = {device_id: values for device_id, values in (fetch_latest_sql(client) or {}).items()
+                  if device_id in devices}
+        print(f"   {len(latest)} Devices aus devices-sql", file=sys.stderr)
+    missing = [device_id for device_id in devices if device_id not in latest]
+    if missing and args.source in ('auto', 'telemetry'):
+        if aiohttp is None:
+            print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+            sys.exit(1)
+        latest.update(asyncio.run(fetch_latest_telemetry(client, missing, args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    now_ms = int(time.time() * 1000)
+    ranked = rank_devices(devices, latest, now_ms, include_healthy=args.all)
+    print(f"⏱️  {len(latest)} von {len(devices)} Devices in {elapsed:.1f} s abgerufen", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps({'checkedAt': now_ms, 'devices': len(devices), 'thresholds': HEALTH_THRESHOLDS,
+                          'staleHours': HEALTH_STALE_HOURS, 'ranked': ranked}, indent=2, ensure_ascii=False))
+    else:
+        print(format_health_report(ranked, len(devices), args.limit or None))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Lasttest für die Telemetrie- und Tree-APIs der HEATMANAGER Web-App
+Simuliert angemeldete Benutzer mit einer gewichteten Mischung aus
+/api/thingsboard/devices/telemetry, .../telemetry/aggregated, /api/treepath/<nodeId> und
+/api/treepath/tree und misst Durchsatz, Fehlerrate sowie p50/p95/p99 pro Endpunkt.
+
+Zwei Modi:
+- geschlossen (Standard): --users Benutzer senden nacheinander Anfragen mit Denkpause
+- offen (--rate): Anfragen kommen als Poisson-Prozess mit fester Rate, unabhängig von den
+  Antwortzeiten; die Latenz zählt ab dem geplanten Startzeitpunkt (inkl. Wartezeit)
+
+Mit --stand-in läuft der Test gegen einen lokalen Ersatzserver statt gegen die Web-App.
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import random
+import asyncio
+import argparse
+import subprocess
+import contextlib
+import requests
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+
+from telemetry_client import TelemetryClient, DEFAULT_KEYS
+from session_store import SessionStore, DEFAULT_SESSION_FILE
+from tree_snapshots import iter_tree
+
+ENDPOINTS = ('telemetry', 'aggregated', 'treepath', 'tree')
+DEFAULT_MIX = {'telemetry': 5, 'aggregated': 2, 'treepath': 2, 'tree': 1}
+
+DEFAULT_USERS = 10
+DEFAULT_DURATION_S = 60
+DEFAULT_THINK_TIME_S = 1.0
+DEFAULT_MAX_INFLIGHT = 200
+LOAD_REQUEST_TIMEOUT = 60
+AGGREGATED_MAX_DEVICES = 5
+AGGREGATED_ATTRIBUTE = 'sensorTemperature'
+PERCENTILES = (50, 95, 99)
+
+STAND_IN_DEVICES = 400
+STAND_IN_LATENCY_MS = 40
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    """'telemetry=5,tree=1' -> Gewichte pro Endpunkt (nicht genannte Endpunkte: 0)"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unbekannter Endpunkt im Mix: {name} (erlaubt: {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("Mix enthält keinen Endpunkt mit Gewicht > 0")
+    return mix
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Perzentil nach Nearest-Rank auf einer sortierten Liste"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+        self.last_finished = 0.0
+
+    def record(self, latency: float, status: str, ok: bool, finished: float):
+        self.latencies.append(latency)
+        self.last_finished = max(self.last_finished, finished)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        result = {
+            'requests': count,
+            'errors': self.errors,
+            'errorRate': self.errors / count if count else 0.0,
+            'throughput': count / elapsed if elapsed > 0 else 0.0,
+            'maxMs': latencies[-1] * 1000 if latencies else None,
+            'statuses': self.statuses
+        }
+        for p in PERCENTILES:
+            value = percentile(latencies, p)
+            result[f"p{p}Ms"] = value * 1000 if value is not None else None
+        return result
+
+class LoadTarget:
+    """Device- und Knoten-IDs aus dem Tree des Kunden, aus denen die Anfragen gebaut werden"""
+
+    def __init__(self, device_ids: List[str], node_ids: List[str], hours: int):
+        self.device_ids = device_ids
+        self.node_ids = node_ids
+        self.hours = hours
+
+    @classmethod
+    def from_tree(cls, tree: List[Dict], hours: int) -> "LoadTarget":
+        device_ids, node_ids = [], []
+        for node, _ in iter_tree(tree):
+            node_ids.append(node['id'])
+            device_ids.extend(device['id'] for device in node.get('relatedDevices', []) if device.get('id'))
+        return cls(list(dict.fromkeys(device_ids)), node_ids, hours)
+
+    def available(self, mix: Dict[str, float]) -> Dict[str, float]:
+        """Endpunkte ohne passende IDs aus dem Mix entfernen"""
+        needs = {'telemetry': self.device_ids, 'aggregated': self.device_ids, 'treepath': self.node_ids}
+        return {name: weight for name, weight in mix.items() if weight > 0 and needs.get(name, True)}
+
+    def build_request(self, endpoint: str, rng: random.Random) -> Tuple[str, Dict[str, str]]:
+        """Pfad und Query-Parameter für eine Anfrage an den Endpunkt"""
+        end_ts = int(time.time() * 1000)
+        if endpoint == 'telemetry':
+            return "/api/thingsboard/devices/telemetry", {
+                "deviceId": rng.choice(self.device_ids), "keys": DEFAULT_KEYS,
+                "startTs": str(end_ts - self.hours * 3600 * 1000), "endTs": str(end_ts)
+            }
+        if endpoint == 'aggregated':
+            count = min(len(self.device_ids), rng.randint(1, AGGREGATED_MAX_DEVICES))
+            return "/api/thingsboard/devices/telemetry/aggregated", {
+                "deviceIds": ','.join(rng.sample(self.device_ids, count)), "attribute": AGGREGATED_ATTRIBUTE,
+                "startTs": str(end_ts - 7 * 24 * 3600 * 1000), "endTs": str(end_ts), "interval": "3600000"
+            }
+        if endpoint == 'treepath':
+            return f"/api/treepath/{rng.choice(self.node_ids)}", {}
+        return "/api/treepath/tree", {}
+
+class LoadTest:
+    def __init__(self, base_url: str, sessions: List[Tuple[Dict[str, str], str]], target: LoadTarget,
+                 mix: Dict[str, float], warmup_s: float = 0.0, seed: Optional[int] = None):
+        self.base_url = base_url.rstrip('/')
+        self.accounts = sessions
+        self.target = target
+        self.endpoints = list(mix)
+        self.weights = [mix[name] for name in self.endpoints]
+        self.warmup_s = warmup_s
+        self.rng = random.Random(seed)
+        self.stats = {name: EndpointStats() for name in self.endpoints}
+        self.measure_from = 0.0
+        self.measure_until = 0.0
+
+    def _http_sessions(self, count: int, connector: "aiohttp.TCPConnector") -> List["aiohttp.ClientSession"]:
+        """Eine Session pro virtuellem Benutzer, Konten reihum verteilt"""
+        timeout = aiohttp.ClientTimeout(total=LOAD_REQUEST_TIMEOUT)
+        return [aiohttp.ClientSession(connector=connector, connector_owner=False, timeout=timeout,
+                                      cookies=self.accounts[i % len(self.accounts)][0])
+                for i in range(count)]
+
+    async def _request(self, http: "aiohttp.ClientSession", token: str, started: float):
+        """Eine Anfrage; started ist der (geplante) Startzeitpunkt für die Latenz"""
+        endpoint = self.rng.choices(self.endpoints, self.weights)[0]
+        path, params = self.target.build_request(endpoint, self.rng)
+        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        try:
+            async with http.get(f"{self.base_url}{path}", params=params, headers=headers) as response:
+                await response.read()
+                status, ok = str(response.status), 200 <= response.status < 300
+        except asyncio.TimeoutError:
+            status, ok = 'timeout', False
+        except aiohttp.ClientError as e:
+            status, ok = type(e).__name__, False
+        finished = time.perf_counter()
+        # Alle im Messfenster gestarteten Anfragen werten, auch wenn sie erst danach fertig werden,
+        # sonst fallen gerade die langsamsten Anfragen am Testende aus den Perzentilen
+        if self.measure_from <= started < self.measure_until:
+            self.stats[endpoint].record(finished - started, status, ok, finished)
+
+    async def run_closed(self, users: int, duration_s: float, think_time_s: float):
+        """Jeder Benutzer: Anfrage, auf Antwort warten, exponentiell verteilte Denkpause"""
+        connector = aiohttp.TCPConnector(limit=0)
+        sessions = self._http_sessions(users, connector)
+        start = time.perf_counter()
+        self.measure_from, self.measure_until = start + self.warmup_s, start + self.warmup_s + duration_s
+
+        async def user(index: int):
+            http, token = sessions[index], self.accounts[index % len(self.accounts)][1]
+            # Start der Benutzer über die erste Denkpause verteilen
+            await asyncio.sleep(self.rng.uniform(0, think_time_s))
+            while time.perf_counter() < self.measure_until:
+                await self._request(http, token, time.perf_counter())
+                if think_time_s > 0:
+                    await asyncio.sleep(self.rng.expovariate(1 / think_time_s))
+
+        try:
+            await asyncio.gather(*(user(i) for i in range(users)))
+        finally:
+            for http in sessions:
+                await http.close()
+            await connector.close()
+
+    async def run_open(self, rate: float, duration_s: float, max_inflight: int):
+        """Poisson-Ankünfte mit fester Rate; höchstens max_inflight gleichzeitige Verbindungen"""
+        connector = aiohttp.TCPConnector(limit=max_inflight)
+        sessions = self._http_sessions(len(self.accounts), connector)
+        start = time.perf_counter()
+        self.measure_from, self.measure_until = start + self.warmup_s, start + self.warmup_s + duration_s
+        tasks = set()
+        scheduled = start
+        index = 0
+        try:
+            while True:
+                scheduled += self.rng.expovariate(rate)
+                if scheduled >= self.measure_until:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.ensure_future(self._request(sessions[index % len(sessions)],
+                                                           self.accounts[index % len(self.accounts)][1], scheduled))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            # Offene Anfragen abwarten (begrenzt durch LOAD_REQUEST_TIMEOUT pro Anfrage)
+            if tasks:
+                print(f"⏳ Warte auf {len(tasks)} offene Anfragen...", file=sys.stderr)
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for http in sessions:
+                await http.close()
+            await connector.close()
+
+    def report(self, duration_s: float) -> Dict[str, Any]:
+        """
+        Kennzahlen pro Endpunkt; der Durchsatz bezieht sich auf die Zeit bis zur letzten Antwort,
+        damit ein überlasteter Server nicht die angebotene Rate als Durchsatz ausweist
+        """
+        total = EndpointStats()
+        for stats in self.stats.values():
+            total.latencies.extend(stats.latencies)
+            total.errors += stats.errors
+            total.last_finished = max(total.last_finished, stats.last_finished)
+            for status, count in stats.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+        elapsed = max(duration_s, total.last_finished - self.measure_from)
+        endpoints = {name: stats.summary(elapsed) for name, stats in self.stats.items()}
+        endpoints['total'] = total.summary(elapsed)
+        return endpoints
+
+def format_report(report: Dict[str, Any], duration_s: float) -> str:
+    def ms(value) -> str:
+        return f"{value:.1f}" if value is not None else "-"
+
+    result = [f"📊 LASTTEST ({duration_s:.0f} s Messdauer)", "=" * 95,
+              f"{'Endpunkt':<12} {'Anfragen':>9} {'Fehler':>7} {'Fehler%':>8} {'req/s':>8} "
+              f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for name, summary in report.items():
+        if name == 'total':
+            result.append("-" * 95)
+        result.append(f"{name:<12} {summary['requests']:>9} {summary['errors']:>7} {summary['errorRate'] * 100:>7.1f}% "
+                      f"{summary['throughput']:>8.1f} {ms(summary['p50Ms']):>9} {ms(summary['p95Ms']):>9} "
+                      f"{ms(summary['p99Ms']):>9} {ms(summary['maxMs']):>9}")
+    failures = {status: count for status, count in report['total']['statuses'].items() if not status.startswith('2')}
+    if failures:
+        result.append(f"\n❌ Fehler nach Status: {', '.join(f'{s}: {c}' for s, c in sorted(failures.items()))}")
+    return "\n".join(result)
+
+def login_accounts(base_url: str, credentials: List[Tuple[str, str]],
+                   session_store: Optional[SessionStore]) -> List[Tuple[TelemetryClient, Dict[str, str], str]]:
+    """Meldet jedes Konto einmal an (gespeicherte Sessions werden wiederverwendet)"""
+    accounts = []
+    for username, password in credentials:
+        client = TelemetryClient(base_url, session_store=session_store)
+        if not client.login(username, password):
+            print(f"❌ Anmeldung für {username} fehlgeschlagen.")
+            continue
+        accounts.append((client, client.session.cookies.get_dict(), client.auth_token))
+    return accounts
+
+def load_credentials(args) -> List[Tuple[str, str]]:
+    """--username/--password und/oder --users-file (eine Zeile 'benutzer:passwort' pro Konto)"""
+    credentials = []
+    if args.username and args.password:
+        credentials.append((args.username, args.password))
+    if args.users_file:
+        with open(args.users_file, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and ':' in line:
+                    username, _, password = line.partition(':')
+                    credentials.append((username, password))
+    return credentials
+
+def fetch_target(client: TelemetryClient, hours: int) -> Optional[LoadTarget]:
+    """Lädt den Tree über /api/treepath/tree, um realistische Device- und Knoten-IDs zu verwenden"""
+    response = client.session.get(f"{client.base_url}/api/treepath/tree",
+                                  headers={"Authorization": f"Bearer {client.auth_token}"})
+    if response.status_code != 200:
+        print(f"❌ Tree konnte nicht geladen werden: {response.status_code}")
+        return None
+    return LoadTarget.from_tree(response.json().get('data', {}).get('tree', []), hours)
+
+# --- Ersatzserver (--stand-in) ---------------------------------------------------------------
+
+def stand_in_tree(devices: int, rng: random.Random) -> List[Dict]:
+    """Synthetischer Tree: Gebäude > Etagen > Räume mit je 1-3 Thermostaten"""
+    tree, count = [], 0
+    building = 0
+    while count < devices:
+        floors = []
+        for floor in range(4):
+            rooms = []
+            for room in range(8):
+                related = [{'id': f"dev-{count + i:05d}", 'name': f"Thermostat {count + i}", 'type': 'vicki'}
+                           for i in range(rng.randint(1, 3))]
+                count += len(related)
+                rooms.append({'id': f"00000000-0000-4000-8000-{building:04d}{floor:02d}{room:06d}", 'name': f"Raum {room}",
+                              'type': 'Room', 'hasDevices': True, 'relatedDevices': related, 'children': []})
+            floors.append({'id': f"00000000-0000-4000-8000-{building:04d}{floor:02d}999999", 'name': f"Etage {floor}",
+                           'type': 'Floor', 'children': rooms})
+        tree.append({'id': f"00000000-0000-4000-8000-{building:04d}99999999", 'name': f"Gebäude {building}",
+                     'type': 'Building', 'children': floors})
+        building += 1
+    return tree
+
+def run_stand_in(port: int, latency_ms: float):
+    """
+    Ersatz für die Web-App mit denselben Endpunkten: Telemetrie-Aufrufe warten eine
+    lognormal verteilte ThingsBoard-Latenz ab, Tree-Aufrufe serialisieren den kompletten Tree
+    (CPU-gebunden wie in der Web-App, ein Prozess wie bei pm2 instances: '1').
+    """
+    rng = random.Random(1)
+    tree = stand_in_tree(STAND_IN_DEVICES, rng)
+    nodes = {node['id']: node for node, _ in iter_tree(tree)}
+
+    async def upstream():
+        await asyncio.sleep(latency_ms / 1000 * rng.lognormvariate(0, 0.5))
+
+    def authorized(request) -> bool:
+        return request.cookies.get('next-auth.session-token') == 'stand-in'
+
+    async def signin(request):
+        response = web.json_response({'url': '/dashboard'})
+        response.set_cookie('next-auth.session-token', 'stand-in', path='/', max_age=8 * 3600)
+        return response
+
+    async def session(request):
+        if not authorized(request):
+            return web.json_response({})
+        return web.json_response({'user': {'name': 'stand-in'}, 'accessToken': 'stand-in'})
+
+    async def telemetry(request):
+        if not authorized(request):
+            return web.json_response({'error': 'Unauthorized'}, status=401)
+        await upstream()
+        end_ts = int(request.query.get('endTs', time.time() * 1000))
+        points = [{'ts': end_ts - i * 600000, 'value': f"{20 + rng.random():.2f}"} for i in range(100)]
+        return web.json_response({key: points for key in request.query['keys'].split(',')})
+
+    async def aggregated(request):
+        if not authorized(request):
+            return web.json_response({'error': 'Not authenticated'}, status=401)
+        device_ids = request.query['deviceIds'].split(',')
+        for _ in device_ids:  # Die Web-App fragt die Geräte nacheinander ab
+            await upstream()
+        return web.json_response({'success': True, 'data': [{'deviceId': d, 'values': []} for d in device_ids]})
+
+    async def treepath(request):
+        node = nodes.get(request.match_info['node_id'])
+        if node is None:
+            return web.json_response({'error': 'Node not found'}, status=404)
+        return web.json_response({'success': True, 'data': {'node': node}})
+
+    async def full_tree(request):
+        if not authorized(request):
+            return web.json_response({'success': False}, status=401)
+        return web.Response(text=json.dumps({'success': True, 'data': {'tree': tree}}), content_type='application/json')
+
+    app = web.Application()
+    app.router.add_post('/api/auth/signin', signin)
+    app.router.add_get('/api/auth/session', session)
+    app.router.add_get('/api/thingsboard/devices/telemetry', telemetry)
+    app.router.add_get('/api/thingsboard/devices/telemetry/aggregated', aggregated)
+    app.router.add_get('/api/treepath/tree', full_tree)
+    app.router.add_get('/api/treepath/{node_id}', treepath)
+    web.run_app(app, host='127.0.0.1', port=port, print=None)
+
+def start_stand_in(port: int, latency_ms: float) -> subprocess.Popen:
+    """Startet den Ersatzserver als eigenen Prozess und wartet, bis er antwortet"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve-stand-in', str(port),
+                                '--stand-in-latency', str(latency_ms)])
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/api/auth/session", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Ersatzserver ist nicht gestartet")
+
+def main():
+    parser = argparse.ArgumentParser(description="HEATMANAGER Lasttest für Telemetrie- und Tree-APIs")
+    parser.add_argument("--url", default="http://localhost:3000",
+                       help="Base URL der Web-App (Standard: http://localhost:3000)")
+    parser.add_argument("--username", help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", help="Passwort für die Anmeldung")
+    parser.add_argument("--users-file", help="Datei mit 'benutzer:passwort' pro Zeile (mehrere Konten)")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS,
+                       help=f"Gleichzeitige Benutzer im geschlossenen Modus (Standard: {DEFAULT_USERS})")
+    parser.add_argument("--think-time", type=float, default=DEFAULT_THINK_TIME_S,
+                       help=f"Mittlere Denkpause zwischen zwei Anfragen in Sekunden (Standard: {DEFAULT_THINK_TIME_S})")
+    parser.add_argument("--rate", type=float,
+                       help="Offener Modus: Anfragen pro Sekunde (Poisson-Ankünfte) statt --users")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_MAX_INFLIGHT,
+                       help=f"Offener Modus: maximale gleichzeitige Verbindungen (Standard: {DEFAULT_MAX_INFLIGHT})")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_S,
+                       help=f"Messdauer in Sekunden (Standard: {DEFAULT_DURATION_S})")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Nicht gewertete Anlaufzeit in Sekunden (Standard: 5)")
+    parser.add_argument("--mix", help=f"Gewichte pro Endpunkt, z.B. telemetry=5,aggregated=2,treepath=2,tree=1 "
+                                      f"(Endpunkte: {', '.join(ENDPOINTS)})")
+    parser.add_argument("--hours", type=int, default=24, help="Zeitbereich der Telemetrie-Anfragen (Standard: 24)")
+    parser.add_argument("--seed", type=int, help="Startwert für reproduzierbare Anfragefolgen")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für gespeicherte Sessions (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true", help="Immer neu anmelden")
+    parser.add_argument("--stand-in", action="store_true",
+                       help="Lokalen Ersatzserver starten und gegen diesen testen (ohne Web-App)")
+    parser.add_argument("--stand-in-port", type=int, default=8799, help="Port des Ersatzservers (Standard: 8799)")
+    parser.add_argument("--stand-in-latency", type=float, default=STAND_IN_LATENCY_MS,
+                       help=f"Median der simulierten ThingsBoard-Latenz in ms (Standard: {STAND_IN_LATENCY_MS})")
+    parser.add_argument("--serve-stand-in", type=int, metavar="PORT", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if aiohttp is None:
+        print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+        sys.exit(1)
+
+    if args.serve_stand_in:
+        run_stand_in(args.serve_stand_in, args.stand_in_latency)
+        return
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    stand_in = None
+    if args.stand_in:
+        stand_in = start_stand_in(args.stand_in_port, args.stand_in_latency)
+        args.url = f"http://127.0.0.1:{args.stand_in_port}"
+        if not args.username:
+            args.username, args.password = 'stand-in', 'stand-in'
+
+    try:
+        credentials = load_credentials(args)
+        if not credentials:
+            parser.error("Zugangsdaten angeben (--username/--password oder --users-file)")
+
+        session_store = None if args.no_session_cache or args.stand_in else SessionStore(args.session_file)
+        # Statusausgaben der Anmeldung nach stderr, damit stdout nur das Ergebnis enthält (--json)
+        with contextlib.redirect_stdout(sys.stderr):
+            accounts = login_accounts(args.url, credentials, session_store)
+            target = fetch_target(accounts[0][0], args.hours) if accounts else None
+        if not accounts:
+            print("❌ Keine Anmeldung erfolgreich. Beende Programm.")
+            sys.exit(1)
+        if target is None:
+            sys.exit(1)
+        mix = target.available(mix)
+        if not mix:
+            print("❌ Keine Endpunkte testbar (Tree ohne Knoten oder Devices?)")
+            sys.exit(1)
+        print(f"🌳 {len(target.node_ids)} Knoten, {len(target.device_ids)} Devices; Mix: "
+              f"{', '.join(f'{name}={weight:g}' for name, weight in mix.items())}", file=sys.stderr)
+
+        load_test = LoadTest(args.url, [(cookies, token) for _, cookies, token in accounts], target, mix,
+                             warmup_s=args.warmup, seed=args.seed)
+        if args.rate:
+            print(f"🚀 Offener Modus: {args.rate:g} Anfragen/s für {args.duration:g} s "
+                  f"(+{args.warmup:g} s Warm-up)...", file=sys.stderr)
+            asyncio.run(load_test.run_open(args.rate, args.duration, args.max_inflight))
+        else:
+            print(f"🚀 Geschlossener Modus: {args.users} Benutzer, Denkpause {args.think_time:g} s, "
+                  f"{args.duration:g} s (+{args.warmup:g} s Warm-up)...", file=sys.stderr)
+            asyncio.run(load_test.run_closed(args.users, args.duration, args.think_time))
+
+        report = load_test.report(args.duration)
+        if args.json:
+            print(json.dumps({'url': args.url, 'mode': 'open' if args.rate else 'closed', 'rate': args.rate,
+                              'users': None if args.rate else args.users, 'duration': args.duration,
+                              'endpoints': report}, indent=2))
+        else:
+            print(format_report(report, args.duration))
+    finally:
+        if stand_in is not None:
+            stand_in.terminate()
+            stand_in.wait()
+
+if __name__ == "__main__":
+    main()
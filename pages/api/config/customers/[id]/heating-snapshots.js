@@ -0,0 +1,87 @@
+import { getServerSession } from 'next-auth/next';
+import { authOptions } from '../../../../../lib/authOptions';
+import sql from 'mssql';
+import { getConnection } from '../../../../../lib/db';
+import {
+  extractSubtreeRootedAtAssetId,
+  normAssetId
+} from '../../../../../lib/heating-control/treeUtils';
+
+function collectAssetIds(nodes, ids = new Set()) {
+  for (const node of nodes || []) {
+    if (node?.id != null) ids.add(normAssetId(node.id));
+    collectAssetIds(node?.children, ids);
+  }
+  return ids;
+}
+
+// Vorberechnete Raum-Snapshots aller Assets (asset_heating_snapshots, geschrieben von sync_structure.py --room-snapshots)
+export default async function handler(req, res) {
+  const session = await getServerSession(req, res, authOptions);
+  if (!session) {
+    return res.status(401).json({ message: 'Not authenticated' });
+  }
+
+  if (req.method !== 'GET') {
+    res.setHeader('Allow', ['GET']);
+    return res.status(405).json({ message: `Method ${req.method} Not Allowed` });
+  }
+
+  const { id } = req.query;
+  if (!id) {
+    return res.status(400).json({ message: 'Customer ID is required' });
+  }
+
+  try {
+    const pool = await getConnection();
+    const result = await pool.request()
+      .input('customer_id', sql.UniqueIdentifier, id)
+      .query(`
+        SELECT asset_id, snapshot, updated_at
+        FROM asset_heating_snapshots
+        WHERE customer_id = @customer_id
+      `);
+
+    let rows = result.recordset;
+
+    // Mandanten-Benutzer (Rolle 3): nur Assets unterhalb des Einstiegs-Assets (wie /tree)
+    const sessionCustomer = session.user?.customerid;
+    if (
+      Number(session.user?.role) === 3 &&
+      sessionCustomer &&
+      normAssetId(sessionCustomer) === normAssetId(id)
+    ) {
+      const userRow = await pool.request()
+        .input('userid', sql.Int, session.user.userid)
+        .query(`
+          SELECT default_entry_asset_id
+          FROM hm_users
+          WHERE userid = @userid
+        `);
+      const entry = userRow.recordset[0]?.default_entry_asset_id;
+      if (entry) {
+        const treeResult = await pool.request()
+          .input('customer_id', sql.UniqueIdentifier, id)
+          .query(`
+            SELECT tree
+            FROM customer_settings
+            WHERE customer_id = @customer_id
+          `);
+        const tree = JSON.parse(treeResult.recordset[0]?.tree || '[]');
+        const allowed = collectAssetIds(extractSubtreeRootedAtAssetId(Array.isArray(tree) ? tree : [], entry.toString()));
+        rows = rows.filter((row) => allowed.has(normAssetId(row.asset_id)));
+      }
+    }
+
+    return res.status(200).json(rows.map((row) => ({
+      ...JSON.parse(row.snapshot),
+      updated_at: row.updated_at
+    })));
+  } catch (error) {
+    console.error('Error:', error);
+    return res.status(500).json({
+      message: 'Error fetching heating snapshots',
+      error: error.message
+    });
+  }
+}
@@ -0,0 +1,65 @@
+import { getServerSession } from 'next-auth/next';
+import { authOptions } from '../../../../../lib/authOptions';
+import sql from 'mssql';
+import { getConnection } from '../../../../../lib/db';
+
+// Liefert die strukturellen Änderungen des Trees seit Version `since`
+// (aus customer_tree_history, geschrieben von sync_structure.py).
+export default async function handler(req, res) {
+  const session = await getServerSession(req, res, authOptions);
+  if (!session) {
+    return res.status(401).json({ message: 'Not authenticated' });
+  }
+
+  if (req.method !== 'GET') {
+    res.setHeader('Allow', ['GET']);
+    return res.status(405).json({ message: `Method ${req.method} Not Allowed` });
+  }
+
+  const { id, since } = req.query;
+  if (!id) {
+    return res.status(400).json({ message: 'Customer ID is required' });
+  }
+
+  const sinceVersion = Number.parseInt(since ?? '0', 10);
+  if (!Number.isInteger(sinceVersion) || sinceVersion < 0) {
+    return res.status(400).json({ message: 'since must be a non-negative integer' });
+  }
+
+  // Mandanten-Benutzer (Rolle 3) erhalten in /tree eine gekürzte Struktur; die Diffs beziehen sich auf den vollständigen Tree
+  if (Number(session.user?.role) === 3) {
+    return res.status(403).json({ message: 'Tree changes are not available for this role, use /tree' });
+  }
+
+  try {
+    const pool = await getConnection();
+    const result = await pool.request()
+      .input('customer_id', sql.UniqueIdentifier, id)
+      .input('since', sql.Int, sinceVersion)
+      .query(`
+        SELECT version, diff, created_at
+        FROM customer_tree_history
+        WHERE customer_id = @customer_id AND version > @since
+        ORDER BY version
+      `);
+
+    const changes = result.recordset.map((row) => ({
+      version: row.version,
+      createdAt: row.created_at,
+      diff: JSON.parse(row.diff)
+    }));
+
+    return res.status(200).json({
+      customerId: id,
+      sinceVersion,
+      currentVersion: changes.length > 0 ? changes[changes.length - 1].version : sinceVersion,
+      changes
+    });
+  } catch (error) {
+    console.error('Error:', error);
+    return res.status(500).json({
+      message: 'Error fetching tree changes',
+      error: error.message
+    });
+  }
+}
@@ -19,7 +19,7 @@ export default async function handler(req, res) {
     }
 
     // Get device ID and keys from query parameters
-    const { deviceId, keys, startTs, endTs } = req.query;
+    const { deviceId, keys, startTs, endTs, limit } = req.query;
     
     if (!deviceId) {
       return res.status(400).json({ error: 'Device ID is required' });
@@ -41,6 +41,11 @@ export default async function handler(req, res) {
     // Add time range parameters if provided
     if (startTs && endTs) {
       telemetryUrl += `&startTs=${startTs}&endTs=${endTs}`;
+      // Ohne limit liefert ThingsBoard höchstens 100 Werte pro Key
+      const parsedLimit = parseInt(limit, 10);
+      if (!Number.isNaN(parsedLimit) && parsedLimit > 0) {
+        telemetryUrl += `&limit=${parsedLimit}`;
+      }
     }
 
     // Fetch telemetry data from ThingsBoard
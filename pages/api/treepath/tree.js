@@ -81,13 +81,16 @@ export default async function handler(req, res) {
     }
     
     // Load the tree structure from customer_settings table for specific customer
-    const treeData = await loadTreeData(connection, customerId);
+    const { tree: treeData, treeState } = await loadTreeData(connection, customerId);
     
     // Gib den kompletten Tree mit allen Daten aus
     return res.status(200).json({
       success: true,
       data: {
         tree: treeData,
+        // 'partial' = Skeleton aus sync_structure.py --progressive (Devices/Attribute fehlen noch)
+        treeState,
+        partial: treeState === 'partial',
         totalNodes: countNodes(treeData),
         maxDepth: getMaxDepth(treeData)
       }
@@ -110,15 +113,21 @@ export default async function handler(req, res) {
  * Load tree data from customer_settings table for specific customer
  * @param {Object} connection - MSSQL connection
  * @param {string} customerId - Customer ID to filter by
- * @returns {Array} Tree structure data
+ * @returns {Object} { tree, treeState } - Tree structure data and tree_state ('partial', 'complete' or null)
  */
 async function loadTreeData(connection, customerId) {
   try {
+    // tree_state gibt es erst nach add_tree_state_column.sql
     const query = `
-      SELECT tree 
-      FROM customer_settings 
-      WHERE customer_id = @customerId 
-        AND tree IS NOT NULL
+      IF COL_LENGTH('customer_settings', 'tree_state') IS NOT NULL
+        EXEC sp_executesql N'SELECT tree, tree_state FROM customer_settings
+          WHERE customer_id = @customerId AND tree IS NOT NULL',
+          N'@customerId UNIQUEIDENTIFIER', @customerId = @customerId
+      ELSE
+        SELECT tree, NULL AS tree_state
+        FROM customer_settings 
+        WHERE customer_id = @customerId 
+          AND tree IS NOT NULL
     `;
     
     const result = await connection.request()
@@ -129,14 +138,13 @@ async function loadTreeData(connection, customerId) {
       throw new Error(`No tree data found for customer ID: ${customerId}`);
     }
     
-    const treeJson = result.recordset[0].tree;
+    const { tree: treeJson, tree_state: treeState } = result.recordset[0];
     
     // Parse JSON if it's stored as string
-    if (typeof treeJson === 'string') {
-      return JSON.parse(treeJson);
-    }
-    
-    return treeJson;
+    return {
+      tree: typeof treeJson === 'string' ? JSON.parse(treeJson) : treeJson,
+      treeState: treeState || null
+    };
     
   } catch (error) {
     console.error('Error loading tree data:', error);
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Vorberechnete Raum-Snapshots (aktuelle Temperatur, Sollwert, Ventil, Batterie) pro Asset
+Verdichtung wie lib/assetRoomDevicesSnapshot.js (buildAssetRoomDevicesSnapshot), aber auf
+Basis der letzten ThingsBoard-Telemetrie aller relatedDevices aus dem Tree.
+"""
+
+from typing import Dict, List, Any, Optional
+
+# ThingsBoard-Telemetrie-Key -> Feld im Snapshot (wie mapRowToTelemetry)
+TELEMETRY_FIELDS = {
+    'sensorTemperature': 'sensor_temperature',
+    'targetTemperature': 'target_temperature',
+    'PercentValveOpen': 'percent_valve_open',
+    'batteryVoltage': 'battery_voltage',
+    'relativeHumidity': 'relative_humidity'
+}
+
+# Betriebsarten mit externem Temperaturfühler
+EXTERNAL_SENSOR_MODES = (2, 10)
+
+def num_or_none(value: Any) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+def valid_temp(value: Optional[float]) -> bool:
+    return value is not None and -50 < value < 100
+
+def valid_valve(value: Optional[float]) -> bool:
+    return value is not None and 0 <= value <= 100
+
+def average(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+def operational_mode_of(node: Dict) -> int:
+    try:
+        return int(float(node.get('operationalMode') or 0))
+    except (TypeError, ValueError):
+        return 0
+
+def external_device_of(node: Dict) -> Optional[str]:
+    """extTempDevice des Knotens, nur relevant in den Betriebsarten 2 und 10"""
+    ext = node.get('extTempDevice')
+    if ext is None or str(ext).strip() == '' or operational_mode_of(node) not in EXTERNAL_SENSOR_MODES:
+        return None
+    return str(ext).strip()
+
+def snapshot_device_ids(node: Dict) -> List[str]:
+    """Alle Devices, deren Telemetrie für den Snapshot des Knotens benötigt wird"""
+    device_ids = [device['id'] for device in node.get('relatedDevices', []) if device.get('id')]
+    ext = external_device_of(node)
+    if ext and ext not in device_ids:
+        device_ids.append(ext)
+    return device_ids
+
+def iter_snapshot_nodes(tree: List[Dict]):
+    """Alle Assets mit Devices oder externem Fühler"""
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        if snapshot_device_ids(node):
+            yield node
+        stack.extend(node.get('children', []))
+
+def map_latest_telemetry(data: Optional[Dict]) -> Dict[str, Any]:
+    """Wandelt die Antwort von /values/timeseries in die Snapshot-Felder um"""
+    values = {field: None for field in TELEMETRY_FIELDS.values()}
+    values['ts'] = None
+    if not isinstance(data, dict):
+        return values
+    for key, field in TELEMETRY_FIELDS.items():
+        entries = data.get(key)
+        if not entries:
+            continue
+        values[field] = num_or_none(entries[0].get('value'))
+        ts = entries[0].get('ts')
+        if ts is not None and (values['ts'] is None or ts > values['ts']):
+            values['ts'] = ts
+    return values
+
+def build_room_snapshot(node: Dict, telemetry: Dict[str, Dict]) -> Dict[str, Any]:
+    """
+    Baut den Snapshot eines Raums aus der Telemetrie seiner Devices (telemetry: device_id -> Felder).
+    Gleiche Regeln wie buildAssetRoomDevicesSnapshot für die Betriebsarten 2, 10 und sonstige.
+    """
+    mode = operational_mode_of(node)
+    ext = external_device_of(node)
+    device_ids = [device['id'] for device in node.get('relatedDevices', []) if device.get('id')]
+    devices = [{'device_id': device_id, **map_latest_telemetry(None), **telemetry.get(device_id, {})}
+               for device_id in device_ids]
+
+    external = None
+    if ext:
+        external = {'device_id': ext, **map_latest_telemetry(None), **telemetry.get(ext, {})}
+
+    room = {
+        'sensor_temperature': None,
+        'target_temperature': None,
+        'percent_valve_open': None,
+        'sensor_temperature_source': None,
+        'target_temperature_source': None,
+        'percent_valve_open_source': None,
+        'device_count_for_average': None
+    }
+
+    valves = [d['percent_valve_open'] for d in devices if valid_valve(d['percent_valve_open'])]
+    targets = [d['target_temperature'] for d in devices if valid_temp(d['target_temperature'])]
+
+    if mode == 2 and external:
+        if valid_temp(external['sensor_temperature']):
+            room['sensor_temperature'] = external['sensor_temperature']
+            room['sensor_temperature_source'] = 'external'
+        if valid_temp(external['target_temperature']):
+            room['target_temperature'] = external['target_temperature']
+            room['target_temperature_source'] = 'external'
+        room['percent_valve_open'] = average(valves) if valves else 0
+        room['percent_valve_open_source'] = 'average'
+        room['device_count_for_average'] = len(valves)
+    elif mode == 10 and external:
+        if valid_temp(external['sensor_temperature']):
+            room['sensor_temperature'] = external['sensor_temperature']
+            room['sensor_temperature_source'] = 'external'
+        if targets:
+            room['target_temperature'] = average(targets)
+            room['target_temperature_source'] = 'average'
+        if valves:
+            room['percent_valve_open'] = average(valves)
+            room['percent_valve_open_source'] = 'average'
+    elif devices:
+        sensors = [d['sensor_temperature'] for d in devices if valid_temp(d['sensor_temperature'])]
+        if sensors:
+            room['sensor_temperature'] = average(sensors)
+            room['sensor_temperature_source'] = 'average'
+        if targets:
+            room['target_temperature'] = average(targets)
+            room['target_temperature_source'] = 'average'
+        if valves:
+            room['percent_valve_open'] = average(valves)
+            room['percent_valve_open_source'] = 'average'
+        room['device_count_for_average'] = len(devices)
+
+    batteries = [d['battery_voltage'] for d in devices if d['battery_voltage'] is not None]
+    timestamps = [d['ts'] for d in devices + ([external] if external else []) if d['ts'] is not None]
+    return {
+        'asset_id': node['id'],
+        'operational_mode': mode,
+        'ext_temp_device': ext,
+        'room': room,
+        'devices': devices,
+        'external_temperature_device': external,
+        'min_battery_voltage': min(batteries) if batteries else None,
+        'latest_ts': max(timestamps) if timestamps else None
+    }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Gespeicherte NextAuth-Sessions für die Telemetrie-Clients
+Cookies und Token einer Anmeldung werden pro Base URL und Benutzer in einer nur für den
+Besitzer lesbaren Datei (0600) abgelegt und bis kurz vor Ablauf wiederverwendet, damit
+wiederholte Aufrufe (z.B. per Cron) ohne erneute Anmeldung direkt Telemetrie abfragen.
+"""
+
+import os
+import json
+import stat
+import time
+import base64
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import requests
+
+DEFAULT_SESSION_FILE = os.getenv('HEATMANAGER_SESSION_FILE',
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'heatmanager', 'session.json'))
+
+# NextAuth maxAge (pages/api/auth/[...nextauth].js), falls die Session kein Ablaufdatum liefert
+SESSION_MAX_AGE_S = 8 * 60 * 60
+# Session so lange vor dem Ablauf verwerfen, dass laufende Abfragen nicht abbrechen
+SESSION_EXPIRY_MARGIN_S = 5 * 60
+
+FILE_VERSION = 1
+
+def parse_expiry(value: Any) -> Optional[float]:
+    """ISO-Zeitstempel (z.B. session.expires, tbTokenExpires) als Unix-Zeit"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+def jwt_expiry(token: Any) -> Optional[float]:
+    """exp-Claim eines JWT (ohne Signaturprüfung, nur für die Ablaufzeit)"""
+    try:
+        payload = str(token).split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+def session_expiry(session_data: Dict[str, Any], cookies: requests.cookies.RequestsCookieJar,
+                   now: Optional[float] = None) -> float:
+    """
+    Frühester Ablauf aus Session (expires), App-Token, ThingsBoard-Token (tbTokenExpires)
+    und Session-Cookie; ohne Angaben gilt SESSION_MAX_AGE_S ab jetzt.
+    """
+    now = now if now is not None else time.time()
+    candidates = [
+        parse_expiry(session_data.get('expires')),
+        parse_expiry(session_data.get('tbTokenExpires')),
+        jwt_expiry(session_data.get('token')),
+        jwt_expiry(session_data.get('accessToken'))
+    ]
+    candidates.extend(cookie.expires for cookie in cookies if 'session-token' in cookie.name and cookie.expires)
+    return min([c for c in candidates if c] or [now + SESSION_MAX_AGE_S])
+
+class SessionStore:
+    """
+    Datei mit einem Eintrag pro "<base_url>|<username>":
+    {cookies: [...], session: {...}, token, expires, saved}. Passwörter werden nie gespeichert.
+    """
+
+    def __init__(self, path: str = DEFAULT_SESSION_FILE):
+        self.path = path
+
+    @staticmethod
+    def _entry_key(base_url: str, username: str) -> str:
+        return f"{base_url.rstrip('/')}|{username}"
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            mode = os.stat(self.path).st_mode
+            if mode & (stat.S_IRWXG | stat.S_IRWXO):
+                print(f"⚠️  {self.path} ist für andere Benutzer lesbar, gespeicherte Sessions werden ignoriert")
+                return {'version': FILE_VERSION, 'sessions': {}}
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == FILE_VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {'version': FILE_VERSION, 'sessions': {}}
+
+    def _write(self, data: Dict[str, Any]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # Datei direkt mit 0600 anlegen, damit Cookies nie kurzzeitig lesbar sind
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def load(self, base_url: str, username: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Gespeicherte Session oder None, wenn keine vorhanden oder (fast) abgelaufen"""
+        now = now if now is not None else time.time()
+        entry = self._read()['sessions'].get(self._entry_key(base_url, username))
+        if not entry or entry.get('expires', 0) - SESSION_EXPIRY_MARGIN_S <= now:
+            return None
+        return entry
+
+    def save(self, base_url: str, username: str, session: requests.Session,
+             session_data: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+        """Speichert Cookies, Session-Daten und Token nach einer erfolgreichen Anmeldung"""
+        now = time.time()
+        entry = {
+            'cookies': [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path,
+                         'secure': c.secure, 'expires': c.expires} for c in session.cookies],
+            'session': session_data,
+            'token': token,
+            'expires': session_expiry(session_data, session.cookies, now),
+            'saved': now
+        }
+        data = self._read()
+        # Abgelaufene Einträge anderer Benutzer bei der Gelegenheit entfernen
+        data['sessions'] = {key: value for key, value in data['sessions'].items() if value.get('expires', 0) > now}
+        data['sessions'][self._entry_key(base_url, username)] = entry
+        self._write(data)
+        return entry
+
+    def clear(self, base_url: str, username: str):
+        """Verwirft die Session (z.B. nach 401 trotz gespeicherter Session)"""
+        data = self._read()
+        if data['sessions'].pop(self._entry_key(base_url, username), None) is not None:
+            self._write(data)
+
+    @staticmethod
+    def restore(session: requests.Session, entry: Dict[str, Any]):
+        """Überträgt die gespeicherten Cookies in eine requests-Session"""
+        for cookie in entry.get('cookies', []):
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain') or '',
+                                path=cookie.get('path') or '/', secure=cookie.get('secure', False),
+                                expires=cookie.get('expires'))
+
+def format_expiry(entry: Dict[str, Any]) -> str:
+    return datetime.fromtimestamp(entry['expires']).strftime('%H:%M:%S')
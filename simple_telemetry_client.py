@@ -5,13 +5,17 @@ Einfacher Telemetrie-API Client für HEATMANAGER
 
 import requests
 import json
+import argparse
 from datetime import datetime
 
+from telemetry_export import open_exporter, EXPORT_FORMATS
+import tracing
+
 def get_telemetry(device_id, username, password, base_url="http://localhost:3000"):
     """
     Einfache Funktion zum Abrufen von Telemetriedaten
     """
-    session = requests.Session()
+    session = tracing.trace_session(requests.Session())
     
     # 1. Anmelden
     print(f"🔐 Anmeldung bei {base_url}...")
@@ -154,6 +158,11 @@ def format_data(data):
     return "\n".join(result)
 
 if __name__ == "__main__":
+    # Nur Diagnose-Optionen; alles andere wird abgefragt
+    parser = argparse.ArgumentParser(description="HEATMANAGER Telemetrie-Client (interaktiv)")
+    tracing.add_arguments(parser)
+    tracing.start(parser.parse_args(), "simple_telemetry_client")
+    
     # Beispiel-Verwendung
     print("🚀 HEATMANAGER Telemetrie-Client")
     print("=" * 40)
@@ -167,17 +176,23 @@ if __name__ == "__main__":
     print("\n" + "=" * 40)
     
     # Telemetriedaten abrufen
-    telemetry_data = get_telemetry(DEVICE_ID, USERNAME, PASSWORD, BASE_URL)
+    with tracing.span("Anmeldung und Abruf"):
+        telemetry_data = get_telemetry(DEVICE_ID, USERNAME, PASSWORD, BASE_URL)
     
     if telemetry_data:
-        print("\n" + format_data(telemetry_data))
+        with tracing.span("Ausgabe"):
+            print("\n" + format_data(telemetry_data))
         
-        # Option: Rohe Daten speichern
-        save_raw = input("\nRohe JSON-Daten in Datei speichern? (j/n): ").strip().lower()
+        # Option: Rohe Daten speichern (eine Zeile pro Zeitstempel, siehe telemetry_export.py)
+        save_raw = input("\nRohe Daten in Datei speichern? (j/n): ").strip().lower()
         if save_raw in ['j', 'ja', 'y', 'yes']:
-            filename = f"telemetry_{DEVICE_ID}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(telemetry_data, f, indent=2, ensure_ascii=False)
-            print(f"✅ Daten gespeichert in: {filename}")
+            export_format = input(f"Format ({'/'.join(EXPORT_FORMATS)}, Standard: ndjson): ").strip().lower() or "ndjson"
+            filename = f"telemetry_{DEVICE_ID}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+            try:
+                with open_exporter(filename, list(telemetry_data.keys()), export_format) as exporter:
+                    exporter.write(DEVICE_ID, telemetry_data)
+                print(f"✅ Daten gespeichert in: {filename}")
+            except (RuntimeError, ValueError, OSError) as e:
+                print(f"❌ Speichern fehlgeschlagen: {e}")
     else:
         print("❌ Konnte keine Telemetriedaten abrufen.")
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Telemetrie-Auswertung für einen Teilbaum der Kundenstruktur
+Lädt den gespeicherten Tree (customer_settings.tree) einmal, bestimmt alle Devices unterhalb
+eines Assets (z.B. Gebäude X), ruft deren Telemetrie parallel in Zeitfenstern ab und berechnet
+pro Raum und pro übergeordneter Ebene (Etage, Gebäude, ...) die Mittelwerte der Keys.
+
+Pro Device wird zuerst auf Buckets gemittelt, danach über die Devices eines Knotens, so dass
+häufig sendende Geräte nicht stärker zählen. Räume in den Betriebsarten 2/10 verwenden für die
+Temperatur den externen Fühler (wie room_snapshots.build_room_snapshot).
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from telemetry_client import TelemetryClient, MANY_MAX_CONCURRENCY, RANGE_POINT_INTERVAL_MS, load_device_ids, aiohttp
+from telemetry_arrays import to_columns, bucket_matrix, rollup_means
+from session_store import SessionStore, DEFAULT_SESSION_FILE
+from room_snapshots import external_device_of, operational_mode_of
+from tree_snapshots import iter_tree
+
+SUBTREE_KEYS = ('sensorTemperature', 'targetTemperature', 'PercentValveOpen')
+SUBTREE_BUCKET_MS = 60 * 60 * 1000
+SUBTREE_WINDOW_CONCURRENCY = 2  # Zeitfenster pro Device gleichzeitig (Devices laufen parallel)
+
+# Gültige Wertebereiche (wie valid_temp / valid_valve); Werte außerhalb zählen nicht
+VALUE_RANGES = {
+    'sensorTemperature': (-50, 100),
+    'targetTemperature': (-50, 100),
+    'PercentValveOpen': (0, 100)
+}
+
+# Keys, die in diesen Betriebsarten vom externen Fühler stammen (buildAssetRoomDevicesSnapshot)
+EXTERNAL_SENSOR_KEYS = {
+    'sensorTemperature': (2, 10),
+    'targetTemperature': (2,)
+}
+
+class TreeIndex:
+    """Knoten, Kinder und Tiefe des gespeicherten Trees, einmal aufgebaut"""
+
+    def __init__(self, tree: List[Dict]):
+        self.tree = tree
+        self.nodes: Dict[str, Dict] = {}
+        for node, _ in iter_tree(tree):
+            self.nodes[node['id']] = node
+
+    def find(self, query: str) -> List[Dict]:
+        """Knoten per ID oder (Teil des) Namens, Groß-/Kleinschreibung egal"""
+        if query in self.nodes:
+            return [self.nodes[query]]
+        needle = query.lower()
+        exact = [node for node in self.nodes.values() if str(node.get('name', '')).lower() == needle]
+        return exact or [node for node in self.nodes.values() if needle in str(node.get('name', '')).lower()]
+
+    def subtree(self, roots: List[Dict]) -> List[Tuple[Dict, int]]:
+        """(Knoten, Tiefe) in Preorder unterhalb der Wurzeln (einschließlich)"""
+        result = []
+        stack = [(node, 0) for node in reversed(roots)]
+        while stack:
+            node, depth = stack.pop()
+            result.append((node, depth))
+            stack.extend((child, depth + 1) for child in reversed(node.get('children', [])))
+        return result
+
+def room_devices(node: Dict, key: str) -> List[str]:
+    """Devices, aus denen der Wert des Keys für diesen Knoten selbst stammt"""
+    ext = external_device_of(node)
+    if ext and operational_mode_of(node) in EXTERNAL_SENSOR_KEYS.get(key, ()):
+        return [ext]
+    return [device['id'] for device in node.get('relatedDevices', []) if device.get('id')]
+
+def build_membership(rows: List[Tuple[Dict, int]], key: str, device_index: Dict[str, int]) -> np.ndarray:
+    """Knoten x Device (0/1): ein Knoten umfasst die Devices aller Räume in seinem Teilbaum"""
+    membership = np.zeros((len(rows), len(device_index)))
+    position = {node['id']: i for i, (node, _) in enumerate(rows)}
+    # Rückwärts über die Preorder: Kinder sind vor ihren Eltern fertig
+    for i in range(len(rows) - 1, -1, -1):
+        node, _ = rows[i]
+        for device_id in room_devices(node, key):
+            membership[i, device_index[device_id]] = 1.0
+        for child in node.get('children', []):
+            if child['id'] in position:
+                membership[i] = np.maximum(membership[i], membership[position[child['id']]])
+    return membership
+
+def device_columns(data: Optional[Dict[str, Any]], key: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Spalten eines Keys; Werte außerhalb des gültigen Bereichs werden NaN"""
+    timestamps, values = to_columns((data or {}).get(key) or [])
+    bounds = VALUE_RANGES.get(key)
+    if bounds is not None and values.size:
+        values = np.where((values >= bounds[0]) & (values <= bounds[1]), values, np.nan)
+    return timestamps, values
+
+def aggregate_subtree(rows: List[Tuple[Dict, int]], telemetry: Dict[str, Optional[Dict[str, Any]]],
+                      keys: List[str], start_ts: int, end_ts: int,
+                      bucket_ms: int = SUBTREE_BUCKET_MS) -> List[Dict[str, Any]]:
+    """
+    Mittelwerte pro Knoten: je Key eine Matrix Device x Bucket (bucket_matrix), daraus per
+    Matrixprodukt die Bucket-Mittel jedes Knotens (rollup_means) und deren zeitliches Mittel.
+    """
+    device_ids = list(telemetry)
+    device_index = {device_id: i for i, device_id in enumerate(device_ids)}
+    result = [{'id': node['id'], 'name': node.get('name'), 'type': node.get('type'), 'depth': depth,
+               'devices': 0, 'values': {}, 'coverage': {}} for node, depth in rows]
+
+    for key in keys:
+        _, matrix = bucket_matrix([device_columns(telemetry[d], key) for d in device_ids], start_ts, end_ts, bucket_ms)
+        membership = build_membership(rows, key, device_index)
+        means, counts = rollup_means(membership, matrix)
+        members = membership.sum(axis=1)
+        filled = ~np.isnan(means)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            coverage = counts.sum(axis=1) / (members * matrix.shape[1])
+            # Zeitliches Mittel über die Buckets mit Werten (nanmean ohne Warnung bei leeren Knoten)
+            node_means = np.where(filled, means, 0.0).sum(axis=1) / filled.sum(axis=1)
+        for entry, value, member_count, share in zip(result, node_means, members, coverage):
+            entry['values'][key] = None if np.isnan(value) else round(float(value), 2)
+            entry['coverage'][key] = None if not member_count else round(float(share), 3)
+            entry['devices'] = max(entry['devices'], int(member_count))
+    return result
+
+def format_subtree_table(result: List[Dict[str, Any]], keys: List[str], max_depth: Optional[int] = None) -> str:
+    def fmt(value) -> str:
+        return f"{value:.2f}" if value is not None else "-"
+
+    name_width = max([24] + [len(str(entry['name'])) + 2 * entry['depth'] for entry in result])
+    name_width = min(name_width, 60)
+    header = f"{'Knoten':<{name_width}} {'Typ':<12} {'Devices':>7} " + ' '.join(f"{key[:18]:>18}" for key in keys) + f" {'Abdeckung':>9}"
+    lines = ["📊 TEILBAUM-TELEMETRIE (Mittelwerte)", "=" * len(header), header]
+    for entry in result:
+        if max_depth is not None and entry['depth'] > max_depth:
+            continue
+        name = ('  ' * entry['depth'] + str(entry['name']))[:name_width]
+        coverage = entry['coverage'].get(keys[0])
+        lines.append(f"{name:<{name_width}} {str(entry['type'] or '')[:12]:<12} {entry['devices']:>7} "
+                     + ' '.join(f"{fmt(entry['values'].get(key)):>18}" for key in keys)
+                     + f" {(f'{coverage * 100:.0f}%' if coverage is not None else '-'):>9}")
+    return "\n".join(lines)
+
+async def fetch_subtree_telemetry(client: TelemetryClient, device_ids: List[str], keys: List[str],
+                                  start_ts: int, end_ts: int, concurrency: int = MANY_MAX_CONCURRENCY,
+                                  point_interval_ms: int = RANGE_POINT_INTERVAL_MS) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Telemetrie aller Devices parallel (je Device in Zeitfenstern); None bei Fehlern"""
+    semaphore = asyncio.Semaphore(concurrency)
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    async def fetch(device_id: str):
+        async with semaphore:
+            results[device_id] = await client.get_telemetry_range(
+                device_id, ','.join(keys), start_ts, end_ts, point_interval_ms=point_interval_ms,
+                concurrency=SUBTREE_WINDOW_CONCURRENCY, verbose=False)
+        if len(results) % max(1, len(device_ids) // 10) == 0:
+            print(f"   {len(results)}/{len(device_ids)} Devices abgerufen", file=sys.stderr)
+
+    await asyncio.gather(*(fetch(device_id) for device_id in device_ids))
+    return {device_id: results[device_id] for device_id in device_ids}
+
+def load_tree(args, client: Optional[TelemetryClient]) -> Optional[List[Dict]]:
+    """Tree aus Datei, Datenbank (customer_settings) oder über /api/treepath/tree"""
+    if args.tree_file:
+        with open(args.tree_file, encoding='utf-8') as f:
+            data = json.load(f)
+        return data.get('data', {}).get('tree', data.get('tree')) if isinstance(data, dict) else data
+    if args.customer_id:
+        # Direkt aus customer_settings (gleiche Verbindung wie sync_structure.py)
+        from sync_structure import get_db_connection
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT tree FROM customer_settings WHERE customer_id = ?", args.customer_id)
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if not row or not row[0]:
+            print(f"❌ Kein Tree für Kunde {args.customer_id} gespeichert")
+            return None
+        return json.loads(row[0])
+    response = client.session.get(f"{client.base_url}/api/treepath/tree",
+                                  headers={"Authorization": f"Bearer {client.auth_token}"})
+    if response.status_code != 200:
+        print(f"❌ Tree konnte nicht geladen werden: {response.status_code}")
+        return None
+    return response.json().get('data', {}).get('tree', [])
+
+def tree_devices(tree: List[Dict], rows: List[Tuple[Dict, int]]) -> Dict[str, Dict[str, Any]]:
+    """Device-ID -> Name, Label, Typ und Pfad des Raums (ab Wurzel des Trees) für die Devices der Knoten"""
+    parents, names = {}, {}
+    for node, parent_id in iter_tree(tree):
+        parents[node['id']] = parent_id
+        names[node['id']] = str(node.get('name', node['id']))
+    devices: Dict[str, Dict[str, Any]] = {}
+    for node, _ in rows:
+        path, current = [], node['id']
+        while current is not None:
+            path.append(names.get(current, current))
+            current = parents.get(current)
+        room = ' / '.join(reversed(path))
+        for device in node.get('relatedDevices', []):
+            if device.get('id') and device['id'] not in devices:
+                devices[device['id']] = {'name': device.get('name'), 'label': device.get('label') or '',
+                                         'type': device.get('type'), 'room': room}
+        ext = external_device_of(node)
+        if ext and ext not in devices:
+            devices[ext] = {'name': None, 'label': '', 'type': 'extTempDevice', 'room': room}
+    return devices
+
+
+def find_roots(index: TreeIndex, asset: Optional[str]) -> Optional[List[Dict]]:
+    """Wurzel für --asset (genau ein Treffer) oder der gesamte Tree; None mit Fehlermeldung sonst"""
+    if not asset:
+        return index.tree
+    roots = index.find(asset)
+    if not roots:
+        print(f"❌ Kein Asset '{asset}' im Tree gefunden")
+        return None
+    if len(roots) > 1:
+        print(f"❌ '{asset}' ist nicht eindeutig: "
+              + ', '.join(f"{node.get('name')} ({node['id']})" for node in roots[:10]))
+        return None
+    return roots
+
+def needs_login(args) -> bool:
+    """Anmeldung nötig, außer mit --pg und Devices aus Liste, Datei oder Datenbank (customer_settings)"""
+    if not getattr(args, 'pg', False):
+        return True
+    return not (load_device_ids(args) or args.tree_file or args.customer_id)
+
+def resolve_devices(args, client: Optional[TelemetryClient]) -> Dict[str, Dict[str, Any]]:
+    """
+    Devices eines CLI-Aufrufs: --device-id/--device-ids/--device-file (falls vorhanden), sonst alle
+    Devices unterhalb von --asset bzw. des gesamten Trees (tree_devices). Beendet das Programm mit
+    Exit-Code 1, wenn der Tree fehlt, das Asset nicht eindeutig ist oder keine Devices übrig bleiben.
+    """
+    device_ids = load_device_ids(args) if hasattr(args, 'device_id') else []
+    devices: Dict[str, Dict[str, Any]] = {device_id: {} for device_id in device_ids}
+    if not devices:
+        tree = load_tree(args, client)
+        if tree is None:
+            sys.exit(1)
+        index = TreeIndex(tree)
+        roots = find_roots(index, args.asset)
+        if roots is None:
+            sys.exit(1)
+        devices = tree_devices(tree, index.subtree(roots))
+    if not devices:
+        print("❌ Keine Devices angegeben oder im Tree gefunden")
+        sys.exit(1)
+    return devices
+
+def main():
+    parser = argparse.ArgumentParser(description="HEATMANAGER Telemetrie-Auswertung für einen Teilbaum")
+    parser.add_argument("--url", default="http://localhost:3000",
+                       help="Base URL der API (Standard: http://localhost:3000)")
+    parser.add_argument("--username", required=True, help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", required=True, help="Passwort für die Anmeldung")
+    parser.add_argument("--asset", help="ID oder Name des Assets (Standard: gesamter Tree)")
+    parser.add_argument("--customer-id", help="Tree direkt aus customer_settings laden (MSSQL, wie sync_structure.py)")
+    parser.add_argument("--tree-file", help="Tree aus JSON-Datei laden")
+    parser.add_argument("--keys", default=','.join(SUBTREE_KEYS),
+                       help=f"Komma-getrennte Keys (Standard: {','.join(SUBTREE_KEYS)})")
+    parser.add_argument("--hours", type=int, default=7 * 24, help="Zeitbereich in Stunden (Standard: 168)")
+    parser.add_argument("--bucket", type=int, default=SUBTREE_BUCKET_MS // 60000,
+                       help=f"Bucket-Größe in Minuten (Standard: {SUBTREE_BUCKET_MS // 60000})")
+    parser.add_argument("--max-depth", type=int, help="Nur Knoten bis zu dieser Tiefe ausgeben")
+    parser.add_argument("--concurrency", type=int, default=MANY_MAX_CONCURRENCY,
+                       help=f"Gleichzeitig abgefragte Devices (Standard: {MANY_MAX_CONCURRENCY})")
+    parser.add_argument("--point-interval", type=int, default=RANGE_POINT_INTERVAL_MS // 1000,
+                       help=f"Erwarteter Abstand zweier Werte in Sekunden (Standard: {RANGE_POINT_INTERVAL_MS // 1000})")
+    parser.add_argument("--json", action="store_true", help="Ergebnis als JSON ausgeben")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für die gespeicherte Session (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true", help="Immer neu anmelden")
+
+    args = parser.parse_args()
+    keys = [key.strip() for key in args.keys.split(',') if key.strip()]
+
+    if aiohttp is None:
+        print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+        sys.exit(1)
+
+    client = TelemetryClient(args.url, session_store=None if args.no_session_cache else SessionStore(args.session_file))
+    if not client.login(args.username, args.password):
+        print("❌ Anmeldung fehlgeschlagen. Beende Programm.")
+        sys.exit(1)
+
+    tree = load_tree(args, client)
+    if tree is None:
+        sys.exit(1)
+    index = TreeIndex(tree)
+    roots = find_roots(index, args.asset)
+    if roots is None:
+        sys.exit(1)
+    rows = index.subtree(roots)
+    device_ids = list(dict.fromkeys(d for node, _ in rows for key in keys for d in room_devices(node, key)))
+    if not device_ids:
+        print("❌ Keine Devices unterhalb des Assets")
+        sys.exit(1)
+
+    end_ts = int(time.time() * 1000)
+    start_ts = end_ts - args.hours * 3600 * 1000
+    print(f"📡 {len(rows)} Knoten, {len(device_ids)} Devices, {args.hours} h "
+          f"(max. {args.concurrency} Devices parallel)...", file=sys.stderr)
+
+    started = time.perf_counter()
+    telemetry = asyncio.run(fetch_subtree_telemetry(client, device_ids, keys, start_ts, end_ts,
+                                                    args.concurrency, args.point_interval * 1000))
+    fetched = time.perf_counter()
+    failed = [device_id for device_id, data in telemetry.items() if data is None]
+    if failed:
+        print(f"⚠️  Keine Telemetrie für {len(failed)} von {len(device_ids)} Devices", file=sys.stderr)
+
+    result = aggregate_subtree(rows, telemetry, keys, start_ts, end_ts, args.bucket * 60 * 1000)
+    print(f"⏱️  Abruf {fetched - started:.1f} s, Auswertung {time.perf_counter() - fetched:.2f} s", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps({'startTs': start_ts, 'endTs': end_ts, 'bucketMs': args.bucket * 60 * 1000,
+                          'keys': keys, 'failedDevices': failed, 'nodes': result}, indent=2, ensure_ascii=False))
+    else:
+        print(format_subtree_table(result, keys, args.max_depth))
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,25 @@ Analog zu pages/api/config/customers/tree/[id].js
 import os
 import sys
 import json
+import time
 import uuid
+import base64
 import argparse
 import asyncio
+import urllib.request
 import aiohttp
-from datetime import datetime
-from typing import Dict, List, Any, Optional, Set
+from contextlib import asynccontextmanager
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Set, Tuple
 import pyodbc
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from tree_snapshots import encode_snapshot, decode_snapshot, diff_trees, is_empty_diff, summarize_diff
+from room_snapshots import TELEMETRY_FIELDS, iter_snapshot_nodes, snapshot_device_ids, map_latest_telemetry, build_room_snapshot
+import tracing
+
 # Lade .env Datei
 load_dotenv()
 
@@ -34,6 +43,38 @@ RELATION_TIMEOUT_BASE = 15
 RELATION_MAX_RETRIES = 2
 DEVICE_DETAILS_TIMEOUT = 10
 ATTRIBUTES_TIMEOUT = 5
+DEVICE_LIST_TIMEOUT = 15
+DEVICE_LIST_PAGE_SIZE = 1000
+TOKEN_LOGIN_TIMEOUT = 15
+SNAPSHOT_TELEMETRY_TIMEOUT = 10
+SNAPSHOT_BATCH_SIZE = 200  # Devices pro Batch beim Laden der letzten Telemetrie
+ROOM_SNAPSHOTS_ENABLED = os.getenv('SYNC_ROOM_SNAPSHOTS', '0') == '1'
+
+# Token-Cache-Konfiguration
+TOKEN_CACHE_FILE = os.getenv('TB_TOKEN_CACHE_FILE', os.path.join('.cache', 'tb_token_cache.json'))
+TOKEN_REFRESH_MARGIN = 300  # Sekunden vor Ablauf erneuern (wie tokenRefreshService.js: 5 Minuten)
+TOKEN_DEFAULT_LIFETIME = 15 * 60  # Ablaufzeit falls der JWT keinen exp-Claim enthält
+
+# Checkpoint-Journal für fortsetzbare Syncs (--resume <session_id>)
+CHECKPOINT_DIR = os.getenv('SYNC_CHECKPOINT_DIR', os.path.join('.cache', 'sync_checkpoints'))
+CHECKPOINT_MAX_AGE_HOURS = float(os.getenv('SYNC_CHECKPOINT_MAX_AGE_HOURS', '24'))
+CHECKPOINTS_ENABLED = os.getenv('SYNC_CHECKPOINTS', '1') != '0'
+
+# Werte für customer_settings.tree_state (progressiver Sync)
+TREE_STATE_PARTIAL = 'partial'
+TREE_STATE_COMPLETE = 'complete'
+
+# Maximale Anzahl gleichzeitiger Requests an ThingsBoard
+MAX_CONCURRENT_REQUESTS = int(os.getenv('TB_MAX_CONCURRENT_REQUESTS', '20'))
+
+# Adaptive Timeouts und Hedging: die festen Timeouts oben gelten als Obergrenze,
+# bis genug Latenzen pro Endpunkt-Klasse gemessen wurden
+LATENCY_WINDOW = 500  # Anzahl der letzten Messungen pro Endpunkt-Klasse
+LATENCY_MIN_SAMPLES = 20
+ADAPTIVE_TIMEOUT_FACTOR = 4  # Timeout = p99 * Faktor
+ADAPTIVE_TIMEOUT_MIN = 2
+HEDGE_REQUESTS = os.getenv('TB_HEDGE_REQUESTS', '0') == '1'
+HEDGE_BUDGET_PERCENT = float(os.getenv('TB_HEDGE_BUDGET_PERCENT', '5'))
 
 # Logging
 LOG_DIR = 'logs'
@@ -92,9 +133,9 @@ def log_error(message: str, error: Optional[Exception] = None):
     if error:
         print(f"  {str(error)}", file=sys.stderr)
 
-def start_structure_creation_log(customer_id: str) -> str:
-    """Startet eine neue Struktur-Erstellungs-Session"""
-    session_id = str(uuid.uuid4())
+def start_structure_creation_log(customer_id: str, session_id: Optional[str] = None) -> str:
+    """Startet eine neue Struktur-Erstellungs-Session (oder setzt eine bestehende fort)"""
+    session_id = session_id or str(uuid.uuid4())
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     log_entry = f"[{timestamp}] [START] Structure creation started | sessionId={session_id} | customerId={customer_id}\n"
     
@@ -114,6 +155,112 @@ def end_structure_creation_log(session_id: str, summary: Dict):
     write_to_log_file(SCRIPT_LOG_FILE, log_entry)
     print(f"END: Structure creation completed (sessionId={session_id})")
 
+class SyncJournal:
+    """
+    Append-only Checkpoint-Journal eines Syncs (eine JSON-Zeile pro abgeschlossenem Ergebnis).
+    Beim Fortsetzen werden bereits geladene Relations, Device-Details und Attribute übersprungen.
+    """
+    
+    def __init__(self, session_id: str, customer_id: str):
+        self.session_id = session_id
+        self.customer_id = customer_id
+        self.path = os.path.join(CHECKPOINT_DIR, f"{session_id}.jsonl")
+        self.entries: Dict[str, Any] = {}
+        self._file = None
+    
+    @classmethod
+    def create(cls, session_id: str, customer_id: str) -> 'SyncJournal':
+        journal = cls(session_id, customer_id)
+        if not os.path.exists(CHECKPOINT_DIR):
+            os.makedirs(CHECKPOINT_DIR)
+        journal._file = open(journal.path, 'a', encoding='utf-8')
+        journal._write({'header': {'customerId': customer_id, 'createdAt': datetime.now().isoformat()}})
+        return journal
+    
+    @classmethod
+    def resume(cls, session_id: str, customer_id: str) -> 'SyncJournal':
+        """Lädt ein bestehendes Journal, verdichtet es und öffnet es zum Weiterschreiben"""
+        journal = cls(session_id, customer_id)
+        if not os.path.exists(journal.path):
+            raise ValueError(f"No checkpoint journal found for session {session_id}")
+        
+        header = None
+        with open(journal.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Abgebrochene letzte Zeile nach einem Absturz
+                    continue
+                if 'header' in record:
+                    header = header or record['header']
+                elif 'k' in record:
+                    journal.entries[record['k']] = record['v']
+        
+        if not header or header.get('customerId') != customer_id:
+            raise ValueError(f"Checkpoint journal {session_id} belongs to a different customer")
+        
+        journal.compact(header)
+        journal._file = open(journal.path, 'a', encoding='utf-8')
+        return journal
+    
+    def compact(self, header: Dict):
+        """Schreibt das Journal ohne Duplikate und defekte Zeilen neu"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'header': header}) + '\n')
+            for key, value in self.entries.items():
+                f.write(json.dumps({'k': key, 'v': value}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+    
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+    
+    def get(self, key: str) -> Any:
+        return self.entries.get(key)
+    
+    def record(self, key: str, value: Any):
+        self.entries[key] = value
+        self._write({'k': key, 'v': value})
+    
+    def close(self, remove: bool = False):
+        if self._file:
+            self._file.close()
+            self._file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+def cleanup_expired_checkpoints(max_age_hours: float = CHECKPOINT_MAX_AGE_HOURS) -> int:
+    """Löscht Checkpoint-Journale, die älter als max_age_hours sind"""
+    if not os.path.isdir(CHECKPOINT_DIR):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_hours * 3600
+    for name in os.listdir(CHECKPOINT_DIR):
+        path = os.path.join(CHECKPOINT_DIR, name)
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        log_info(f"Removed {removed} expired checkpoint journals")
+    return removed
+
+async def journaled(journal: Optional[SyncJournal], key: str, fetch) -> Any:
+    """Liefert das Ergebnis aus dem Journal oder führt fetch() aus und speichert erfolgreiche Ergebnisse"""
+    if journal is not None and key in journal:
+        return journal.get(key)
+    result = await fetch()
+    if journal is not None and result is not None:
+        journal.record(key, result)
+    return result
+
 def get_db_connection():
     """Erstellt eine Datenbankverbindung"""
     connection_string = (
@@ -125,30 +272,172 @@ def get_db_connection():
         f"Encrypt=yes;"
         f"TrustServerCertificate=yes;"
     )
-    return pyodbc.connect(connection_string)
+    return tracing.traced_connection(pyodbc.connect(connection_string))
 
-def get_thingsboard_token(customer_id: str) -> str:
-    """Holt den ThingsBoard Token aus der customer_settings Tabelle für die gegebene customer_id"""
+# In-Process-Cache: customer_id -> Token
+_token_cache: Dict[str, str] = {}
+
+def decode_jwt_exp(token: str) -> Optional[int]:
+    """Liest den exp-Claim (Unix-Sekunden) aus einem JWT, ohne die Signatur zu prüfen"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload.encode('ascii')))
+        exp = claims.get('exp')
+        return int(exp) if exp is not None else None
+    except Exception:
+        return None
+
+def is_token_fresh(token: Optional[str], margin: int = TOKEN_REFRESH_MARGIN) -> bool:
+    """Prüft ob ein Token noch länger als `margin` Sekunden gültig ist"""
+    if not token:
+        return False
+    exp = decode_jwt_exp(token)
+    if exp is None:
+        # Kein JWT: Gültigkeit unbekannt, ein 401 wird später über den Governor behandelt
+        return True
+    return exp - margin > time.time()
+
+def load_token_cache_file() -> Dict[str, Dict]:
+    """Lädt den Token-Cache von der Festplatte"""
+    try:
+        with open(TOKEN_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def store_cached_token(customer_id: str, token: str):
+    """Speichert einen Token im Prozess- und im Datei-Cache (nur für den Eigentümer lesbar)"""
+    _token_cache[customer_id] = token
+    try:
+        cache = load_token_cache_file()
+        cache[customer_id] = {'token': token, 'exp': decode_jwt_exp(token)}
+        cache_dir = os.path.dirname(TOKEN_CACHE_FILE)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+        tmp_file = f"{TOKEN_CACHE_FILE}.{os.getpid()}.tmp"
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, TOKEN_CACHE_FILE)
+    except OSError as e:
+        log_warn(f"Could not write token cache file: {e}")
+
+def get_cached_token(customer_id: str) -> Optional[str]:
+    """Liefert einen noch gültigen Token aus dem Prozess- oder Datei-Cache"""
+    token = _token_cache.get(customer_id)
+    if is_token_fresh(token):
+        return token
+    entry = load_token_cache_file().get(customer_id) or {}
+    token = entry.get('token')
+    if is_token_fresh(token):
+        _token_cache[customer_id] = token
+        return token
+    return None
+
+def load_customer_tb_settings(customer_id: str) -> Optional[Dict]:
+    """Lädt Token und ThingsBoard-Zugangsdaten aus customer_settings"""
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT tbtoken
+            SELECT tbtoken, tb_username, tb_password, tb_url
             FROM customer_settings 
             WHERE customer_id = ?
         """, (customer_id,))
-        
         row = cursor.fetchone()
         cursor.close()
+    finally:
         conn.close()
+    
+    if not row:
+        return None
+    return {
+        'tbtoken': (row[0] or '').strip(),
+        'tb_username': (row[1] or '').strip(),
+        'tb_password': (row[2] or '').strip(),
+        'tb_url': (row[3] or '').strip().rstrip('/')
+    }
+
+def request_thingsboard_login(tb_url: str, username: str, password: str) -> str:
+    """Meldet sich bei ThingsBoard an und liefert einen neuen Token (wie getThingsboardToken in tokenRefreshService.js)"""
+    body = json.dumps({'username': username, 'password': password}).encode('utf-8')
+    request = urllib.request.Request(
+        f"{tb_url}/api/auth/login",
+        data=body,
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=TOKEN_LOGIN_TIMEOUT) as response:
+        data = json.loads(response.read().decode('utf-8'))
+    token = data.get('token') if isinstance(data, dict) else None
+    if not token:
+        raise ValueError(f"ThingsBoard login at {tb_url} returned no token")
+    return token
+
+def refresh_thingsboard_token(customer_id: str, settings: Optional[Dict] = None) -> Optional[str]:
+    """Holt einen neuen Token mit den hinterlegten Zugangsdaten und schreibt ihn zurück in customer_settings"""
+    try:
+        settings = settings or load_customer_tb_settings(customer_id)
+        if not settings or not settings['tb_username'] or not settings['tb_password']:
+            log_warn(f"No ThingsBoard credentials stored for customer {customer_id}, cannot refresh token")
+            return None
+        
+        tb_url = settings['tb_url'] or THINGSBOARD_URL
+        token = request_thingsboard_login(tb_url, settings['tb_username'], settings['tb_password'])
+        
+        exp = decode_jwt_exp(token)
+        expiry = datetime.fromtimestamp(exp) if exp else datetime.now() + timedelta(seconds=TOKEN_DEFAULT_LIFETIME)
+        
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE customer_settings 
+                SET tbtoken = ?, tbtokenexpiry = ?, updatedttm = GETDATE()
+                WHERE customer_id = ?
+            """, (token, expiry, customer_id))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        
+        store_cached_token(customer_id, token)
+        log_info(f"ThingsBoard token refreshed for customer {customer_id}", {'expiry': expiry.isoformat()})
+        return token
+    except Exception as e:
+        log_error(f"Could not refresh ThingsBoard token for customer {customer_id}", e)
+        return None
+
+def get_thingsboard_token(customer_id: str) -> str:
+    """Holt den ThingsBoard Token für die gegebene customer_id (Cache, customer_settings, Refresh, ENV)"""
+    cached_token = get_cached_token(customer_id)
+    if cached_token:
+        log_info(f"ThingsBoard token loaded from cache for customer {customer_id}")
+        return cached_token
+    
+    try:
+        settings = load_customer_tb_settings(customer_id)
         
-        if row and row[0]:
-            token = row[0]
-            if token and token.strip():  # Prüfe ob Token nicht leer ist
+        if settings and settings['tbtoken']:
+            token = settings['tbtoken']
+            if is_token_fresh(token):
                 log_info(f"ThingsBoard token loaded from database for customer {customer_id}")
-                return token.strip()
-            else:
-                log_warn(f"Token in database is empty for customer {customer_id}")
+                store_cached_token(customer_id, token)
+                return token
+            
+            log_info(f"Token in database expires soon for customer {customer_id}, refreshing")
+            refreshed_token = refresh_thingsboard_token(customer_id, settings)
+            if refreshed_token:
+                return refreshed_token
+            log_warn(f"Token refresh failed, using stored token for customer {customer_id}")
+            return token
+        elif settings:
+            log_warn(f"Token in database is empty for customer {customer_id}")
+            refreshed_token = refresh_thingsboard_token(customer_id, settings)
+            if refreshed_token:
+                return refreshed_token
         else:
             log_warn(f"No token found in database for customer {customer_id}")
             
@@ -162,31 +451,272 @@ def get_thingsboard_token(customer_id: str) -> str:
     
     raise ValueError(f"No ThingsBoard token available for customer {customer_id}. Set THINGSBOARD_TOKEN env var or ensure customer_settings.tbtoken has a valid token.")
 
-async def fetch_with_timeout(session: aiohttp.ClientSession, url: str, headers: Dict, timeout: int) -> Optional[Dict]:
-    """Führt einen HTTP-Request mit Timeout aus"""
-    try:
-        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                log_warn(f"HTTP {response.status} for {url}")
-                return None
-    except asyncio.TimeoutError:
-        log_warn(f"Timeout after {timeout}s for {url}")
-        return None
-    except Exception as e:
-        log_warn(f"Error fetching {url}: {e}")
-        return None
+def classify_endpoint(url: str) -> str:
+    """Ordnet eine ThingsBoard-URL einer Endpunkt-Klasse für die Latenzstatistik zu"""
+    if '/api/relations/info' in url:
+        return 'relations'
+    if '/values/attributes' in url:
+        return 'attributes'
+    if '/api/device/' in url:
+        return 'device'
+    if '/assets' in url or '/api/asset/' in url:
+        return 'assets'
+    return 'other'
+
+class LatencyTracker:
+    """Gleitende Latenz-Percentile pro Endpunkt-Klasse für adaptive Timeouts und Hedging"""
+    
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Dict[str, deque] = {}
+        self._sorted: Dict[str, List[float]] = {}
+        self.window = window
+    
+    def record(self, endpoint: str, seconds: float):
+        self._samples.setdefault(endpoint, deque(maxlen=self.window)).append(seconds)
+        self._sorted.pop(endpoint, None)
+    
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        samples = self._samples.get(endpoint)
+        if not samples or len(samples) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = self._sorted.get(endpoint)
+        if ordered is None:
+            ordered = self._sorted[endpoint] = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+    
+    def timeout_for(self, endpoint: str, configured: float) -> float:
+        """Timeout aus dem gemessenen p99, höchstens der konfigurierte Wert"""
+        p99 = self.percentile(endpoint, 99)
+        if p99 is None:
+            return configured
+        return min(configured, max(ADAPTIVE_TIMEOUT_MIN, p99 * ADAPTIVE_TIMEOUT_FACTOR))
+    
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            endpoint: {
+                'samples': len(samples),
+                'p50': round(self.percentile(endpoint, 50) or 0, 3),
+                'p95': round(self.percentile(endpoint, 95) or 0, 3),
+                'p99': round(self.percentile(endpoint, 99) or 0, 3)
+            }
+            for endpoint, samples in self._samples.items()
+        }
+
+class RequestGovernor:
+    """
+    Begrenzt die gleichzeitigen Requests an ThingsBoard und koordiniert den Token-Refresh.
+    Beim ersten 401 werden neue Requests angehalten, der Token einmal erneuert und
+    die betroffenen Requests mit dem neuen Token wiederholt.
+    """
+    
+    def __init__(self, customer_id: str, tb_token: str, max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 rate_limiter: Optional[Any] = None):
+        self.customer_id = customer_id
+        self.token = tb_token
+        self.rate_limiter = rate_limiter if rate_limiter is not None else _rate_limiter
+        self.latency = LatencyTracker()
+        self.hedging = HEDGE_REQUESTS
+        self.hedge_budget = HEDGE_BUDGET_PERCENT / 100
+        self.total_requests = 0
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        self.auth_failed = False
+        self.refresh_count = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running = asyncio.Event()
+        self._running.set()
+        self._refresh_lock = asyncio.Lock()
+    
+    def pause(self):
+        self._running.clear()
+    
+    def resume(self):
+        self._running.set()
+    
+    def apply_auth(self, headers: Dict) -> Dict:
+        """Ersetzt den Authorization-Header durch den aktuellen Token"""
+        if 'X-Authorization' not in headers:
+            return headers
+        return {**headers, 'X-Authorization': f'Bearer {self.token}'}
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Wartet bis der Governor läuft und ein Request-Slot frei ist"""
+        await self._running.wait()
+        async with self._semaphore:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            yield
+    
+    async def run_hedged(self, make_request, endpoint: str) -> Tuple[Optional[int], Any, str]:
+        """
+        Führt make_request(started) aus. Läuft der Request länger als das p95 seiner
+        Endpunkt-Klasse, wird (im Rahmen des Hedge-Budgets) ein Duplikat gestartet;
+        die erste erfolgreiche Antwort gewinnt, der andere Request wird abgebrochen.
+        """
+        self.total_requests += 1
+        if not self.hedging:
+            return await make_request(None)
+        
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(make_request(started))
+        # Die Hedge-Wartezeit zählt erst ab dem Start des Requests, nicht ab dem Warten auf einen Slot
+        start_waiter = asyncio.ensure_future(started.wait())
+        await asyncio.wait({primary, start_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        start_waiter.cancel()
+        delay = self.latency.percentile(endpoint, 95)
+        if delay is not None and not primary.done():
+            await asyncio.wait({primary}, timeout=delay)
+        if delay is None or primary.done() or self.hedged_requests >= self.hedge_budget * self.total_requests:
+            return await primary
+        
+        self.hedged_requests += 1
+        hedge = asyncio.ensure_future(make_request(None))
+        pending = {primary, hedge}
+        result = (None, None, self.token)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result[0] in (200, 401):
+                        if task is hedge and result[0] == 200:
+                            self.hedge_wins += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def handle_unauthorized(self, used_token: str) -> bool:
+        """Erneuert den Token nach einem 401; liefert True wenn der Request wiederholt werden soll"""
+        async with self._refresh_lock:
+            if self.token != used_token:
+                # Ein anderer Request hat den Token bereits erneuert
+                return True
+            if self.auth_failed:
+                return False
+            
+            self.pause()
+            try:
+                log_warn(f"HTTP 401 from ThingsBoard, pausing requests and refreshing token for customer {self.customer_id}")
+                _token_cache.pop(self.customer_id, None)
+                loop = asyncio.get_running_loop()
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    new_token = await loop.run_in_executor(executor, refresh_thingsboard_token, self.customer_id)
+                if not new_token:
+                    self.auth_failed = True
+                    return False
+                self.token = new_token
+                self.refresh_count += 1
+                return True
+            finally:
+                self.resume()
+
+# Governor des laufenden Syncs (wird von fetch_asset_tree gesetzt)
+_request_governor: Optional[RequestGovernor] = None
+
+# Optionales Rate-Limit für alle Governors dieses Prozesses (Objekt mit async acquire())
+_rate_limiter: Optional[Any] = None
+
+def set_request_rate_limiter(rate_limiter: Optional[Any]):
+    """Setzt ein prozessweites Rate-Limit, z.B. ein zwischen Prozessen geteiltes Budget"""
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+async def fetch_with_timeout(session: aiohttp.ClientSession, url: str, headers: Dict, timeout: float,
+                             adaptive: bool = True) -> Optional[Dict]:
+    """Führt einen HTTP-Request mit Timeout aus (über den Request-Governor, falls aktiv)"""
+    governor = _request_governor
+    if governor is None:
+        return await _fetch_once(session, url, headers, timeout)
+    
+    endpoint = classify_endpoint(url)
+    if adaptive:
+        timeout = governor.latency.timeout_for(endpoint, timeout)
+    
+    async def make_request(started: Optional[asyncio.Event]):
+        return await _governed_request(session, url, headers, timeout, governor, endpoint, started)
+    
+    for auth_attempt in range(2):
+        status, data, used_token = await governor.run_hedged(make_request, endpoint)
+        if status == 200:
+            return data
+        if status != 401:
+            return None
+        if auth_attempt > 0:
+            log_warn(f"HTTP 401 for {url}")
+            return None
+        
+        # 401: Token erneuern (außerhalb des Slots) und Request wiederholen
+        if not await governor.handle_unauthorized(used_token):
+            log_warn(f"HTTP 401 for {url}, token refresh not possible")
+            return None
+    
+    return None
+
+async def _governed_request(session: aiohttp.ClientSession, url: str, headers: Dict, timeout: float,
+                            governor: RequestGovernor, endpoint: str,
+                            started: Optional[asyncio.Event] = None) -> Tuple[Optional[int], Any, str]:
+    """Einzelner Request in einem Governor-Slot; liefert (Status, Daten, verwendeter Token)"""
+    with tracing.http_span('GET', url) as span:
+        span.set(endpoint=endpoint, hedge=started is None and governor.hedging)
+        async with governor.slot():
+            span.start_inflight()
+            request_headers = governor.apply_auth(headers)
+            used_token = governor.token
+            if started is not None:
+                started.set()
+            request_start = time.monotonic()
+            try:
+                async with session.get(url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    span.set(status=response.status)
+                    if response.status == 200:
+                        data = await response.json()
+                        governor.latency.record(endpoint, time.monotonic() - request_start)
+                        return 200, data, used_token
+                    if response.status != 401:
+                        log_warn(f"HTTP {response.status} for {url}")
+                    return response.status, None, used_token
+            except asyncio.TimeoutError:
+                # Zensierte Messung: der Request hat mindestens so lange gedauert
+                governor.latency.record(endpoint, timeout)
+                span.set(error='timeout')
+                log_warn(f"Timeout after {timeout}s for {url}")
+                return None, None, used_token
+            except Exception as e:
+                log_warn(f"Error fetching {url}: {e}")
+                return None, None, used_token
+
+async def _fetch_once(session: aiohttp.ClientSession, url: str, headers: Dict, timeout: int) -> Optional[Dict]:
+    """Einzelner HTTP-Request ohne Governor"""
+    with tracing.http_span('GET', url) as span:
+        try:
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                span.set(status=response.status)
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    log_warn(f"HTTP {response.status} for {url}")
+                    return None
+        except asyncio.TimeoutError:
+            span.set(error='timeout')
+            log_warn(f"Timeout after {timeout}s for {url}")
+            return None
+        except Exception as e:
+            log_warn(f"Error fetching {url}: {e}")
+            return None
 
 async def fetch_with_retry(session: aiohttp.ClientSession, url: str, headers: Dict, 
                           base_timeout: int, max_retries: int, asset_name: str, 
                           session_id: str, request_type: str) -> Optional[List]:
-    """Führt einen HTTP-Request mit Retry-Logik aus"""
+    """Führt einen HTTP-Request mit Retry-Logik aus; liefert None wenn alle Versuche fehlschlagen"""
     for attempt in range(max_retries + 1):
-        timeout = base_timeout + (attempt * 5000)  # 15s, 20s, 25s
+        timeout = base_timeout + (attempt * 5)  # 15s, 20s, 25s
         
         try:
-            result = await fetch_with_timeout(session, url, headers, timeout)
+            # Erster Versuch mit adaptivem Timeout, Retries mit den festen, wachsenden Timeouts
+            result = await fetch_with_timeout(session, url, headers, timeout, adaptive=(attempt == 0))
             if result is not None:
                 if attempt > 0:
                     log_info(f"{request_type} erfolgreich nach {attempt} Retry(s) für {asset_name}", {
@@ -209,18 +739,22 @@ async def fetch_with_retry(session: aiohttp.ClientSession, url: str, headers: Di
                     'sessionId': session_id,
                     'maxRetries': max_retries + 1
                 })
-                return []
+                return None
     
-    return []
+    # Alle Versuche fehlgeschlagen (None unterscheidet Fehler von "keine Relations")
+    return None
 
 async def fetch_asset_attributes(session: aiohttp.ClientSession, asset_id: str, 
-                                 tb_token: str, session_id: str) -> Dict:
-    """Holt Asset-Attribute von ThingsBoard"""
+                                 tb_token: str, session_id: str) -> Optional[Dict]:
+    """Holt Asset-Attribute von ThingsBoard; None wenn der Request fehlschlägt"""
     url = f"{THINGSBOARD_URL}/api/plugins/telemetry/ASSET/{asset_id}/values/attributes"
     headers = {'X-Authorization': f'Bearer {tb_token}'}
     
     attributes = await fetch_with_timeout(session, url, headers, ATTRIBUTES_TIMEOUT)
     
+    if attributes is None:
+        # Request fehlgeschlagen (wird im Checkpoint-Journal nicht gespeichert)
+        return None
     if not attributes:
         return {}
     
@@ -269,20 +803,234 @@ def build_sub_tree(asset: Dict, asset_map: Dict[str, Dict]) -> Dict:
     
     return node
 
-async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
-    """Holt und baut die Asset-Struktur auf"""
-    session_id = start_structure_creation_log(customer_id)
+def create_asset_entry(asset: Dict) -> Dict:
+    """Erstellt den Asset-Map-Eintrag für ein ThingsBoard-Asset"""
+    return {
+        'id': asset['id']['id'],
+        'name': asset['name'],
+        'type': asset.get('type', ''),
+        'label': asset.get('label', ''),
+        'children': [],
+        'parentId': None,
+        'hasDevices': False,
+        'relatedDevices': [],
+        'operationalMode': None,
+        'childLock': None,
+        'fixValue': None,
+        'maxTemp': None,
+        'minTemp': None,
+        'extTempDevice': None,
+        'overruleMinutes': None,
+        'runStatus': None,
+        'schedulerPlan': None
+    }
+
+async def fetch_device_details_map(session: aiohttp.ClientSession, device_ids: Set[str],
+                                   headers: Dict, session_id: str,
+                                   journal: Optional[SyncJournal] = None) -> Dict[str, Dict]:
+    """Holt die Device-Details für alle übergebenen Device-IDs"""
+    device_details_map = {}
+    if not device_ids:
+        return device_details_map
+    
+    log_info(f"Fetching details for {len(device_ids)} devices", {'sessionId': session_id})
+    device_tasks = []
+    for device_id in device_ids:
+        device_url = f"{THINGSBOARD_URL}/api/device/{device_id}"
+        task = asyncio.ensure_future(journaled(
+            journal, f"device:{device_id}",
+            lambda url=device_url: fetch_with_timeout(session, url, headers, DEVICE_DETAILS_TIMEOUT)
+        ))
+        device_tasks.append((device_id, task))
+    
+    for device_id, task in device_tasks:
+        device = await task
+        if device and device.get('id'):
+            device_details_map[device_id] = device
+    
+    log_info(f"Device details received: {len(device_details_map)} successful", {
+        'sessionId': session_id,
+        'successful': len(device_details_map)
+    })
+    return device_details_map
+
+async def fetch_attributes_into_map(session: aiohttp.ClientSession, assets: List[Dict], asset_map: Dict[str, Dict],
+                                    tb_token: str, session_id: str,
+                                    journal: Optional[SyncJournal] = None) -> tuple:
+    """Holt die Asset-Attribute und überträgt sie in die Asset-Map; liefert (erfolgreich, fehlgeschlagen)"""
+    log_info(f"Fetching attributes for {len(assets)} assets", {'sessionId': session_id})
+    attribute_tasks = []
+    for asset in assets:
+        task = asyncio.ensure_future(journaled(
+            journal, f"attributes:{asset['id']['id']}",
+            lambda asset_id=asset['id']['id']: fetch_asset_attributes(session, asset_id, tb_token, session_id)
+        ))
+        attribute_tasks.append((asset, task))
+    
+    attributes_success = 0
+    attributes_failed = 0
+    for asset, task in attribute_tasks:
+        attributes = await task
+        asset_id = asset['id']['id']
+        asset_in_map = asset_map.get(asset_id)
+        
+        if attributes and len(attributes) > 0:
+            for key, value in attributes.items():
+                if asset_in_map:
+                    asset_in_map[key] = value
+            attributes_success += 1
+        else:
+            attributes_failed += 1
+    
+    log_info(f"Asset attributes processed: {attributes_success} successful, {attributes_failed} failed", {
+        'sessionId': session_id,
+        'successful': attributes_success,
+        'failed': attributes_failed
+    })
+    return attributes_success, attributes_failed
+
+def select_parent_relations(asset_id: str, relations_to: List[Dict]) -> List[Dict]:
+    """
+    Filtert die Ergebnisse der toId-Query auf Asset-zu-Asset Contains-Relations, bei denen
+    das Asset wirklich das 'to' ist (Format bereits from=Parent, to=Child)
+    """
+    return [
+        relation for relation in relations_to
+        if relation.get('to', {}).get('id') == asset_id
+        and relation.get('from', {}).get('entityType') == 'ASSET'
+        and relation.get('type') == 'Contains'
+    ]
+
+def link_asset_relations(asset_map: Dict[str, Dict], asset_relations: List[Dict], session_id: str,
+                         verbose: bool = True):
+    """Setzt die Parent-Child-Beziehungen aus Asset-Relations (ein Parent pro Asset, keine Duplikate)"""
+    for relation in asset_relations:
+        if relation.get('to', {}).get('entityType') == 'ASSET' and relation.get('type') == 'Contains':
+            parent_id = relation.get('from', {}).get('id')
+            child_id = relation.get('to', {}).get('id')
+            
+            parent_asset = asset_map.get(parent_id)
+            child_asset = asset_map.get(child_id)
+            
+            if parent_asset and child_asset:
+                # Prüfe auf bestehenden Parent
+                if child_asset['parentId'] and child_asset['parentId'] != parent_id:
+                    if verbose:
+                        log_warn(f"Asset {child_asset['name']} hat bereits einen Parent, überspringe", {
+                            'sessionId': session_id,
+                            'childAssetId': child_id,
+                            'existingParentId': child_asset['parentId'],
+                            'newParentId': parent_id
+                        })
+                    continue
+                
+                # Prüfe auf Duplikat
+                if any(c['id'] == child_id for c in parent_asset['children']):
+                    if verbose:
+                        log_warn(f"Asset {child_asset['name']} ist bereits ein Child", {
+                            'sessionId': session_id,
+                            'childAssetId': child_id,
+                            'parentId': parent_id
+                        })
+                    continue
+                
+                # Setze Parent-Child-Beziehung
+                child_asset['parentId'] = parent_id
+                parent_asset['children'].append(child_asset)
+                
+                if verbose:
+                    log_info(f"Asset-Beziehung erstellt: {parent_asset['name']} enthält {child_asset['name']}", {
+                        'sessionId': session_id,
+                        'parentId': parent_id,
+                        'childId': child_id
+                    })
+
+def build_skeleton_tree(assets: List[Dict], relations: List[tuple], session_id: str) -> List[Dict]:
+    """Baut einen Tree nur aus Assets und Hierarchie (ohne Devices und Attribute)"""
+    asset_map = {asset['id']['id']: create_asset_entry(asset) for asset in assets}
+    for asset_id, relations_from, relations_to in relations:
+        link_asset_relations(asset_map, list(relations_from) + select_parent_relations(asset_id, relations_to),
+                             session_id, verbose=False)
+    return [build_sub_tree(asset, asset_map) for asset in asset_map.values() if not asset['parentId']]
+
+async def fetch_customer_devices(session: aiohttp.ClientSession, customer_id: str,
+                                 headers: Dict, session_id: str) -> Optional[List[Dict]]:
+    """Holt die komplette Device-Liste des Kunden seitenweise; None bei Fehler"""
+    devices = []
+    page = 0
+    while True:
+        url = f"{THINGSBOARD_URL}/api/customer/{customer_id}/devices?pageSize={DEVICE_LIST_PAGE_SIZE}&page={page}"
+        data = await fetch_with_timeout(session, url, headers, DEVICE_LIST_TIMEOUT)
+        if not data or 'data' not in data:
+            log_warn(f"Failed to fetch device list page {page}", {'sessionId': session_id})
+            return None
+        devices.extend(data['data'])
+        if not data.get('hasNext'):
+            break
+        page += 1
+    
+    log_info(f"Fetched {len(devices)} customer devices in {page + 1} page(s)", {'sessionId': session_id})
+    return devices
+
+def apply_device_relations(asset_in_map: Dict, device_relations: List[Dict], device_details_map: Dict[str, Dict]):
+    """Setzt hasDevices und relatedDevices eines Assets aus seinen Device-Relations"""
+    if not device_relations:
+        asset_in_map['hasDevices'] = False
+        asset_in_map['relatedDevices'] = []
+        return
+    
+    asset_in_map['hasDevices'] = True
+    asset_in_map['relatedDevices'] = []
+    for relation in device_relations:
+        device_id = relation.get('to', {}).get('id')
+        device_details = device_details_map.get(device_id)
+        asset_in_map['relatedDevices'].append({
+            'id': device_id,
+            'name': device_details.get('name', 'Unbekannt') if device_details else 'Unbekannt',
+            'type': device_details.get('type', 'Unbekannt') if device_details else 'Unbekannt',
+            'label': device_details.get('label', 'Unbekannt') if device_details else 'Unbekannt'
+        })
+
+async def fetch_asset_tree(customer_id: str, tb_token: str,
+                           unassigned_result: Optional[Dict] = None, progressive: bool = False,
+                           resume_session_id: Optional[str] = None) -> List[Dict]:
+    """
+    Holt und baut die Asset-Struktur auf.
+    Wird ein Dict für unassigned_result übergeben, werden zusätzlich alle Devices des Kunden
+    geladen; bei Erfolg enthält unassigned_result['devices'] die keinem Asset zugeordneten Devices.
+    Mit progressive=True wird sobald die Hierarchie bekannt ist ein Skeleton-Tree
+    (tree_state='partial') gespeichert, bevor Devices und Attribute geladen sind.
+    Abgeschlossene Ergebnisse werden im Checkpoint-Journal der Session gespeichert; mit
+    resume_session_id wird ein abgebrochener Sync fortgesetzt.
+    """
+    global _request_governor
+    cleanup_expired_checkpoints()
+    journal = None
+    if resume_session_id:
+        journal = SyncJournal.resume(resume_session_id, customer_id)
+        log_info(f"Resuming session {resume_session_id} with {len(journal.entries)} checkpointed results")
+    session_id = start_structure_creation_log(customer_id, resume_session_id)
+    if journal is None and CHECKPOINTS_ENABLED:
+        journal = SyncJournal.create(session_id, customer_id)
+    governor = RequestGovernor(customer_id, tb_token)
+    _request_governor = governor
+    completed = False
+    phases = tracing.Phases()
     
     try:
         log_info(f"Starting asset tree fetch for customer {customer_id}", {'sessionId': session_id})
         
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=tracing.aiohttp_trace_configs()) as session:
             # 1. Hole alle Assets
+            phases.next('Assets laden')
             log_info('Fetching assets list from ThingsBoard', {'sessionId': session_id})
             assets_url = f"{THINGSBOARD_URL}/api/customer/{customer_id}/assets?pageSize=10000&page=0"
             headers = {'X-Authorization': f'Bearer {tb_token}'}
             
-            assets_data = await fetch_with_timeout(session, assets_url, headers, ASSET_LIST_TIMEOUT)
+            assets_data = await journaled(
+                journal, 'assets',
+                lambda: fetch_with_timeout(session, assets_url, headers, ASSET_LIST_TIMEOUT)
+            )
             if not assets_data or 'data' not in assets_data:
                 raise ValueError("Failed to fetch assets")
             
@@ -292,28 +1040,10 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
             # 2. Erstelle Asset-Map
             asset_map = {}
             for asset in assets:
-                asset_id = asset['id']['id']
-                asset_map[asset_id] = {
-                    'id': asset_id,
-                    'name': asset['name'],
-                    'type': asset.get('type', ''),
-                    'label': asset.get('label', ''),
-                    'children': [],
-                    'parentId': None,
-                    'hasDevices': False,
-                    'relatedDevices': [],
-                    'operationalMode': None,
-                    'childLock': None,
-                    'fixValue': None,
-                    'maxTemp': None,
-                    'minTemp': None,
-                    'extTempDevice': None,
-                    'overruleMinutes': None,
-                    'runStatus': None,
-                    'schedulerPlan': None
-                }
+                asset_map[asset['id']['id']] = create_asset_entry(asset)
             
             # 3. Hole Relations für alle Assets (mit Retry)
+            phases.next('Relations laden', assets=len(assets))
             log_info(f"Fetching relations for {len(assets)} assets", {'sessionId': session_id})
             relation_tasks = []
             for asset in assets:
@@ -322,32 +1052,62 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
                 
                 # Asset-Relations (fromId = Asset als Parent)
                 asset_relations_url = f"{THINGSBOARD_URL}/api/relations/info?fromId={asset_id}&fromType=ASSET"
-                task1 = fetch_with_retry(session, asset_relations_url, headers, 
-                                        RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
-                                        asset_name, session_id, "Asset-Relations (fromId)")
+                task1 = asyncio.ensure_future(journaled(
+                    journal, f"relations:from:{asset_id}",
+                    lambda url=asset_relations_url, name=asset_name: fetch_with_retry(
+                        session, url, headers, RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
+                        name, session_id, "Asset-Relations (fromId)")
+                ))
                 
                 # Asset-Relations (toId = Asset als Child) - WICHTIG für Assets die nur als Child existieren
                 asset_relations_to_url = f"{THINGSBOARD_URL}/api/relations/info?toId={asset_id}&toType=ASSET"
-                task1b = fetch_with_retry(session, asset_relations_to_url, headers,
-                                         RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
-                                         asset_name, session_id, "Asset-Relations (toId)")
+                task1b = asyncio.ensure_future(journaled(
+                    journal, f"relations:to:{asset_id}",
+                    lambda url=asset_relations_to_url, name=asset_name: fetch_with_retry(
+                        session, url, headers, RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
+                        name, session_id, "Asset-Relations (toId)")
+                ))
                 
                 # Device-Relations
                 device_relations_url = f"{THINGSBOARD_URL}/api/relations/info?fromId={asset_id}&fromType=ASSET&relationType=Contains&toType=DEVICE"
-                task2 = fetch_with_retry(session, device_relations_url, headers,
-                                        RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
-                                        asset_name, session_id, "Device-Relations")
+                task2 = asyncio.ensure_future(journaled(
+                    journal, f"relations:devices:{asset_id}",
+                    lambda url=device_relations_url, name=asset_name: fetch_with_retry(
+                        session, url, headers, RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
+                        name, session_id, "Device-Relations")
+                ))
                 
                 relation_tasks.append((asset, task1, task1b, task2))
             
+            # Skeleton veröffentlichen, sobald die Asset-Hierarchie bekannt ist
+            if progressive:
+                await asyncio.gather(*(task for _, task_from, task_to, _ in relation_tasks for task in (task_from, task_to)))
+                if governor.auth_failed:
+                    raise ValueError(f"ThingsBoard authentication failed for customer {customer_id}, token could not be refreshed")
+                skeleton = build_skeleton_tree(assets, [
+                    (asset['id']['id'], task_from.result() or [], task_to.result() or [])
+                    for asset, task_from, task_to, _ in relation_tasks
+                ], session_id)
+                loop = asyncio.get_running_loop()
+                if await loop.run_in_executor(None, can_publish_skeleton, customer_id):
+                    # Im Executor speichern, damit die laufenden Device-Requests weiterlaufen
+                    await loop.run_in_executor(None, save_tree_to_db, customer_id, skeleton, TREE_STATE_PARTIAL)
+                    log_info(f"Skeleton tree published with {len(skeleton)} root assets", {'sessionId': session_id})
+                else:
+                    log_info("Complete tree already stored, skipping skeleton", {'sessionId': session_id})
+            
             # Warte auf alle Relations
             all_device_ids = set()
             relations_results = []
+            device_relation_failures = 0
             
             for asset, asset_task_from, asset_task_to, device_task in relation_tasks:
                 asset_relations_from = await asset_task_from or []
                 asset_relations_to = await asset_task_to or []
-                device_relations = await device_task or []
+                device_relations = await device_task
+                if device_relations is None:
+                    device_relation_failures += 1
+                    device_relations = []
                 
                 asset_id = asset['id']['id']
                 asset_name = asset['name']
@@ -394,22 +1154,14 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
                 # Füge toId Relations hinzu (bereits im richtigen Format: from=Parent, to=Child)
                 # Die toId-Query gibt ALLE Relations zurück, bei denen toId das Asset ist
                 # Wir müssen filtern, um nur die zu behalten, wo das Asset wirklich das 'to' ist
-                for to_relation in asset_relations_to:
-                    # Prüfe zuerst, ob das to-Asset wirklich das aktuelle Asset ist
-                    to_asset_id = to_relation.get('to', {}).get('id')
-                    if to_asset_id != asset_id:
-                        # Diese Relation gehört nicht zu diesem Asset, überspringe
-                        continue
-                    
-                    # Jetzt prüfe, ob es eine Asset-zu-Asset Contains-Relation ist
-                    if to_relation.get('from', {}).get('entityType') == 'ASSET' and to_relation.get('type') == 'Contains':
-                        combined_asset_relations.append(to_relation)
-                        log_info(f"Found parent relation for {asset_name} via toId query", {
-                            'sessionId': session_id,
-                            'assetId': asset_id,
-                            'parentId': to_relation.get('from', {}).get('id'),
-                            'parentName': to_relation.get('from', {}).get('name', 'Unknown')
-                        })
+                for to_relation in select_parent_relations(asset_id, asset_relations_to):
+                    combined_asset_relations.append(to_relation)
+                    log_info(f"Found parent relation for {asset_name} via toId query", {
+                        'sessionId': session_id,
+                        'assetId': asset_id,
+                        'parentId': to_relation.get('from', {}).get('id'),
+                        'parentName': to_relation.get('from', {}).get('name', 'Unknown')
+                    })
                 
                 # Filtere nur Device-Entities
                 device_relations = [r for r in device_relations if r.get('to', {}).get('entityType') == 'DEVICE']
@@ -428,55 +1180,39 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
             
             log_info(f"Found {len(all_device_ids)} unique device IDs", {'sessionId': session_id})
             
+            # 3b. Nicht zugeordnete Devices: komplette Device-Liste gegen die zugeordneten IDs abgleichen
+            if unassigned_result is not None:
+                phases.next('Nicht zugeordnete Devices')
+                if device_relation_failures > 0:
+                    # Ohne vollständige Relations wären zugeordnete Devices fälschlich "nicht zugeordnet"
+                    log_warn(f"Skipping unassigned device detection, {device_relation_failures} device relation requests failed", {
+                        'sessionId': session_id
+                    })
+                else:
+                    customer_devices = await fetch_customer_devices(session, customer_id, headers, session_id)
+                    if customer_devices is not None:
+                        unassigned_devices = [
+                            d for d in customer_devices if d.get('id', {}).get('id') not in all_device_ids
+                        ]
+                        unassigned_result['devices'] = unassigned_devices
+                        log_info(f"Found {len(unassigned_devices)} unassigned devices", {
+                            'sessionId': session_id,
+                            'customerDevices': len(customer_devices),
+                            'unassignedDevices': len(unassigned_devices)
+                        })
+            
             # 4. Hole Device-Details
-            device_details_map = {}
-            if all_device_ids:
-                log_info(f"Fetching details for {len(all_device_ids)} devices", {'sessionId': session_id})
-                device_tasks = []
-                for device_id in all_device_ids:
-                    device_url = f"{THINGSBOARD_URL}/api/device/{device_id}"
-                    task = fetch_with_timeout(session, device_url, headers, DEVICE_DETAILS_TIMEOUT)
-                    device_tasks.append((device_id, task))
-                
-                for device_id, task in device_tasks:
-                    device = await task
-                    if device and device.get('id'):
-                        device_details_map[device_id] = device
-                
-                log_info(f"Device details received: {len(device_details_map)} successful", {
-                    'sessionId': session_id,
-                    'successful': len(device_details_map)
-                })
+            phases.next('Device-Details laden', devices=len(all_device_ids))
+            device_details_map = await fetch_device_details_map(session, all_device_ids, headers, session_id, journal)
             
             # 5. Hole Asset-Attribute
-            log_info(f"Fetching attributes for {len(assets)} assets", {'sessionId': session_id})
-            attribute_tasks = []
-            for asset in assets:
-                task = fetch_asset_attributes(session, asset['id']['id'], tb_token, session_id)
-                attribute_tasks.append((asset, task))
-            
-            attributes_success = 0
-            attributes_failed = 0
-            for asset, task in attribute_tasks:
-                attributes = await task
-                asset_id = asset['id']['id']
-                asset_in_map = asset_map.get(asset_id)
-                
-                if attributes and len(attributes) > 0:
-                    for key, value in attributes.items():
-                        if asset_in_map:
-                            asset_in_map[key] = value
-                    attributes_success += 1
-                else:
-                    attributes_failed += 1
-            
-            log_info(f"Asset attributes processed: {attributes_success} successful, {attributes_failed} failed", {
-                'sessionId': session_id,
-                'successful': attributes_success,
-                'failed': attributes_failed
-            })
+            phases.next('Asset-Attribute laden')
+            attributes_success, attributes_failed = await fetch_attributes_into_map(
+                session, assets, asset_map, tb_token, session_id, journal
+            )
             
             # 6. Verarbeite Relations
+            phases.next('Relations verarbeiten')
             for result in relations_results:
                 asset = result['asset']
                 asset_id = asset['id']['id']
@@ -496,67 +1232,23 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
                 })
                 
                 # Setze Devices
+                apply_device_relations(asset_in_map, device_relations, device_details_map)
                 if device_relations:
-                    asset_in_map['hasDevices'] = True
-                    asset_in_map['relatedDevices'] = []
-                    for relation in device_relations:
-                        device_id = relation.get('to', {}).get('id')
-                        device_details = device_details_map.get(device_id)
-                        asset_in_map['relatedDevices'].append({
-                            'id': device_id,
-                            'name': device_details.get('name', 'Unbekannt') if device_details else 'Unbekannt',
-                            'type': device_details.get('type', 'Unbekannt') if device_details else 'Unbekannt',
-                            'label': device_details.get('label', 'Unbekannt') if device_details else 'Unbekannt'
-                        })
                     log_info(f"Asset {asset['name']} has {len(asset_in_map['relatedDevices'])} devices", {
                         'sessionId': session_id,
                         'assetId': asset_id,
                         'deviceCount': len(asset_in_map['relatedDevices'])
                     })
-                else:
-                    asset_in_map['hasDevices'] = False
-                    asset_in_map['relatedDevices'] = []
                 
                 # Verarbeite Asset-Relations
-                for relation in asset_relations:
-                    if relation.get('to', {}).get('entityType') == 'ASSET' and relation.get('type') == 'Contains':
-                        parent_id = relation.get('from', {}).get('id')
-                        child_id = relation.get('to', {}).get('id')
-                        
-                        parent_asset = asset_map.get(parent_id)
-                        child_asset = asset_map.get(child_id)
-                        
-                        if parent_asset and child_asset:
-                            # Prüfe auf bestehenden Parent
-                            if child_asset['parentId'] and child_asset['parentId'] != parent_id:
-                                log_warn(f"Asset {child_asset['name']} hat bereits einen Parent, überspringe", {
-                                    'sessionId': session_id,
-                                    'childAssetId': child_id,
-                                    'existingParentId': child_asset['parentId'],
-                                    'newParentId': parent_id
-                                })
-                                continue
-                            
-                            # Prüfe auf Duplikat
-                            if any(c['id'] == child_id for c in parent_asset['children']):
-                                log_warn(f"Asset {child_asset['name']} ist bereits ein Child", {
-                                    'sessionId': session_id,
-                                    'childAssetId': child_id,
-                                    'parentId': parent_id
-                                })
-                                continue
-                            
-                            # Setze Parent-Child-Beziehung
-                            child_asset['parentId'] = parent_id
-                            parent_asset['children'].append(child_asset)
-                            
-                            log_info(f"Asset-Beziehung erstellt: {parent_asset['name']} enthält {child_asset['name']}", {
-                                'sessionId': session_id,
-                                'parentId': parent_id,
-                                'childId': child_id
-                            })
+                link_asset_relations(asset_map, asset_relations, session_id)
+            
+            # Ein ungültiger Token darf keinen leeren Tree erzeugen
+            if governor.auth_failed:
+                raise ValueError(f"ThingsBoard authentication failed for customer {customer_id}, token could not be refreshed")
             
             # 7. Baue Tree aus Root-Assets
+            phases.next('Tree aufbauen')
             root_assets = [asset for asset in asset_map.values() if not asset['parentId']]
             log_info(f"Building tree from {len(root_assets)} root assets", {'sessionId': session_id})
             
@@ -581,7 +1273,12 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
                 'attributesFailed': attributes_failed,
                 'assetsWithChildren': len(assets_with_children),
                 'assetsWithParent': len(assets_with_parent),
-                'orphanedAssets': len(orphaned_assets)
+                'orphanedAssets': len(orphaned_assets),
+                'tokenRefreshes': governor.refresh_count,
+                'requests': governor.total_requests,
+                'hedgedRequests': governor.hedged_requests,
+                'hedgeWins': governor.hedge_wins,
+                'latency': governor.latency.summary()
             }
             
             end_structure_creation_log(session_id, summary)
@@ -593,15 +1290,308 @@ async def fetch_asset_tree(customer_id: str, tb_token: str) -> List[Dict]:
                     'orphanedCount': summary['orphanedAssets']
                 })
             
+            completed = True
             return tree
             
     except Exception as e:
         log_error('Error fetching asset tree', e)
         end_structure_creation_log(session_id, {'error': str(e)})
+        if journal is not None:
+            log_info(f"Checkpoints kept, continue with --resume {session_id}", {'sessionId': session_id})
+        raise
+    finally:
+        phases.close()
+        _request_governor = None
+        if journal is not None:
+            # Nach erfolgreichem Sync wird das Journal nicht mehr benötigt
+            journal.close(remove=completed)
+
+async def fetch_asset_subtree(customer_id: str, tb_token: str, root_asset_id: str) -> Dict:
+    """Holt und baut nur den Teilbaum unterhalb von root_asset_id auf (Aufwand proportional zum Teilbaum)"""
+    global _request_governor
+    session_id = start_structure_creation_log(customer_id)
+    governor = RequestGovernor(customer_id, tb_token)
+    _request_governor = governor
+    
+    try:
+        log_info(f"Starting subtree fetch below asset {root_asset_id}", {'sessionId': session_id, 'rootAssetId': root_asset_id})
+        
+        async with aiohttp.ClientSession(trace_configs=tracing.aiohttp_trace_configs()) as session:
+            headers = {'X-Authorization': f'Bearer {tb_token}'}
+            
+            # 1. Traversiere die Contains-Relations ebenenweise ab dem Root-Asset
+            assets = []
+            asset_map = {}
+            device_relations_by_asset = {}
+            child_ids_by_asset = {}
+            frontier = [root_asset_id]
+            
+            while frontier:
+                level_tasks = []
+                for asset_id in frontier:
+                    asset_url = f"{THINGSBOARD_URL}/api/asset/{asset_id}"
+                    asset_relations_url = f"{THINGSBOARD_URL}/api/relations/info?fromId={asset_id}&fromType=ASSET"
+                    device_relations_url = f"{THINGSBOARD_URL}/api/relations/info?fromId={asset_id}&fromType=ASSET&relationType=Contains&toType=DEVICE"
+                    level_tasks.append((
+                        asset_id,
+                        asyncio.ensure_future(fetch_with_timeout(session, asset_url, headers, DEVICE_DETAILS_TIMEOUT)),
+                        asyncio.ensure_future(fetch_with_retry(session, asset_relations_url, headers,
+                                                               RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
+                                                               asset_id, session_id, "Asset-Relations (fromId)")),
+                        asyncio.ensure_future(fetch_with_retry(session, device_relations_url, headers,
+                                                               RELATION_TIMEOUT_BASE, RELATION_MAX_RETRIES,
+                                                               asset_id, session_id, "Device-Relations"))
+                    ))
+                
+                next_frontier = []
+                for asset_id, asset_task, relations_task, devices_task in level_tasks:
+                    asset = await asset_task
+                    asset_relations = await relations_task or []
+                    device_relations = await devices_task or []
+                    
+                    if not asset or not asset.get('id'):
+                        if asset_id == root_asset_id:
+                            raise ValueError(f"Failed to fetch root asset {root_asset_id}")
+                        log_warn(f"Asset {asset_id} konnte nicht geladen werden, überspringe", {'sessionId': session_id})
+                        continue
+                    
+                    assets.append(asset)
+                    asset_map[asset_id] = create_asset_entry(asset)
+                    device_relations_by_asset[asset_id] = [
+                        r for r in device_relations if r.get('to', {}).get('entityType') == 'DEVICE'
+                    ]
+                    
+                    child_ids = []
+                    for relation in asset_relations:
+                        child_id = relation.get('to', {}).get('id')
+                        if (relation.get('to', {}).get('entityType') == 'ASSET' and relation.get('type') == 'Contains'
+                                and child_id and child_id not in asset_map and child_id not in child_ids):
+                            child_ids.append(child_id)
+                    child_ids_by_asset[asset_id] = child_ids
+                    next_frontier.extend(child_ids)
+                
+                # Schutz vor Zyklen und Mehrfach-Parents
+                frontier = list(dict.fromkeys(c for c in next_frontier if c not in asset_map))
+            
+            log_info(f"Subtree contains {len(assets)} assets", {'sessionId': session_id, 'assetCount': len(assets)})
+            
+            # 2. Devices und Attribute nur für den Teilbaum
+            all_device_ids = set()
+            for device_relations in device_relations_by_asset.values():
+                for relation in device_relations:
+                    device_id = relation.get('to', {}).get('id')
+                    if device_id:
+                        all_device_ids.add(device_id)
+            
+            device_details_map = await fetch_device_details_map(session, all_device_ids, headers, session_id)
+            attributes_success, attributes_failed = await fetch_attributes_into_map(
+                session, assets, asset_map, tb_token, session_id
+            )
+            
+            if governor.auth_failed:
+                raise ValueError(f"ThingsBoard authentication failed for customer {customer_id}, token could not be refreshed")
+            
+            # 3. Verknüpfe Parent/Child und Devices
+            for asset_id, asset_in_map in asset_map.items():
+                apply_device_relations(asset_in_map, device_relations_by_asset.get(asset_id, []), device_details_map)
+                for child_id in child_ids_by_asset.get(asset_id, []):
+                    child_asset = asset_map.get(child_id)
+                    if child_asset and not child_asset['parentId'] and child_id != root_asset_id:
+                        child_asset['parentId'] = asset_id
+                        asset_in_map['children'].append(child_asset)
+            
+            subtree = build_sub_tree(asset_map[root_asset_id], asset_map)
+            
+            summary = {
+                'rootAssetId': root_asset_id,
+                'totalAssets': len(assets),
+                'totalDevices': len(all_device_ids),
+                'devicesWithDetails': len(device_details_map),
+                'attributesSuccessful': attributes_success,
+                'attributesFailed': attributes_failed,
+                'tokenRefreshes': governor.refresh_count
+            }
+            end_structure_creation_log(session_id, summary)
+            log_info("Subtree created successfully", {'sessionId': session_id, 'summary': summary})
+            return subtree
+            
+    except Exception as e:
+        log_error('Error fetching asset subtree', e)
+        end_structure_creation_log(session_id, {'error': str(e)})
         raise
+    finally:
+        _request_governor = None
+
+async def fetch_room_snapshots(customer_id: str, tb_token: str, tree: List[Dict]) -> List[Dict]:
+    """
+    Lädt die letzte Telemetrie aller Devices im Tree in Batches (begrenzt durch den Request-Governor)
+    und berechnet daraus pro Asset den Raum-Snapshot (siehe room_snapshots.py).
+    """
+    global _request_governor
+    nodes = list(iter_snapshot_nodes(tree))
+    device_ids = sorted({device_id for node in nodes for device_id in snapshot_device_ids(node)})
+    keys = ','.join(TELEMETRY_FIELDS)
+    governor = RequestGovernor(customer_id, tb_token)
+    _request_governor = governor
+    started = time.time()
+    telemetry = {}
+    failed = 0
+    
+    try:
+        log_info(f"Fetching latest telemetry for {len(device_ids)} devices in {len(nodes)} assets")
+        async with aiohttp.ClientSession(trace_configs=tracing.aiohttp_trace_configs()) as session:
+            headers = {'X-Authorization': f'Bearer {tb_token}'}
+            for start in range(0, len(device_ids), SNAPSHOT_BATCH_SIZE):
+                batch = device_ids[start:start + SNAPSHOT_BATCH_SIZE]
+                results = await asyncio.gather(*(
+                    fetch_with_timeout(session,
+                                       f"{THINGSBOARD_URL}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries?keys={keys}",
+                                       headers, SNAPSHOT_TELEMETRY_TIMEOUT)
+                    for device_id in batch
+                ))
+                for device_id, data in zip(batch, results):
+                    if data is None:
+                        failed += 1
+                    else:
+                        telemetry[device_id] = map_latest_telemetry(data)
+        
+        if governor.auth_failed:
+            raise RuntimeError(f"ThingsBoard authentication failed for customer {customer_id} (token refresh not possible)")
+    finally:
+        _request_governor = None
+    
+    snapshots = [build_room_snapshot(node, telemetry) for node in nodes]
+    log_info(f"Built {len(snapshots)} room snapshots", {
+        'devices': len(device_ids),
+        'telemetryFailed': failed,
+        'requests': governor.total_requests,
+        'durationSeconds': round(time.time() - started, 2)
+    })
+    return snapshots
+
+def can_publish_skeleton(customer_id: str) -> bool:
+    """Ein Skeleton darf nur einen leeren oder selbst partiellen Tree überschreiben"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT LEN(CAST(tree AS NVARCHAR(MAX))), tree_state
+            FROM customer_settings 
+            WHERE customer_id = ?
+        """, (customer_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return not row or not row[0] or row[0] <= 2 or row[1] == TREE_STATE_PARTIAL
+
+def count_tree_nodes(tree: List[Dict]) -> int:
+    count = 0
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children', []))
+    return count
+
+def has_tree_state_column(cursor) -> bool:
+    """customer_settings.tree_state vorhanden (add_tree_state_column.sql)"""
+    cursor.execute("SELECT COL_LENGTH('customer_settings', 'tree_state')")
+    return cursor.fetchone()[0] is not None
+
+def record_tree_version(cursor, customer_id: str, tree: List[Dict]) -> Optional[int]:
+    """
+    Legt einen neuen Eintrag in customer_tree_history an (Snapshot + Diff zur Vorversion).
+    Läuft in der Transaktion des Aufrufers; ohne Änderung wird keine Version angelegt.
+    Ohne Tabelle (create_tree_history_table.sql) wird die Historie übersprungen.
+    """
+    cursor.execute("SELECT OBJECT_ID('customer_tree_history', 'U')")
+    if cursor.fetchone()[0] is None:
+        log_warn("Table customer_tree_history not found, skipping tree history")
+        return None
+    
+    cursor.execute("""
+        SELECT TOP 1 version, snapshot, encoding
+        FROM customer_tree_history WITH (UPDLOCK)
+        WHERE customer_id = ?
+        ORDER BY version DESC
+    """, (customer_id,))
+    row = cursor.fetchone()
+    previous_version = row[0] if row else 0
+    previous_tree = decode_snapshot(bytes(row[1]), row[2]) if row else []
+    
+    diff = diff_trees(previous_tree, tree)
+    if row and is_empty_diff(diff):
+        log_info(f"Tree unchanged since version {previous_version}, no new history entry")
+        return previous_version
+    
+    snapshot, encoding = encode_snapshot(tree)
+    version = previous_version + 1
+    cursor.execute("""
+        INSERT INTO customer_tree_history (customer_id, version, snapshot, encoding, diff, node_count)
+        VALUES (?, ?, ?, ?, CAST(? AS NVARCHAR(MAX)), ?)
+    """, (customer_id, version, pyodbc.Binary(snapshot), encoding,
+          json.dumps(diff, ensure_ascii=False), count_tree_nodes(tree)))
+    log_info(f"Tree version {version} recorded for customer {customer_id}",
+             {'snapshotBytes': len(snapshot), 'encoding': encoding, 'changes': summarize_diff(diff)})
+    return version
+
+def get_tree_changes_since(customer_id: str, since_version: int) -> Dict:
+    """Liefert alle Diffs nach since_version in Reihenfolge, damit Clients nicht den ganzen Tree laden müssen"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT version, diff, created_at
+            FROM customer_tree_history
+            WHERE customer_id = ? AND version > ?
+            ORDER BY version
+        """, (customer_id, since_version))
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return {
+        'customerId': customer_id,
+        'sinceVersion': since_version,
+        'currentVersion': rows[-1][0] if rows else since_version,
+        'changes': [
+            {'version': row[0], 'createdAt': row[2].isoformat() if row[2] else None, 'diff': json.loads(row[1])}
+            for row in rows
+        ]
+    }
+
+def load_tree_version(customer_id: str, version: int) -> List[Dict]:
+    """Dekodiert den Snapshot einer gespeicherten Tree-Version"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT snapshot, encoding
+            FROM customer_tree_history
+            WHERE customer_id = ? AND version = ?
+        """, (customer_id, version))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    if not row:
+        raise ValueError(f"Tree version {version} not found for customer {customer_id}")
+    return decode_snapshot(bytes(row[0]), row[1])
 
-def save_tree_to_db(customer_id: str, tree: List[Dict]):
-    """Speichert den Tree in die customer_settings Tabelle"""
+def rollback_tree(customer_id: str, version: int):
+    """Stellt eine frühere Tree-Version wieder her; die Wiederherstellung wird als neue Version gespeichert"""
+    tree = load_tree_version(customer_id, version)
+    log_info(f"Rolling back tree of customer {customer_id} to version {version}", {'rootAssets': len(tree)})
+    return save_tree_to_db(customer_id, tree, TREE_STATE_COMPLETE)
+
+def save_tree_to_db(customer_id: str, tree: List[Dict], tree_state: str = TREE_STATE_COMPLETE):
+    """
+    Speichert den Tree in die customer_settings Tabelle.
+    tree_state ('partial'/'complete') wird geschrieben sobald die Spalte existiert
+    (add_tree_state_column.sql); jeder vollständige Tree ersetzt so ein 'partial' eines
+    abgebrochenen progressiven Syncs.
+    """
     try:
         log_info(f"Starting to save tree to database for customer {customer_id}")
         log_info(f"Tree has {len(tree)} root nodes")
@@ -632,13 +1622,25 @@ def save_tree_to_db(customer_id: str, tree: List[Dict]):
         else:
             log_info(f"No existing entry found for customer {customer_id}, will INSERT")
         
+        if not has_tree_state_column(cursor):
+            if tree_state == TREE_STATE_PARTIAL:
+                raise ValueError("Column customer_settings.tree_state missing, run add_tree_state_column.sql")
+            tree_state = None
+        
         # Versuche UPDATE mit explizitem NVARCHAR(MAX) Cast
         log_info("Attempting UPDATE...")
-        cursor.execute("""
-            UPDATE customer_settings 
-            SET tree = CAST(? AS NVARCHAR(MAX)), tree_updated = GETDATE()
-            WHERE customer_id = ?
-        """, (tree_json, customer_id))
+        if tree_state:
+            cursor.execute("""
+                UPDATE customer_settings 
+                SET tree = CAST(? AS NVARCHAR(MAX)), tree_updated = GETDATE(), tree_state = ?
+                WHERE customer_id = ?
+            """, (tree_json, tree_state, customer_id))
+        else:
+            cursor.execute("""
+                UPDATE customer_settings 
+                SET tree = CAST(? AS NVARCHAR(MAX)), tree_updated = GETDATE()
+                WHERE customer_id = ?
+            """, (tree_json, customer_id))
         
         rows_updated = cursor.rowcount
         log_info(f"UPDATE affected {rows_updated} rows")
@@ -646,14 +1648,27 @@ def save_tree_to_db(customer_id: str, tree: List[Dict]):
         if rows_updated == 0:
             # INSERT wenn kein Eintrag existiert
             log_info("No rows updated, attempting INSERT...")
-            cursor.execute("""
-                INSERT INTO customer_settings (customer_id, tree, tree_updated)
-                VALUES (?, CAST(? AS NVARCHAR(MAX)), GETDATE())
-            """, (customer_id, tree_json))
+            if tree_state:
+                cursor.execute("""
+                    INSERT INTO customer_settings (customer_id, tree, tree_updated, tree_state)
+                    VALUES (?, CAST(? AS NVARCHAR(MAX)), GETDATE(), ?)
+                """, (customer_id, tree_json, tree_state))
+            else:
+                cursor.execute("""
+                    INSERT INTO customer_settings (customer_id, tree, tree_updated)
+                    VALUES (?, CAST(? AS NVARCHAR(MAX)), GETDATE())
+                """, (customer_id, tree_json))
             log_info("INSERT executed successfully")
         else:
             log_info("UPDATE executed successfully")
         
+        # Skeleton-Trees (partial) werden nicht versioniert
+        if tree_state != TREE_STATE_PARTIAL:
+            try:
+                record_tree_version(cursor, customer_id, tree)
+            except Exception as e:
+                log_warn(f"Could not record tree version: {e}")
+        
         conn.commit()
         log_info("Transaction committed")
         
@@ -684,6 +1699,197 @@ def save_tree_to_db(customer_id: str, tree: List[Dict]):
         log_error(f"Traceback: {traceback.format_exc()}")
         raise
 
+def save_unassigned_devices_to_db(customer_id: str, devices: List[Dict]):
+    """
+    Ersetzt die nicht zugeordneten Devices des Kunden in unassigned_devices in einer Transaktion.
+    Die Zeilen werden per fast_executemany in eine temporäre Tabelle geladen und mit einem MERGE
+    übernommen; nicht mehr vorhandene Einträge des Kunden werden gelöscht.
+    """
+    rows = [
+        (device['id']['id'], json.dumps(device, ensure_ascii=False))
+        for device in devices
+    ]
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE #unassigned_stage (
+                device_id NVARCHAR(36) NOT NULL PRIMARY KEY,
+                device_data NVARCHAR(MAX) NOT NULL
+            )
+        """)
+        if rows:
+            cursor.fast_executemany = True
+            cursor.executemany("""
+                INSERT INTO #unassigned_stage (device_id, device_data) VALUES (?, ?)
+            """, rows)
+        
+        # server_attributes bleibt bei bestehenden Einträgen erhalten (wird von der Web-App gepflegt)
+        cursor.execute("""
+            MERGE unassigned_devices AS target
+            USING #unassigned_stage AS source
+            ON target.device_id = source.device_id AND target.customer_id = ?
+            WHEN MATCHED THEN
+                UPDATE SET device_data = source.device_data, last_sync = GETDATE()
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (device_id, customer_id, device_data, server_attributes, last_sync)
+                VALUES (source.device_id, ?, source.device_data, NULL, GETDATE())
+            WHEN NOT MATCHED BY SOURCE AND target.customer_id = ? THEN
+                DELETE;
+        """, (customer_id, customer_id, customer_id))
+        cursor.execute("DROP TABLE #unassigned_stage")
+        conn.commit()
+        cursor.close()
+        log_info(f"Saved {len(rows)} unassigned devices to database for customer {customer_id}")
+        return True
+    except Exception as e:
+        conn.rollback()
+        log_error(f"Error saving unassigned devices to database: {e}", e)
+        raise
+    finally:
+        conn.close()
+
+def save_room_snapshots_to_db(customer_id: str, snapshots: List[Dict]):
+    """
+    Ersetzt die Raum-Snapshots des Kunden in asset_heating_snapshots (MERGE über eine temporäre Tabelle).
+    Die Kennzahlen liegen zusätzlich als Spalten vor, damit Übersichtsseiten ohne JSON-Parsing auskommen.
+    """
+    rows = [
+        (
+            snapshot['asset_id'],
+            snapshot['operational_mode'],
+            snapshot['room']['sensor_temperature'],
+            snapshot['room']['target_temperature'],
+            snapshot['room']['percent_valve_open'],
+            snapshot['min_battery_voltage'],
+            len(snapshot['devices']),
+            snapshot['latest_ts'],
+            json.dumps(snapshot, ensure_ascii=False)
+        )
+        for snapshot in snapshots
+    ]
+    
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE #snapshot_stage (
+                asset_id NVARCHAR(36) NOT NULL PRIMARY KEY,
+                operational_mode INT NULL,
+                sensor_temperature FLOAT NULL,
+                target_temperature FLOAT NULL,
+                percent_valve_open FLOAT NULL,
+                min_battery_voltage FLOAT NULL,
+                device_count INT NOT NULL,
+                latest_ts BIGINT NULL,
+                snapshot NVARCHAR(MAX) NOT NULL
+            )
+        """)
+        if rows:
+            cursor.fast_executemany = True
+            cursor.executemany("""
+                INSERT INTO #snapshot_stage (asset_id, operational_mode, sensor_temperature, target_temperature,
+                                             percent_valve_open, min_battery_voltage, device_count, latest_ts, snapshot)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        
+        cursor.execute("""
+            MERGE asset_heating_snapshots AS target
+            USING #snapshot_stage AS source
+            ON target.customer_id = ? AND target.asset_id = source.asset_id
+            WHEN MATCHED THEN
+                UPDATE SET operational_mode = source.operational_mode,
+                           sensor_temperature = source.sensor_temperature,
+                           target_temperature = source.target_temperature,
+                           percent_valve_open = source.percent_valve_open,
+                           min_battery_voltage = source.min_battery_voltage,
+                           device_count = source.device_count,
+                           latest_ts = source.latest_ts,
+                           snapshot = source.snapshot,
+                           updated_at = GETDATE()
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT (customer_id, asset_id, operational_mode, sensor_temperature, target_temperature,
+                        percent_valve_open, min_battery_voltage, device_count, latest_ts, snapshot, updated_at)
+                VALUES (?, source.asset_id, source.operational_mode, source.sensor_temperature, source.target_temperature,
+                        source.percent_valve_open, source.min_battery_voltage, source.device_count, source.latest_ts,
+                        source.snapshot, GETDATE())
+            WHEN NOT MATCHED BY SOURCE AND target.customer_id = ? THEN
+                DELETE;
+        """, (customer_id, customer_id, customer_id))
+        cursor.execute("DROP TABLE #snapshot_stage")
+        conn.commit()
+        cursor.close()
+        log_info(f"Saved {len(rows)} room snapshots to database for customer {customer_id}")
+        return True
+    except Exception as e:
+        conn.rollback()
+        log_error(f"Error saving room snapshots to database: {e}", e)
+        raise
+    finally:
+        conn.close()
+
+def splice_subtree(tree: List[Dict], subtree: Dict) -> bool:
+    """Ersetzt den Knoten mit der ID des Subtrees im Tree (Position bleibt erhalten)"""
+    stack = [tree]
+    while stack:
+        nodes = stack.pop()
+        for index, node in enumerate(nodes):
+            if node.get('id') == subtree['id']:
+                nodes[index] = subtree
+                return True
+            if node.get('children'):
+                stack.append(node['children'])
+    return False
+
+def splice_subtree_into_db(customer_id: str, subtree: Dict):
+    """Fügt einen neu aufgebauten Teilbaum in einer Transaktion in customer_settings.tree ein"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        
+        # Zeile sperren, damit kein paralleler Sync dazwischen schreibt
+        cursor.execute("""
+            SELECT CAST(tree AS NVARCHAR(MAX))
+            FROM customer_settings WITH (UPDLOCK, ROWLOCK)
+            WHERE customer_id = ?
+        """, (customer_id,))
+        row = cursor.fetchone()
+        if not row or not row[0]:
+            raise ValueError(f"No stored tree for customer {customer_id}, run a full sync first")
+        
+        tree = json.loads(row[0])
+        if not splice_subtree(tree, subtree):
+            raise ValueError(f"Asset {subtree['id']} not found in stored tree of customer {customer_id}, run a full sync first")
+        
+        tree_json = json.dumps(tree, ensure_ascii=False)
+        cursor.execute("""
+            UPDATE customer_settings 
+            SET tree = CAST(? AS NVARCHAR(MAX)), tree_updated = GETDATE()
+            WHERE customer_id = ?
+        """, (tree_json, customer_id))
+        if has_tree_state_column(cursor):
+            # Ein vollständiger Tree bleibt vollständig; ein Skeleton (partial) bleibt partiell,
+            # da außerhalb des Teilbaums weiterhin Devices und Attribute fehlen
+            cursor.execute("""
+                UPDATE customer_settings SET tree_state = ?
+                WHERE customer_id = ? AND (tree_state IS NULL OR tree_state <> ?)
+            """, (TREE_STATE_COMPLETE, customer_id, TREE_STATE_PARTIAL))
+        try:
+            record_tree_version(cursor, customer_id, tree)
+        except Exception as e:
+            log_warn(f"Could not record tree version: {e}")
+        conn.commit()
+        cursor.close()
+        log_info(f"Subtree {subtree['id']} spliced into tree of customer {customer_id}", {'treeSize': len(tree_json)})
+        return True
+    except Exception as e:
+        conn.rollback()
+        log_error(f"Error splicing subtree into database: {e}", e)
+        raise
+    finally:
+        conn.close()
+
 def log_print(message: str, level: str = "INFO"):
     """Schreibt eine Nachricht sowohl in die Log-Datei als auch nach stdout"""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -693,9 +1899,32 @@ def log_print(message: str, level: str = "INFO"):
 
 async def main():
     """Hauptfunktion"""
+    global HEDGE_REQUESTS, HEDGE_BUDGET_PERCENT
     parser = argparse.ArgumentParser(description='Synchronisiert die Asset-Struktur von ThingsBoard')
     parser.add_argument('customer_id', help='Customer ID (UUID)')
+    parser.add_argument('--root-asset', help='Nur den Teilbaum unterhalb dieses Assets neu synchronisieren (UUID)')
+    parser.add_argument('--resume', metavar='SESSION_ID',
+                        help='Abgebrochenen Sync fortsetzen (bereits geladene Ergebnisse aus dem Checkpoint-Journal)')
+    parser.add_argument('--progressive', action='store_true',
+                        help="Skeleton-Tree (tree_state=partial) speichern sobald die Hierarchie bekannt ist")
+    parser.add_argument('--skip-unassigned', action='store_true',
+                        help='Nicht zugeordnete Devices nicht ermitteln (unassigned_devices bleibt unverändert)')
+    parser.add_argument('--hedge', action='store_true', default=HEDGE_REQUESTS,
+                        help='Langsame Requests (über p95) duplizieren, die schnellere Antwort gewinnt')
+    parser.add_argument('--hedge-budget', type=float, default=HEDGE_BUDGET_PERCENT,
+                        help=f'Maximaler Anteil duplizierter Requests in Prozent (Standard: {HEDGE_BUDGET_PERCENT})')
+    parser.add_argument('--room-snapshots', action='store_true', default=ROOM_SNAPSHOTS_ENABLED,
+                        help='Nach dem Sync die letzte Telemetrie laden und Raum-Snapshots in asset_heating_snapshots schreiben')
+    parser.add_argument('--changes-since', type=int, metavar='VERSION',
+                        help='Strukturelle Änderungen seit dieser Tree-Version als JSON ausgeben (kein Sync)')
+    parser.add_argument('--rollback', type=int, metavar='VERSION',
+                        help='Gespeicherte Tree-Version wiederherstellen (kein Sync)')
+    tracing.add_arguments(parser)
     args = parser.parse_args()
+    tracing.start(args, 'sync_structure')
+    
+    HEDGE_REQUESTS = args.hedge
+    HEDGE_BUDGET_PERCENT = args.hedge_budget
     
     customer_id = args.customer_id
     
@@ -715,22 +1944,73 @@ async def main():
         log_print("Customer ID must be a valid UUID", "ERROR")
         sys.exit(1)
     
+    if args.root_asset:
+        try:
+            uuid.UUID(args.root_asset)
+        except ValueError:
+            log_print(f"ERROR: Invalid root asset id format: {args.root_asset}", "ERROR")
+            sys.exit(1)
+    
+    phases = tracing.Phases()
     try:
+        if args.changes_since is not None:
+            print(json.dumps(get_tree_changes_since(customer_id, args.changes_since), indent=2, ensure_ascii=False))
+            return 0
+        
+        if args.rollback is not None:
+            log_print(f"Rolling back tree to version {args.rollback}...", "INFO")
+            rollback_tree(customer_id, args.rollback)
+            log_print("=" * 80, "SUCCESS")
+            log_print(f"Tree restored from version {args.rollback}", "SUCCESS")
+            log_print("=" * 80, "SUCCESS")
+            return 0
+        
         # Hole ThingsBoard Token
+        phases.next('ThingsBoard-Token')
         log_print("Getting ThingsBoard token...", "INFO")
         tb_token = get_thingsboard_token(customer_id)
         log_print("Token obtained successfully", "INFO")
         
+        if args.root_asset:
+            # Nur den Teilbaum neu aufbauen und in den gespeicherten Tree einsetzen
+            phases.next('Teilbaum laden')
+            log_print(f"Fetching subtree below asset {args.root_asset}...", "INFO")
+            subtree = await fetch_asset_subtree(customer_id, tb_token, args.root_asset)
+            phases.next('Teilbaum speichern')
+            log_print("Splicing subtree into stored tree...", "INFO")
+            splice_subtree_into_db(customer_id, subtree)
+            log_print("=" * 80, "SUCCESS")
+            log_print("Subtree sync completed successfully!", "SUCCESS")
+            log_print("=" * 80, "SUCCESS")
+            return 0
+        
         # Hole und baue Tree
+        phases.next('Tree laden')
         log_print("Fetching asset tree...", "INFO")
-        tree = await fetch_asset_tree(customer_id, tb_token)
+        unassigned_result = None if args.skip_unassigned else {}
+        tree = await fetch_asset_tree(customer_id, tb_token, unassigned_result, progressive=args.progressive,
+                                      resume_session_id=args.resume)
         log_print(f"Tree built with {len(tree)} root assets", "INFO")
         
         # Speichere in DB
+        phases.next('Tree speichern')
         log_print("Saving tree to database...", "INFO")
-        save_tree_to_db(customer_id, tree)
+        save_tree_to_db(customer_id, tree, TREE_STATE_COMPLETE)
         log_print("Tree saved successfully", "INFO")
         
+        if unassigned_result and 'devices' in unassigned_result:
+            phases.next('Nicht zugeordnete Devices speichern')
+            log_print(f"Saving {len(unassigned_result['devices'])} unassigned devices...", "INFO")
+            save_unassigned_devices_to_db(customer_id, unassigned_result['devices'])
+        
+        if args.room_snapshots:
+            phases.next('Raum-Snapshots')
+            log_print("Building room snapshots...", "INFO")
+            # Token erneut holen: er kann während des Syncs erneuert worden sein
+            snapshots = await fetch_room_snapshots(customer_id, get_thingsboard_token(customer_id), tree)
+            save_room_snapshots_to_db(customer_id, snapshots)
+            log_print(f"Saved {len(snapshots)} room snapshots", "INFO")
+        
         log_print("=" * 80, "SUCCESS")
         log_print("Structure sync completed successfully!", "SUCCESS")
         log_print("=" * 80, "SUCCESS")
@@ -747,6 +2027,8 @@ async def main():
                 log_print(f"  {line}", "ERROR")
         log_print("=" * 80, "ERROR")
         return 1
+    finally:
+        phases.close()
 
 if __name__ == "__main__":
     # Prüfe Umgebungsvariablen
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Inkrementelle Pflege von customer_settings.tree aus ThingsBoard-Ereignissen
+Baut den Tree einmal mit fetch_asset_tree auf, hält ihn im Speicher und wendet
+Entity- und Relation-Events als lokale Änderungen an. Gespeichert wird gebündelt
+(debounced) über save_tree_to_db, ein kompletter Resync ist nicht nötig.
+
+Event-Quellen:
+  - HTTP: Rule-Engine-Node "REST API Call" sendet per POST an http://<host>:<port>/events
+  - Datei/stdin: NDJSON, eine Zeile pro Event (lokaler Ersatz für Tests und Replays)
+
+Das ThingsBoard-WebSocket-API liefert nur Telemetrie, Attribute und Alarme, keine
+Entity- oder Relation-Events; deshalb ist die Rule Engine die Event-Quelle.
+
+Erwartetes Event-Format (im Rule Chain per Script-Node erzeugt):
+  {"msgType": "RELATION_ADD_OR_UPDATE", "entityType": "ASSET", "entityId": "<uuid>", "data": {...}}
+"data" ist der Nachrichteninhalt von ThingsBoard: bei Entity-Events die Entity,
+bei Relation-Events die Relation ({"from": {...}, "to": {...}, "type": "Contains"}).
+"""
+
+import os
+import sys
+import copy
+import json
+import hmac
+import bisect
+import ipaddress
+import argparse
+import asyncio
+import aiohttp
+from aiohttp import web
+from typing import Dict, List, Any, Optional
+
+import sync_structure
+from sync_structure import (
+    THINGSBOARD_URL,
+    DEVICE_DETAILS_TIMEOUT,
+    RequestGovernor,
+    fetch_asset_tree,
+    fetch_with_timeout,
+    get_thingsboard_token,
+    save_tree_to_db,
+    TREE_STATE_COMPLETE,
+    log_info,
+    log_warn,
+    log_error,
+)
+
+# Event-Konfiguration
+EVENTS_HOST = os.getenv('TREE_EVENTS_HOST', '127.0.0.1')
+EVENTS_PORT = int(os.getenv('TREE_EVENTS_PORT', '8765'))
+EVENTS_SECRET = os.getenv('TREE_EVENTS_SECRET')  # Shared Secret (Header X-Events-Secret), Pflicht außerhalb von Loopback
+SAVE_DEBOUNCE_SECONDS = 2.0
+SAVE_MAX_DELAY_SECONDS = 10.0
+
+class TreeIndex:
+    """
+    Tree aus build_sub_tree plus Indizes (Knoten, Parent, Device -> Asset),
+    damit jedes Event nur entlang des Pfades zur Wurzel arbeitet statt den Tree zu durchsuchen
+    """
+
+    def __init__(self, tree: List[Dict]):
+        self.tree = tree
+        self.nodes: Dict[str, Dict] = {}
+        self.parents: Dict[str, Optional[str]] = {}
+        self.device_assets: Dict[str, str] = {}
+
+        stack = [(node, None) for node in tree]
+        while stack:
+            node, parent_id = stack.pop()
+            self.nodes[node['id']] = node
+            self.parents[node['id']] = parent_id
+            for device in node.get('relatedDevices', []):
+                self.device_assets[device['id']] = node['id']
+            stack.extend((child, node['id']) for child in node.get('children', []))
+
+    def _siblings(self, parent_id: Optional[str]) -> List[Dict]:
+        return self.tree if parent_id is None else self.nodes[parent_id]['children']
+
+    def _insert_sorted(self, parent_id: Optional[str], node: Dict):
+        """Fügt einen Knoten nach Name sortiert ein (wie build_sub_tree)"""
+        siblings = self._siblings(parent_id)
+        names = [sibling.get('name', '') for sibling in siblings]
+        siblings.insert(bisect.bisect_right(names, node.get('name', '')), node)
+        self.parents[node['id']] = parent_id
+
+    def _detach(self, asset_id: str):
+        siblings = self._siblings(self.parents.get(asset_id))
+        node = self.nodes[asset_id]
+        for index, sibling in enumerate(siblings):
+            if sibling is node:
+                del siblings[index]
+                return
+
+    def _ancestors(self, asset_id: Optional[str]):
+        while asset_id is not None:
+            yield asset_id
+            asset_id = self.parents.get(asset_id)
+
+    def add_asset(self, asset: Dict, parent_id: Optional[str] = None) -> bool:
+        asset_id = asset['id']
+        if asset_id in self.nodes:
+            return False
+        if parent_id is not None and parent_id not in self.nodes:
+            parent_id = None
+        node = {
+            'id': asset_id,
+            'name': asset.get('name', ''),
+            'type': asset.get('type', ''),
+            'label': asset.get('label', ''),
+            'hasDevices': False,
+            'children': []
+        }
+        self.nodes[asset_id] = node
+        self._insert_sorted(parent_id, node)
+        return True
+
+    def update_asset(self, asset: Dict) -> bool:
+        node = self.nodes.get(asset['id'])
+        if node is None:
+            return False
+        renamed = node.get('name') != asset.get('name', node.get('name'))
+        for key in ('name', 'type', 'label'):
+            if key in asset:
+                node[key] = asset[key] if asset[key] is not None else ''
+        if renamed:
+            parent_id = self.parents.get(node['id'])
+            self._detach(node['id'])
+            self._insert_sorted(parent_id, node)
+        return True
+
+    def remove_asset(self, asset_id: str) -> bool:
+        """Entfernt ein Asset; seine Children werden wie beim vollen Sync zu Root-Assets"""
+        node = self.nodes.get(asset_id)
+        if node is None:
+            return False
+        self._detach(asset_id)
+        for child in list(node['children']):
+            self._insert_sorted(None, child)
+        for device in node.get('relatedDevices', []):
+            self.device_assets.pop(device['id'], None)
+        del self.nodes[asset_id]
+        del self.parents[asset_id]
+        return True
+
+    def link_asset(self, parent_id: str, child_id: str) -> bool:
+        """Contains-Relation Parent -> Child hinzugefügt"""
+        if parent_id not in self.nodes or child_id not in self.nodes:
+            return False
+        current_parent = self.parents.get(child_id)
+        if current_parent == parent_id:
+            return False
+        if current_parent is not None:
+            # Gleiche Regel wie fetch_asset_tree: ein Asset hat genau einen Parent
+            log_warn(f"Asset {child_id} hat bereits einen Parent, überspringe", {
+                'childAssetId': child_id,
+                'existingParentId': current_parent,
+                'newParentId': parent_id
+            })
+            return False
+        if child_id in self._ancestors(parent_id):
+            log_warn(f"Relation {parent_id} -> {child_id} würde einen Zyklus erzeugen, überspringe")
+            return False
+        self._detach(child_id)
+        self._insert_sorted(parent_id, self.nodes[child_id])
+        return True
+
+    def unlink_asset(self, parent_id: str, child_id: str) -> bool:
+        """Contains-Relation Parent -> Child entfernt; das Child wird Root-Asset"""
+        if child_id not in self.nodes or self.parents.get(child_id) != parent_id:
+            return False
+        self._detach(child_id)
+        self._insert_sorted(None, self.nodes[child_id])
+        return True
+
+    def add_device(self, asset_id: str, device: Dict) -> bool:
+        node = self.nodes.get(asset_id)
+        if node is None:
+            return False
+        related_devices = node.setdefault('relatedDevices', [])
+        if any(d['id'] == device['id'] for d in related_devices):
+            return False
+        related_devices.append(device)
+        node['hasDevices'] = True
+        self.device_assets[device['id']] = asset_id
+        return True
+
+    def update_device(self, device: Dict) -> bool:
+        node = self.nodes.get(self.device_assets.get(device['id'], ''))
+        if node is None:
+            return False
+        for related_device in node.get('relatedDevices', []):
+            if related_device['id'] == device['id']:
+                related_device.update(device)
+                return True
+        return False
+
+    def remove_device(self, device_id: str, asset_id: Optional[str] = None) -> bool:
+        asset_id = asset_id or self.device_assets.get(device_id)
+        node = self.nodes.get(asset_id) if asset_id else None
+        if node is None:
+            return False
+        related_devices = [d for d in node.get('relatedDevices', []) if d['id'] != device_id]
+        if len(related_devices) == len(node.get('relatedDevices', [])):
+            return False
+        if related_devices:
+            node['relatedDevices'] = related_devices
+        else:
+            node.pop('relatedDevices', None)
+            node['hasDevices'] = False
+        if self.device_assets.get(device_id) == asset_id:
+            del self.device_assets[device_id]
+        return True
+
+def entity_id_of(ref: Any) -> Optional[str]:
+    """Liefert die UUID aus einer EntityId ({'id': ..., 'entityType': ...}) oder einem String"""
+    if isinstance(ref, dict):
+        return ref.get('id')
+    return ref
+
+class DebouncedTreeSaver:
+    """Speichert den Tree gebündelt: nach einer Ruhephase, spätestens nach max_delay Sekunden"""
+
+    def __init__(self, customer_id: str, index: TreeIndex,
+                 delay: float = SAVE_DEBOUNCE_SECONDS, max_delay: float = SAVE_MAX_DELAY_SECONDS):
+        self.customer_id = customer_id
+        self.index = index
+        self.delay = delay
+        self.max_delay = max_delay
+        self.save_count = 0
+        self._pending = asyncio.Event()
+        self._first_change = 0.0
+        self._last_change = 0.0
+
+    def mark_dirty(self):
+        now = asyncio.get_running_loop().time()
+        if not self._pending.is_set():
+            self._first_change = now
+        self._last_change = now
+        self._pending.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._pending.wait()
+            while True:
+                deadline = min(self._last_change + self.delay, self._first_change + self.max_delay)
+                wait = deadline - loop.time()
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending.is_set():
+            return
+        self._pending.clear()
+        # Kopie im Event-Loop, damit Events den Tree während des Speicherns ändern dürfen
+        snapshot = copy.deepcopy(self.index.tree)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, save_tree_to_db, self.customer_id, snapshot,
+                                                                TREE_STATE_COMPLETE)
+            self.save_count += 1
+        except Exception as e:
+            log_error(f"Debounced tree save failed for customer {self.customer_id}", e)
+            self.mark_dirty()
+
+class TreeEventConsumer:
+    """Wendet ThingsBoard-Events auf den im Speicher gehaltenen Tree an"""
+
+    def __init__(self, customer_id: str, index: TreeIndex, saver: DebouncedTreeSaver,
+                 session: aiohttp.ClientSession, tb_token: str):
+        self.customer_id = customer_id
+        self.index = index
+        self.saver = saver
+        self.session = session
+        self.headers = {'X-Authorization': f'Bearer {tb_token}'}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.applied = 0
+        self.ignored = 0
+
+    async def fetch_entity(self, entity_type: str, entity_id: str) -> Optional[Dict]:
+        url = f"{THINGSBOARD_URL}/api/{entity_type.lower()}/{entity_id}"
+        return await fetch_with_timeout(self.session, url, self.headers, DEVICE_DETAILS_TIMEOUT)
+
+    def belongs_to_customer(self, entity: Dict) -> bool:
+        return entity_id_of(entity.get('customerId')) == self.customer_id
+
+    async def device_entry(self, device_id: str, device: Optional[Dict] = None) -> Dict:
+        device = device or await self.fetch_entity('DEVICE', device_id) or {}
+        return {
+            'id': device_id,
+            'name': device.get('name', 'Unbekannt'),
+            'type': device.get('type', 'Unbekannt'),
+            'label': device.get('label', 'Unbekannt')
+        }
+
+    async def apply(self, event: Dict) -> bool:
+        """Wendet ein Event an; liefert True wenn sich der Tree geändert hat"""
+        msg_type = event.get('msgType')
+        entity_type = event.get('entityType')
+        entity_id = entity_id_of(event.get('entityId'))
+        data = event.get('data') or {}
+
+        if msg_type in ('ENTITY_CREATED', 'ENTITY_ASSIGNED') and entity_type == 'ASSET':
+            asset = data if data.get('name') else await self.fetch_entity('ASSET', entity_id) or {}
+            if not self.belongs_to_customer(asset):
+                return False
+            return self.index.add_asset({**asset, 'id': entity_id})
+
+        if msg_type == 'ENTITY_UPDATED' and entity_type == 'ASSET':
+            return self.index.update_asset({**data, 'id': entity_id})
+
+        if msg_type in ('ENTITY_DELETED', 'ENTITY_UNASSIGNED') and entity_type == 'ASSET':
+            return self.index.remove_asset(entity_id)
+
+        if msg_type == 'ENTITY_UPDATED' and entity_type == 'DEVICE':
+            return self.index.update_device({
+                key: data[key] for key in ('name', 'type', 'label') if key in data
+            } | {'id': entity_id})
+
+        if msg_type in ('ENTITY_DELETED', 'ENTITY_UNASSIGNED') and entity_type == 'DEVICE':
+            return self.index.remove_device(entity_id)
+
+        if msg_type in ('RELATION_ADD_OR_UPDATE', 'RELATION_DELETED'):
+            relation = data
+            from_ref = relation.get('from') or {}
+            to_ref = relation.get('to') or {}
+            if relation.get('type') != 'Contains' or from_ref.get('entityType') != 'ASSET':
+                return False
+            parent_id = entity_id_of(from_ref)
+            child_id = entity_id_of(to_ref)
+
+            if to_ref.get('entityType') == 'ASSET':
+                if msg_type == 'RELATION_DELETED':
+                    return self.index.unlink_asset(parent_id, child_id)
+                if parent_id in self.index.nodes and child_id not in self.index.nodes:
+                    # Asset wurde vor dem Create-Event verknüpft
+                    asset = await self.fetch_entity('ASSET', child_id)
+                    if not asset or not self.belongs_to_customer(asset):
+                        return False
+                    return self.index.add_asset({**asset, 'id': child_id}, parent_id)
+                return self.index.link_asset(parent_id, child_id)
+
+            if to_ref.get('entityType') == 'DEVICE':
+                if msg_type == 'RELATION_DELETED':
+                    return self.index.remove_device(child_id, parent_id)
+                if parent_id not in self.index.nodes:
+                    return False
+                return self.index.add_device(parent_id, await self.device_entry(child_id))
+
+        return False
+
+    async def run(self):
+        """Verarbeitet Events in Eingangsreihenfolge"""
+        while True:
+            event = await self.queue.get()
+            try:
+                if await self.apply(event):
+                    self.applied += 1
+                    self.saver.mark_dirty()
+                else:
+                    self.ignored += 1
+            except Exception as e:
+                log_error(f"Could not apply event {event.get('msgType')} for {event.get('entityId')}", e)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, payload: Any):
+        """Nimmt ein einzelnes Event oder eine Liste von Events an"""
+        events = payload if isinstance(payload, list) else [payload]
+        for event in events:
+            if isinstance(event, dict):
+                self.queue.put_nowait(event)
+
+def is_loopback_host(host: str) -> bool:
+    """True, wenn die Listen-Adresse nur lokal erreichbar ist"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def check_receiver_binding(host: str):
+    """Ohne TREE_EVENTS_SECRET darf der Receiver nur auf Loopback lauschen"""
+    if not EVENTS_SECRET and not is_loopback_host(host):
+        raise RuntimeError(f"TREE_EVENTS_SECRET must be set to listen on non-loopback host {host}")
+
+def is_authorized(request: web.Request) -> bool:
+    """Prüft X-Events-Secret in konstanter Zeit"""
+    if not EVENTS_SECRET:
+        return True
+    supplied = request.headers.get('X-Events-Secret', '')
+    return hmac.compare_digest(supplied.encode('utf-8'), EVENTS_SECRET.encode('utf-8'))
+
+async def start_http_receiver(consumer: TreeEventConsumer, host: str, port: int) -> web.AppRunner:
+    """Startet den HTTP-Endpunkt für den Rule-Engine-Node "REST API Call" """
+    check_receiver_binding(host)
+
+    async def handle_events(request: web.Request) -> web.Response:
+        if not is_authorized(request):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({'error': 'invalid json'}, status=400)
+        consumer.submit(payload)
+        return web.json_response({'queued': consumer.queue.qsize()}, status=202)
+
+    async def handle_health(request: web.Request) -> web.Response:
+        return web.json_response({
+            'nodes': len(consumer.index.nodes),
+            'applied': consumer.applied,
+            'ignored': consumer.ignored,
+            'saves': consumer.saver.save_count
+        })
+
+    app = web.Application()
+    app.router.add_post('/events', handle_events)
+    app.router.add_get('/health', handle_health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log_info(f"Listening for ThingsBoard events on http://{host}:{port}/events")
+    return runner
+
+async def read_events_file(consumer: TreeEventConsumer, path: str):
+    """Liest NDJSON-Events aus einer Datei oder von stdin ('-')"""
+    loop = asyncio.get_running_loop()
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        while True:
+            line = await loop.run_in_executor(None, stream.readline)
+            if not line:
+                break
+            line = line.strip()
+            if line:
+                try:
+                    consumer.submit(json.loads(line))
+                except ValueError:
+                    log_warn(f"Invalid event line skipped: {line[:200]}")
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+async def main():
+    """Hauptfunktion"""
+    parser = argparse.ArgumentParser(description='Hält customer_settings.tree über ThingsBoard-Events aktuell')
+    parser.add_argument('customer_id', help='Customer ID (UUID)')
+    parser.add_argument('--host', default=EVENTS_HOST, help=f'Listen-Adresse (Standard: {EVENTS_HOST})')
+    parser.add_argument('--port', type=int, default=EVENTS_PORT, help=f'Listen-Port (Standard: {EVENTS_PORT})')
+    parser.add_argument('--events-file', help="NDJSON-Events aus Datei oder '-' für stdin lesen statt HTTP")
+    parser.add_argument('--debounce', type=float, default=SAVE_DEBOUNCE_SECONDS,
+                        help=f'Ruhephase vor dem Speichern in Sekunden (Standard: {SAVE_DEBOUNCE_SECONDS})')
+    args = parser.parse_args()
+
+    if not args.events_file:
+        try:
+            check_receiver_binding(args.host)
+        except RuntimeError as e:
+            parser.error(str(e))
+
+    customer_id = args.customer_id
+    tb_token = get_thingsboard_token(customer_id)
+
+    # Resident-Kopie des Trees einmalig vollständig aufbauen
+    tree = await fetch_asset_tree(customer_id, tb_token)
+    save_tree_to_db(customer_id, tree, TREE_STATE_COMPLETE)
+    index = TreeIndex(tree)
+    log_info(f"Resident tree loaded with {len(index.nodes)} assets")
+
+    saver = DebouncedTreeSaver(customer_id, index, delay=args.debounce)
+
+    async with aiohttp.ClientSession() as session:
+        governor = RequestGovernor(customer_id, tb_token)
+        sync_structure._request_governor = governor
+        consumer = TreeEventConsumer(customer_id, index, saver, session, tb_token)
+
+        saver_task = asyncio.ensure_future(saver.run())
+        consumer_task = asyncio.ensure_future(consumer.run())
+        runner = None
+        try:
+            if args.events_file:
+                await read_events_file(consumer, args.events_file)
+                await consumer.queue.join()
+                await saver.flush()
+                log_info(f"Events processed: {consumer.applied} applied, {consumer.ignored} ignored")
+            else:
+                runner = await start_http_receiver(consumer, args.host, args.port)
+                await asyncio.Event().wait()
+        finally:
+            saver_task.cancel()
+            consumer_task.cancel()
+            if runner:
+                await runner.cleanup()
+            await saver.flush()
+    return 0
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(main()))
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Synchronisiert die Asset-Struktur mehrerer Kunden parallel über mehrere CPU-Kerne
+Jeder Worker-Prozess hat seinen eigenen Event-Loop und führt fetch_asset_tree und
+save_tree_to_db für seine Kunden aus. Alle Worker teilen sich ein gemeinsames
+Request-Budget gegenüber ThingsBoard; die Ergebnisse werden zu einem Report zusammengefasst.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+import sync_structure
+from sync_structure import (
+    MSSQL_SERVER,
+    MSSQL_DATABASE,
+    MSSQL_USER,
+    MSSQL_PASSWORD,
+    fetch_asset_tree,
+    get_db_connection,
+    get_thingsboard_token,
+    save_tree_to_db,
+    TREE_STATE_COMPLETE,
+    save_unassigned_devices_to_db,
+    log_print,
+)
+
+# Standard: ein Worker pro CPU-Kern, gemeinsames Budget von 50 Requests/s
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_RATE_LIMIT = float(os.getenv('TB_RATE_LIMIT', '50'))
+
+class SharedRateLimiter:
+    """
+    Token-Bucket im Shared Memory (multiprocessing.Value), den alle Worker-Prozesse teilen.
+    Kann als rate_limiter an den RequestGovernor übergeben werden.
+    """
+
+    def __init__(self, rate_per_second: float, burst: Optional[float] = None):
+        self.rate = rate_per_second
+        self.burst = burst if burst is not None else max(1.0, rate_per_second)
+        self._tokens = multiprocessing.Value('d', self.burst)
+        self._updated = multiprocessing.Value('d', time.time(), lock=False)
+
+    def _try_take(self) -> float:
+        """Nimmt einen Token; liefert 0 bei Erfolg, sonst die Wartezeit in Sekunden"""
+        with self._tokens.get_lock():
+            now = time.time()
+            elapsed = max(0.0, now - self._updated.value)
+            self._tokens.value = min(self.burst, self._tokens.value + elapsed * self.rate)
+            self._updated.value = now
+            if self._tokens.value >= 1.0:
+                self._tokens.value -= 1.0
+                return 0.0
+            return (1.0 - self._tokens.value) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+def init_worker(rate_limiter: Optional[SharedRateLimiter]):
+    """Initialisiert einen Worker-Prozess mit dem gemeinsamen Request-Budget"""
+    sync_structure.set_request_rate_limiter(rate_limiter)
+
+def count_tree(tree: List[Dict]) -> Tuple[int, int]:
+    """Zählt Assets und Devices eines Trees"""
+    assets = 0
+    devices = 0
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        assets += 1
+        devices += len(node.get('relatedDevices', []))
+        stack.extend(node.get('children', []))
+    return assets, devices
+
+async def sync_customer(customer_id: str) -> Dict[str, Any]:
+    tb_token = get_thingsboard_token(customer_id)
+    unassigned_result = {}
+    tree = await fetch_asset_tree(customer_id, tb_token, unassigned_result)
+    save_tree_to_db(customer_id, tree, TREE_STATE_COMPLETE)
+    result = {'rootAssets': len(tree)}
+    if 'devices' in unassigned_result:
+        save_unassigned_devices_to_db(customer_id, unassigned_result['devices'])
+        result['unassignedDevices'] = len(unassigned_result['devices'])
+    result['assets'], result['devices'] = count_tree(tree)
+    return result
+
+def sync_customer_worker(customer_id: str) -> Dict[str, Any]:
+    """Läuft im Worker-Prozess: synchronisiert einen Kunden mit eigenem Event-Loop"""
+    started = time.time()
+    result = {'customerId': customer_id, 'pid': os.getpid()}
+    try:
+        result.update(asyncio.run(sync_customer(customer_id)))
+        result['status'] = 'success'
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['durationSeconds'] = round(time.time() - started, 2)
+    return result
+
+def load_all_customer_ids() -> List[str]:
+    """Alle Kunden mit Token oder ThingsBoard-Zugangsdaten aus customer_settings"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT customer_id
+            FROM customer_settings
+            WHERE (tbtoken IS NOT NULL AND tbtoken <> '')
+               OR (tb_username IS NOT NULL AND tb_username <> '')
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+    return [str(row[0]) for row in rows]
+
+def run_sharded(customer_ids: List[str], workers: int, rate_limit: Optional[float]) -> Dict[str, Any]:
+    """Verteilt die Kunden auf einen ProcessPoolExecutor und sammelt die Ergebnisse"""
+    started = time.time()
+    rate_limiter = SharedRateLimiter(rate_limit) if rate_limit else None
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(rate_limiter,)) as executor:
+        futures = {executor.submit(sync_customer_worker, customer_id): customer_id for customer_id in customer_ids}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker-Prozess abgestürzt
+                result = {'customerId': futures[future], 'status': 'error', 'error': str(e), 'durationSeconds': None}
+            results.append(result)
+            log_print(f"[{len(results)}/{len(customer_ids)}] {result['customerId']}: {result['status']}"
+                      + (f" ({result['error']})" if result.get('error') else ''))
+
+    successful = [r for r in results if r['status'] == 'success']
+    return {
+        'startedAt': datetime.fromtimestamp(started).isoformat(),
+        'durationSeconds': round(time.time() - started, 2),
+        'workers': workers,
+        'rateLimitPerSecond': rate_limit,
+        'customers': len(customer_ids),
+        'successful': len(successful),
+        'failed': len(results) - len(successful),
+        'totalAssets': sum(r.get('assets', 0) for r in successful),
+        'totalDevices': sum(r.get('devices', 0) for r in successful),
+        'results': sorted(results, key=lambda r: r['customerId'])
+    }
+
+def print_report(report: Dict[str, Any]):
+    log_print("=" * 80, "REPORT")
+    log_print(f"{'Customer':<38} {'Status':<8} {'Assets':>7} {'Devices':>8} {'Dauer(s)':>9}", "REPORT")
+    for result in report['results']:
+        log_print(f"{result['customerId']:<38} {result['status']:<8} {result.get('assets', '-'):>7} "
+                  f"{result.get('devices', '-'):>8} {result.get('durationSeconds') or '-':>9}", "REPORT")
+    log_print("-" * 80, "REPORT")
+    log_print(f"Customers: {report['customers']} | erfolgreich: {report['successful']} | "
+              f"fehlgeschlagen: {report['failed']} | Assets: {report['totalAssets']} | "
+              f"Devices: {report['totalDevices']} | Dauer: {report['durationSeconds']}s", "REPORT")
+    log_print("=" * 80, "REPORT")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Synchronisiert die Asset-Struktur mehrerer Kunden parallel')
+    parser.add_argument('customer_ids', nargs='*', help='Customer IDs (UUID)')
+    parser.add_argument('--all', action='store_true', help='Alle Kunden aus customer_settings synchronisieren')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Anzahl Worker-Prozesse (Standard: {DEFAULT_WORKERS})')
+    parser.add_argument('--rate-limit', type=float, default=DEFAULT_RATE_LIMIT,
+                        help=f'Gemeinsames Budget in Requests/s über alle Worker, 0 = unbegrenzt (Standard: {DEFAULT_RATE_LIMIT})')
+    parser.add_argument('--report', help='Report zusätzlich als JSON in diese Datei schreiben')
+    args = parser.parse_args()
+
+    customer_ids = list(args.customer_ids)
+    if args.all:
+        customer_ids.extend(c for c in load_all_customer_ids() if c not in customer_ids)
+    if not customer_ids:
+        parser.error('Keine Customer IDs angegeben (Customer IDs oder --all)')
+
+    for customer_id in customer_ids:
+        try:
+            uuid.UUID(customer_id)
+        except ValueError:
+            log_print(f"ERROR: Invalid customer_id format: {customer_id}", "ERROR")
+            return 1
+
+    workers = max(1, min(args.workers, len(customer_ids)))
+    log_print(f"Starting sharded structure sync for {len(customer_ids)} customers with {workers} workers", "START")
+    report = run_sharded(customer_ids, workers, args.rate_limit or None)
+    print_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        log_print(f"Report written to {args.report}")
+
+    return 0 if report['failed'] == 0 else 1
+
+if __name__ == "__main__":
+    if not all([MSSQL_SERVER, MSSQL_DATABASE, MSSQL_USER, MSSQL_PASSWORD]):
+        print("ERROR: Missing required environment variables: MSSQL_SERVER, MSSQL_DATABASE, MSSQL_USER, MSSQL_PASSWORD")
+        sys.exit(1)
+    sys.exit(main())
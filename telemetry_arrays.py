@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Spaltenweise Darstellung von Telemetriedaten mit NumPy
+Wandelt ThingsBoard-Antworten ({key: [{'ts', 'value'}, ...]}) in aufsteigend sortierte
+Arrays (int64 ms-Zeitstempel, float64 Werte, NaN für nicht-numerische Werte) und bietet
+vektorisierte Statistiken, 10-Minuten-Buckets wie hmreporting.device_10m /
+lib/mergeRoomTimeseries.js und die Ausrichtung mehrerer Keys auf ein gemeinsames Raster.
+"""
+
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+BUCKET_MS = 10 * 60 * 1000
+PERCENTILES = (5, 50, 95)
+
+Columns = Tuple[np.ndarray, np.ndarray]
+
+def _float_or_nan(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def to_columns(points: List[Dict[str, Any]]) -> Columns:
+    """Wandelt die Werte eines Keys in (Zeitstempel, Werte), aufsteigend nach Zeit; nicht-numerisch = NaN"""
+    count = len(points)
+    timestamps = np.fromiter(map(itemgetter('ts'), points), dtype=np.int64, count=count)
+    try:
+        values = np.fromiter(map(float, map(itemgetter('value'), points)), dtype=np.float64, count=count)
+    except (TypeError, ValueError):
+        values = np.fromiter(map(_float_or_nan, map(itemgetter('value'), points)), dtype=np.float64, count=count)
+    if count > 1 and timestamps[0] > timestamps[-1] and np.all(timestamps[:-1] >= timestamps[1:]):
+        # ThingsBoard liefert absteigend: umdrehen statt sortieren
+        return timestamps[::-1].copy(), values[::-1].copy()
+    if count > 1 and not np.all(timestamps[:-1] <= timestamps[1:]):
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], values[order]
+    return timestamps, values
+
+def response_to_columns(data: Dict[str, Any]) -> Dict[str, Columns]:
+    """Alle Keys einer Telemetrie-Antwort als Spalten"""
+    return {key: to_columns(points) for key, points in data.items() if isinstance(points, list)}
+
+def columns_from_store(parts: List[Tuple[memoryview, memoryview]]) -> Columns:
+    """Spalten aus TelemetryStore.read(); bei einem Segment ohne Kopie direkt auf dem mmap"""
+    if len(parts) == 1:
+        return np.frombuffer(parts[0][0], dtype=np.int64), np.frombuffer(parts[0][1], dtype=np.float64)
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return (np.concatenate([np.frombuffer(ts, dtype=np.int64) for ts, _ in parts]),
+            np.concatenate([np.frombuffer(values, dtype=np.float64) for _, values in parts]))
+
+def column_stats(timestamps: np.ndarray, values: np.ndarray,
+                 percentiles: Tuple[int, ...] = PERCENTILES) -> Dict[str, Any]:
+    """Anzahl, Min/Max/Mittelwert und Perzentile (NaN-Werte werden ignoriert)"""
+    valid = values[~np.isnan(values)]
+    stats = {
+        'count': int(values.size),
+        'nanCount': int(values.size - valid.size),
+        'firstTs': int(timestamps[0]) if timestamps.size else None,
+        'lastTs': int(timestamps[-1]) if timestamps.size else None,
+        'min': None,
+        'max': None,
+        'mean': None
+    }
+    if valid.size:
+        stats['min'] = float(valid.min())
+        stats['max'] = float(valid.max())
+        stats['mean'] = float(valid.mean())
+        for percentile, value in zip(percentiles, np.percentile(valid, percentiles)):
+            stats[f'p{percentile}'] = float(value)
+    return stats
+
+def resample(timestamps: np.ndarray, values: np.ndarray, bucket_ms: int = BUCKET_MS,
+             how: str = 'mean') -> Columns:
+    """
+    Fasst die Werte in Buckets ab Epoch zusammen (Bucket-Zeitstempel = Bucket-Beginn).
+    how: 'mean', 'min', 'max' oder 'last'; NaN-Werte zählen nicht, leere Buckets entfallen.
+    Erwartet aufsteigende Zeitstempel.
+    """
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    if not timestamps.size:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    buckets = timestamps - timestamps % bucket_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if how == 'mean':
+        counts = np.diff(np.r_[starts, values.size])
+        aggregated = np.add.reduceat(values, starts) / counts
+    elif how == 'min':
+        aggregated = np.minimum.reduceat(values, starts)
+    elif how == 'max':
+        aggregated = np.maximum.reduceat(values, starts)
+    elif how == 'last':
+        aggregated = values[np.r_[starts[1:], values.size] - 1]
+    else:
+        raise ValueError(f"Unknown aggregation: {how}")
+    return buckets[starts], aggregated
+
+def align(columns: Dict[str, Columns], bucket_ms: int = BUCKET_MS, how: str = 'mean',
+          nearest_within_ms: Optional[int] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Richtet mehrere Keys auf ein gemeinsames Raster im Abstand bucket_ms aus (wie die Zeilen von
+    mergeRoomTimeseriesPoints). Fehlende Buckets sind NaN; mit nearest_within_ms wird stattdessen
+    der nächstgelegene Rohwert innerhalb dieses Abstands verwendet (wie chartUtils findNearestRow).
+    """
+    resampled = {key: resample(ts, values, bucket_ms, how) for key, (ts, values) in columns.items()}
+    non_empty = [ts for ts, _ in resampled.values() if ts.size]
+    if not non_empty:
+        return np.empty(0, dtype=np.int64), {key: np.empty(0, dtype=np.float64) for key in columns}
+
+    grid = np.arange(min(ts[0] for ts in non_empty), max(ts[-1] for ts in non_empty) + 1, bucket_ms, dtype=np.int64)
+    aligned = {}
+    for key, (bucket_ts, bucket_values) in resampled.items():
+        row = np.full(grid.size, np.nan)
+        row[(bucket_ts - grid[0]) // bucket_ms] = bucket_values
+        if nearest_within_ms is not None:
+            raw_ts, raw_values = columns[key]
+            valid = ~np.isnan(raw_values)
+            raw_ts, raw_values = raw_ts[valid], raw_values[valid]
+            missing = np.flatnonzero(np.isnan(row))
+            if raw_ts.size and missing.size:
+                targets = grid[missing]
+                right = np.clip(np.searchsorted(raw_ts, targets), 0, raw_ts.size - 1)
+                left = np.clip(right - 1, 0, raw_ts.size - 1)
+                use_left = np.abs(targets - raw_ts[left]) <= np.abs(raw_ts[right] - targets)
+                nearest = np.where(use_left, left, right)
+                close = np.abs(raw_ts[nearest] - targets) <= nearest_within_ms
+                row[missing[close]] = raw_values[nearest[close]]
+        aligned[key] = row
+    return grid, aligned
+
+def bucket_matrix(series: List[Columns], start_ts: int, end_ts: int,
+                  bucket_ms: int = BUCKET_MS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bucket-Mittelwerte vieler Zeitreihen als Matrix (Zeitreihe x Bucket, NaN = keine Werte) auf
+    einem gemeinsamen Raster ab Epoch. Alle Reihen werden in einem bincount zusammengefasst.
+    Liefert (Bucket-Zeitstempel, Matrix).
+    """
+    first = start_ts - start_ts % bucket_ms
+    bucket_count = max(1, -(-(end_ts - first) // bucket_ms))
+    grid = first + np.arange(bucket_count, dtype=np.int64) * bucket_ms
+    if not series:
+        return grid, np.full((0, bucket_count), np.nan)
+
+    rows = np.repeat(np.arange(len(series)), [ts.size for ts, _ in series])
+    timestamps = np.concatenate([ts for ts, _ in series]) if rows.size else np.empty(0, dtype=np.int64)
+    values = np.concatenate([v for _, v in series]) if rows.size else np.empty(0, dtype=np.float64)
+    buckets = (timestamps - first) // bucket_ms
+    valid = ~np.isnan(values) & (timestamps >= start_ts) & (timestamps < end_ts)
+    cells = rows[valid] * bucket_count + buckets[valid]
+    size = len(series) * bucket_count
+    counts = np.bincount(cells, minlength=size)
+    sums = np.bincount(cells, weights=values[valid], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix = np.where(counts > 0, sums / counts, np.nan)
+    return grid, matrix.reshape(len(series), bucket_count)
+
+def rollup_means(membership: np.ndarray, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mittel pro Gruppe und Bucket über die zugehörigen Zeilen von matrix (jede Zeitreihe gleich
+    gewichtet, unabhängig von ihrer Sendehäufigkeit). membership: Gruppe x Zeitreihe (0/1).
+    Liefert (Gruppe x Bucket Mittelwerte, Anzahl beitragender Zeitreihen).
+    """
+    present = ~np.isnan(matrix)
+    sums = membership @ np.where(present, matrix, 0.0)
+    counts = membership @ present.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan), counts
+
+def _drop_nan(timestamps: np.ndarray, values: np.ndarray) -> Columns:
+    valid = ~np.isnan(values)
+    return (timestamps, values) if valid.all() else (timestamps[valid], values[valid])
+
+def stride_indices(count: int, target: int) -> np.ndarray:
+    """
+    Jeder n-te Punkt wie die "intelligente Stichprobenbildung" der API
+    (docs/PERFORMANCE_OPTIMIZATION.md), der letzte Punkt ersetzt den letzten Treffer.
+    """
+    if count <= target:
+        return np.arange(count)
+    step = -(-count // target)
+    indices = np.arange(0, count, step)[:target]
+    indices[-1] = count - 1
+    return indices
+
+def minmax_indices(values: np.ndarray, target: int) -> np.ndarray:
+    """
+    Minimum und Maximum je Bucket (target/2 Buckets gleicher Punktanzahl) in zeitlicher Reihenfolge.
+    Spitzen bleiben garantiert erhalten; erwartet Werte ohne NaN.
+    """
+    count = values.size
+    if count <= target:
+        return np.arange(count)
+    bucket_count = max(1, target // 2)
+    bucket = np.arange(count) * bucket_count // count
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    sizes = np.diff(np.r_[starts, count])
+
+    def first_match(extremes: np.ndarray) -> np.ndarray:
+        matches = np.flatnonzero(values == np.repeat(extremes, sizes))
+        return matches[np.r_[True, bucket[matches][1:] != bucket[matches][:-1]]]
+
+    mins = first_match(np.minimum.reduceat(values, starts))
+    maxs = first_match(np.maximum.reduceat(values, starts))
+    return np.unique(np.concatenate([mins, maxs]))
+
+def lttb_indices(timestamps: np.ndarray, values: np.ndarray, target: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: pro Bucket der Punkt mit dem größten Dreieck aus dem zuvor
+    gewählten Punkt und dem Mittelwert des nächsten Buckets. Die Schleife läuft über die Buckets,
+    die Kandidaten eines Buckets werden vektorisiert bewertet. Erwartet Werte ohne NaN.
+    """
+    count = values.size
+    if count <= target or target < 3:
+        return np.arange(count) if count <= target else np.array([0, count - 1])
+
+    x = (timestamps - timestamps[0]).astype(np.float64)
+    y = values
+    edges = np.floor(np.linspace(1, count - 1, target - 1)).astype(np.int64)
+    # Mittelwerte aller Buckets vorab (für den jeweils nächsten Bucket)
+    sums_x = np.add.reduceat(x[1:count - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:count - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    mean_x = np.r_[sums_x / sizes, x[-1]]
+    mean_y = np.r_[sums_y / sizes, y[-1]]
+
+    selected = np.empty(target, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(target - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], y[previous]
+        area = np.abs((ax - mean_x[bucket + 1]) * (y[start:end] - ay)
+                      - (ax - x[start:end]) * (mean_y[bucket + 1] - ay))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+DOWNSAMPLERS = ('lttb', 'minmax', 'stride')
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, target: int, method: str = 'lttb') -> Columns:
+    """Reduziert eine Zeitreihe auf höchstens target Punkte (NaN-Werte werden vorher entfernt)"""
+    timestamps, values = _drop_nan(timestamps, values)
+    if method == 'lttb':
+        indices = lttb_indices(timestamps, values, target)
+    elif method == 'minmax':
+        indices = minmax_indices(values, target)
+    elif method == 'stride':
+        indices = stride_indices(values.size, target)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    return timestamps[indices], values[indices]
+
+def downsample_response(data: Dict[str, Any], target: int, method: str = 'lttb') -> Dict[str, Any]:
+    """Reduziert jede numerische Zeitreihe einer Telemetrie-Antwort; Ausgabe absteigend wie ThingsBoard"""
+    from telemetry_store import format_value
+    result = {}
+    for key, points in data.items():
+        if not isinstance(points, list) or len(points) <= target:
+            result[key] = points
+            continue
+        timestamps, values = to_columns(points)
+        if np.isnan(values).all():
+            result[key] = points
+            continue
+        timestamps, values = downsample(timestamps, values, target, method)
+        result[key] = [{'ts': int(ts), 'value': format_value(float(value))}
+                       for ts, value in zip(timestamps[::-1], values[::-1])]
+    return result
+
+def reconstruction_error(timestamps: np.ndarray, values: np.ndarray,
+                         sampled_ts: np.ndarray, sampled_values: np.ndarray) -> Dict[str, float]:
+    """
+    Visueller Fehler einer reduzierten Zeitreihe: lineare Interpolation zwischen den gewählten
+    Punkten (wie im Liniendiagramm) gegen die Originalwerte, sowie verlorene Extremwerte.
+    """
+    timestamps, values = _drop_nan(timestamps, values)
+    error = np.abs(np.interp(timestamps, sampled_ts, sampled_values) - values)
+    return {
+        'rmse': float(np.sqrt(np.mean(error ** 2))),
+        'maxError': float(error.max()),
+        'envelopeError': envelope_error(timestamps, values, sampled_ts, sampled_values, sampled_ts.size),
+        'peakLoss': float(values.max() - sampled_values.max()),
+        'troughLoss': float(sampled_values.min() - values.min())
+    }
+
+def envelope_error(timestamps: np.ndarray, values: np.ndarray, sampled_ts: np.ndarray,
+                   sampled_values: np.ndarray, columns: int) -> float:
+    """
+    Mittlere Abweichung der Min/Max-Hülle pro Pixelspalte zwischen Original und gezeichneter
+    Linie der reduzierten Reihe (die Linie wird an den Spaltengrenzen interpoliert).
+    """
+    span = max(1, int(timestamps[-1] - timestamps[0]) + 1)
+    column = (timestamps - timestamps[0]) * columns // span
+    starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+    used = column[starts]
+    original_min = np.minimum.reduceat(values, starts)
+    original_max = np.maximum.reduceat(values, starts)
+
+    # Linie der reduzierten Reihe: Werte an den Spaltengrenzen plus gewählte Punkte in der Spalte
+    edges = timestamps[0] + np.arange(columns + 1) * span / columns
+    edge_values = np.interp(edges, sampled_ts, sampled_values)
+    line_min = np.minimum(edge_values[used], edge_values[used + 1])
+    line_max = np.maximum(edge_values[used], edge_values[used + 1])
+    sampled_column = np.clip((sampled_ts - timestamps[0]) * columns // span, 0, columns - 1)
+    position = np.searchsorted(used, sampled_column)
+    inside = (position < used.size) & (used[np.minimum(position, used.size - 1)] == sampled_column)
+    np.minimum.at(line_min, position[inside], sampled_values[inside])
+    np.maximum.at(line_max, position[inside], sampled_values[inside])
+    return float(np.mean(np.abs(original_min - line_min) + np.abs(original_max - line_max)) / 2)
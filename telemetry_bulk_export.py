@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Fortsetzbarer Massenexport historischer Telemetrie (z.B. ein Monat aller Geräte eines Kunden)
+
+Die Geräte kommen aus dem Kunden-Tree (wie subtree_telemetry.py) oder aus einer Liste. Die Arbeit
+wird in Partitionen (Gerät, Kalendertag in lokaler Zeit) geteilt, die parallel und innerhalb eines
+Request-Budgets (Requests/s) abgerufen werden. Jede Partition wird als eigene zstd-komprimierte
+Parquet- bzw. Arrow-Datei geschrieben:
+
+    <ziel>/<JJJJ-MM-TT>/<device_id>.parquet
+
+Abgeschlossene Partitionen stehen im Journal <ziel>/manifest.jsonl (eine JSON-Zeile pro Partition,
+wie das Checkpoint-Journal von sync_structure.py). Ein erneuter Start mit demselben Ziel
+überspringt sie, ein abgebrochener Export wird also fortgesetzt. Partitionen ohne Werte bekommen
+keine Datei; Tage, die noch nicht vorbei sind, werden geschrieben, aber erst beim nächsten Lauf
+nach Tagesende als abgeschlossen eingetragen. Am Ende jedes Laufs fasst <ziel>/manifest.json
+Parameter, Dateien und offene Partitionen zusammen.
+
+Das Schema (Spaltentyp pro Key, siehe telemetry_export.column_types) wird beim ersten Lauf im Manifest
+festgehalten und für jede Partition verwendet, damit sich alle Dateien als ein pyarrow.dataset lesen lassen.
+
+Mit --pg werden die Partitionen direkt aus ts_kv gelesen (telemetry_pg.py, eine Verbindung pro Thread).
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple, Callable
+
+from telemetry_client import (TelemetryClient, DEFAULT_KEYS, MANY_MAX_CONCURRENCY, MANY_MAX_RETRIES,
+                              RANGE_POINT_INTERVAL_MS, RANGE_MAX_POINTS, RANGE_MIN_WINDOW_MS,
+                              plan_time_windows, is_window_truncated, merge_telemetry_windows,
+                              aiohttp)
+from telemetry_export import TelemetryExporter, open_exporter, column_types, EXPORT_COLUMN_TYPES
+from telemetry_store import storable_end
+from session_store import SessionStore, DEFAULT_SESSION_FILE
+import tracing
+
+BULK_FORMATS = ('parquet', 'arrow')
+BULK_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+BULK_RATE_LIMIT = float(os.getenv('EXPORT_RATE_LIMIT', '20'))  # Requests/s gegenüber der API (0 = unbegrenzt)
+BULK_PG_CONNECTIONS = 4  # höchstens so viele gleichzeitige ts_kv-Verbindungen
+BULK_PROGRESS_S = 5
+MANIFEST_JOURNAL = 'manifest.jsonl'
+MANIFEST_SUMMARY = 'manifest.json'
+
+# Partition: (Tag, Device ID, startTs, endTs) mit [startTs, endTs)
+Partition = Tuple[str, str, int, int]
+
+def partition_key(partition: Partition) -> str:
+    return f"{partition[0]}/{partition[1]}"
+
+def day_bounds(day: date) -> Tuple[int, int]:
+    """Beginn und Ende eines Kalendertags (lokale Zeit, 23 bzw. 25 h bei Zeitumstellung) in ms"""
+    start = datetime.combine(day, datetime.min.time())
+    return int(start.timestamp() * 1000), int((start + timedelta(days=1)).timestamp() * 1000)
+
+def plan_partitions(device_ids: List[str], first_day: date, end_day: date,
+                    now_ms: Optional[int] = None) -> List[Partition]:
+    """Partitionen für alle Tage in [first_day, end_day), tageweise; Tage in der Zukunft entfallen"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    partitions = []
+    day = first_day
+    while day < end_day:
+        start_ts, end_ts = day_bounds(day)
+        if start_ts >= now_ms:
+            break
+        partitions.extend((day.isoformat(), device_id, start_ts, end_ts) for device_id in device_ids)
+        day += timedelta(days=1)
+    return partitions
+
+def parse_column_types(text: Optional[str]) -> Dict[str, str]:
+    """--types 'humidity=float64,mode=string' -> {Key: Typ}"""
+    types = {}
+    for item in (text or '').split(','):
+        if not item.strip():
+            continue
+        key, _, column_type = item.partition('=')
+        if not key.strip() or column_type.strip() not in EXPORT_COLUMN_TYPES:
+            raise ValueError(f"{item.strip()} (erwartet Key=Typ, Typ: {', '.join(EXPORT_COLUMN_TYPES)})")
+        types[key.strip()] = column_type.strip()
+    return types
+
+def format_column_types(types: Dict[str, str]) -> str:
+    return ','.join(f"{key}={column_type}" for key, column_type in types.items())
+
+def parse_period(args) -> Tuple[date, date]:
+    """--month JJJJ-MM oder --start/--end (ISO-Daten, Ende exklusiv)"""
+    if args.month:
+        first_day = datetime.strptime(args.month, '%Y-%m').date()
+        return first_day, (first_day + timedelta(days=32)).replace(day=1)
+    first_day = date.fromisoformat(args.start)
+    return first_day, date.fromisoformat(args.end) if args.end else date.today() + timedelta(days=1)
+
+class RateBudget:
+    """Token-Bucket innerhalb eines Prozesses: höchstens rate Requests pro Sekunde (Burst bis burst)"""
+
+    def __init__(self, rate_per_second: float, burst: Optional[float] = None):
+        self.rate = rate_per_second
+        self.burst = burst if burst is not None else max(1.0, rate_per_second)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+class ExportManifest:
+    """
+    Append-only Journal der abgeschlossenen Partitionen eines Exportverzeichnisses. Die Kopfzeile
+    hält Keys, Format und Spaltentypen fest; ein Verzeichnis mit anderen Parametern wird nicht fortgesetzt.
+    """
+
+    def __init__(self, out_dir: str, header: Dict[str, Any]):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, MANIFEST_JOURNAL)
+        self.header = header
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def open(cls, out_dir: str, keys: List[str], fmt: str, types: Dict[str, str]) -> 'ExportManifest':
+        """Legt das Journal an oder lädt es; fehlende Dateien und Reste abgebrochener Läufe werden entfernt"""
+        os.makedirs(out_dir, exist_ok=True)
+        manifest = cls(out_dir, {'keys': keys, 'format': fmt, 'types': types, 'createdAt': datetime.now().isoformat()})
+        if os.path.exists(manifest.path):
+            header = None
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Abgebrochene letzte Zeile nach einem Absturz
+                        continue
+                    if 'header' in record:
+                        header = header or record['header']
+                    elif 'k' in record:
+                        manifest.entries[record['k']] = record['v']
+            if header and (header.get('keys') != keys or header.get('format') != fmt):
+                raise ValueError(f"{out_dir} enthält einen Export mit anderen Parametern "
+                                 f"(Keys {','.join(header.get('keys', []))}, Format {header.get('format')})")
+            if header and header.get('types') != types:
+                pinned = header.get('types')
+                raise ValueError(f"{out_dir} enthält einen Export mit anderen Spaltentypen "
+                                 f"({format_column_types(pinned) if pinned else 'nicht festgelegt'})")
+            manifest.header = header or manifest.header
+            missing = [key for key, entry in manifest.entries.items()
+                       if entry.get('file') and not os.path.exists(os.path.join(out_dir, entry['file']))]
+            for key in missing:
+                del manifest.entries[key]
+            if missing:
+                print(f"⚠️  {len(missing)} Dateien fehlen und werden erneut exportiert", file=sys.stderr)
+        manifest._remove_partial_files()
+        manifest.compact()
+        manifest._file = open(manifest.path, 'a', encoding='utf-8')
+        return manifest
+
+    def _remove_partial_files(self):
+        for directory, _, files in os.walk(self.out_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    os.remove(os.path.join(directory, name))
+
+    def compact(self):
+        """Schreibt das Journal ohne Duplikate und defekte Zeilen neu"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'header': self.header}) + '\n')
+            for key, value in self.entries.items():
+                f.write(json.dumps({'k': key, 'v': value}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def record(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[key] = entry
+            self._file.write(json.dumps({'k': key, 'v': entry}, ensure_ascii=False) + '\n')
+            self._file.flush()
+
+    def write_summary(self, partitions: List[Partition], failed: Dict[str, str], period: Tuple[date, date],
+                      devices: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        manifest.json: Parameter, Dateien und offene bzw. fehlgeschlagene Partitionen des Zeitraums.
+        waiting sind Partitionen von Tagen, die noch nicht vorbei sind (Datei vorläufig).
+        """
+        done = [self.entries[partition_key(p)] for p in partitions if partition_key(p) in self.entries]
+        remaining = [p for p in partitions if partition_key(p) not in self.entries]
+        summary = {
+            'keys': self.header['keys'],
+            'format': self.header['format'],
+            'types': self.header['types'],
+            'start': period[0].isoformat(),
+            'end': period[1].isoformat(),
+            'updatedAt': datetime.now().isoformat(),
+            'partitions': len(partitions),
+            'completed': len(done),
+            'complete': len(done) == len(partitions),
+            'rows': sum(entry['rows'] for entry in done),
+            'bytes': sum(entry.get('bytes', 0) for entry in done),
+            'failed': failed,
+            'open': [partition_key(p) for p in remaining if storable_end(p[3]) >= p[3]],
+            'waiting': [partition_key(p) for p in remaining if storable_end(p[3]) < p[3]],
+            'devices': devices,
+            'files': [entry for entry in done if entry.get('file')]
+        }
+        tmp_path = os.path.join(self.out_dir, f"{MANIFEST_SUMMARY}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.out_dir, MANIFEST_SUMMARY))
+        return summary
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+class BulkExport:
+    """Schreibt Partitionen atomar (über .tmp) und trägt abgeschlossene Tage im Manifest ein"""
+
+    def __init__(self, manifest: ExportManifest, keys: List[str], fmt: str):
+        self.manifest = manifest
+        self.keys = keys
+        self.fmt = fmt
+        self.completed = 0
+        self.failed: Dict[str, str] = {}
+        self.rows = 0
+        self.started = time.time()
+        self._last_progress = time.time()
+        self._lock = threading.Lock()  # write_partition läuft mit --pg in mehreren Threads
+
+    def relative_path(self, partition: Partition) -> str:
+        return os.path.join(partition[0], f"{partition[1]}{BULK_EXTENSIONS[self.fmt]}")
+
+    def write_partition(self, partition: Partition, write: Callable[[TelemetryExporter], Any]):
+        """write(exporter) schreibt die Werte der Partition; leere Partitionen hinterlassen keine Datei"""
+        day, device_id, start_ts, end_ts = partition
+        relative = self.relative_path(partition)
+        path = os.path.join(self.manifest.out_dir, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open_exporter(f"{path}.tmp", self.keys, self.fmt, self.manifest.header['types']) as exporter:
+            write(exporter)
+        if exporter.rows:
+            os.replace(f"{path}.tmp", path)
+        else:
+            os.remove(f"{path}.tmp")
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self.completed += 1
+            self.rows += exporter.rows
+        # Noch nicht beendete Tage werden beim nächsten Lauf erneut exportiert
+        if storable_end(end_ts) >= end_ts:
+            self.manifest.record(partition_key(partition), {
+                'day': day, 'deviceId': device_id, 'startTs': start_ts, 'endTs': end_ts,
+                'file': relative if exporter.rows else None, 'rows': exporter.rows, 'points': exporter.points,
+                'bytes': os.path.getsize(path) if exporter.rows else 0,
+                'exportedAt': datetime.now().isoformat()
+            })
+
+    def fail(self, partition: Partition, error: str):
+        with self._lock:
+            self.failed[partition_key(partition)] = error
+        print(f"❌ {partition_key(partition)}: {error}", file=sys.stderr)
+
+    def progress(self, total: int, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_progress < BULK_PROGRESS_S:
+            return
+        self._last_progress = now
+        rate = self.completed / max(1e-9, now - self.started)
+        print(f"   {self.completed + len(self.failed)}/{total} Partitionen, {self.rows} Zeilen, "
+              f"{len(self.failed)} fehlgeschlagen ({rate:.1f} Partitionen/s)", file=sys.stderr)
+
+async def fetch_partition(client: TelemetryClient, http: "aiohttp.ClientSession", budget: Optional[RateBudget],
+                          partition: Partition, keys: str, point_interval_ms: int,
+                          max_retries: int = MANY_MAX_RETRIES) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Alle Werte einer Partition über die API; Zeitfenster wie get_telemetry_range, abgeschnittene
+    Fenster werden geteilt. Jeder Request verbraucht einen Token des Budgets.
+    """
+    _, device_id, start_ts, end_ts = partition
+    # endTs ist bei ThingsBoard inklusiv: Werte um Mitternacht gehören zum nächsten Tag
+    windows = plan_time_windows(start_ts, end_ts - 1, point_interval_ms, RANGE_MAX_POINTS)
+    results = []
+    while windows:
+        window = windows.pop()
+        queued = time.perf_counter()
+        if budget is not None:
+            await budget.acquire()
+        params = {"deviceId": device_id, "keys": keys, "startTs": str(window[0]), "endTs": str(window[1]),
+                  "limit": str(RANGE_MAX_POINTS)}
+        data, error = await client._fetch_telemetry_async(http, params, max_retries, queued_since=queued)
+        if data is None:
+            return None, error
+        if is_window_truncated(data, RANGE_MAX_POINTS) and window[1] - window[0] > RANGE_MIN_WINDOW_MS:
+            middle = (window[0] + window[1]) // 2
+            windows.extend([(window[0], middle), (middle, window[1])])
+            continue
+        results.append(data)
+    return merge_telemetry_windows(results), None
+
+async def run_api(job: BulkExport, client: TelemetryClient, partitions: List[Partition], keys: str,
+                  concurrency: int, rate: Optional[float], point_interval_ms: int):
+    """Partitionen über die API, concurrency Worker teilen sich das Request-Budget"""
+    budget = RateBudget(rate) if rate else None
+    pending: asyncio.Queue = asyncio.Queue()
+    for partition in partitions:
+        pending.put_nowait(partition)
+
+    async def worker(http: "aiohttp.ClientSession"):
+        while True:
+            try:
+                partition = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            data, error = await fetch_partition(client, http, budget, partition, keys, point_interval_ms)
+            if data is None:
+                job.fail(partition, error)
+            else:
+                try:
+                    job.write_partition(partition, lambda exporter: exporter.write(partition[1], data))
+                except (RuntimeError, ValueError, OSError) as e:
+                    job.fail(partition, str(e))
+            job.progress(len(partitions))
+
+    async with client._async_http_session(concurrency) as http:
+        workers = [asyncio.ensure_future(worker(http)) for _ in range(min(concurrency, len(partitions)))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+def run_pg(job: BulkExport, partitions: List[Partition], concurrency: int):
+    """Partitionen direkt aus ts_kv; jeder Thread hat eine eigene Verbindung"""
+    from telemetry_pg import TsKvReader
+    local = threading.local()
+    readers: List[TsKvReader] = []
+    readers_lock = threading.Lock()
+
+    def export_partition(partition: Partition):
+        reader = getattr(local, 'reader', None)
+        if reader is None:
+            reader = local.reader = TsKvReader()
+            with readers_lock:
+                readers.append(reader)
+        _, device_id, start_ts, end_ts = partition
+        job.write_partition(partition, lambda exporter: reader.export(exporter, device_id, job.keys, start_ts, end_ts))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, BULK_PG_CONNECTIONS)))
+    try:
+        futures = {pool.submit(export_partition, partition): partition for partition in partitions}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                job.fail(futures[future], str(e) or type(e).__name__)
+            job.progress(len(partitions))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for reader in readers:
+            reader.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="HEATMANAGER Massenexport historischer Telemetrie (fortsetzbar)")
+    parser.add_argument("--url", default="http://localhost:3000",
+                       help="Base URL der API (Standard: http://localhost:3000)")
+    parser.add_argument("--username", help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", help="Passwort für die Anmeldung")
+    parser.add_argument("--out", required=True, metavar="VERZEICHNIS",
+                       help="Zielverzeichnis (erneuter Start mit demselben Verzeichnis setzt den Export fort)")
+    parser.add_argument("--month", help="Monat JJJJ-MM (alternativ --start/--end)")
+    parser.add_argument("--start", help="Erster Tag (ISO, z.B. 2025-01-01)")
+    parser.add_argument("--end", help="Tag nach dem letzten Tag (ISO, exklusiv, Standard: bis heute)")
+    parser.add_argument("--device-id", help="Device ID")
+    parser.add_argument("--device-ids", help="Komma-getrennte Liste von Device IDs")
+    parser.add_argument("--device-file", help="Datei mit einer Device ID pro Zeile")
+    parser.add_argument("--asset", help="Alle Devices unterhalb dieses Assets (ID oder Name, Standard: gesamter Tree)")
+    parser.add_argument("--customer-id", help="Tree direkt aus customer_settings laden (MSSQL, wie sync_structure.py)")
+    parser.add_argument("--tree-file", help="Tree aus JSON-Datei laden")
+    parser.add_argument("--keys", default=DEFAULT_KEYS, help="Komma-getrennte Liste der Telemetrie-Keys")
+    parser.add_argument("--types", metavar="KEY=TYP,...",
+                       help="Spaltentypen (float64 oder string) für Keys ohne bekannte Semantik; "
+                            "Standard: bekannte Zähler/Messwerte float64, alle anderen string")
+    parser.add_argument("--format", choices=BULK_FORMATS, default='parquet',
+                       help="Dateiformat pro Partition (Standard: parquet, zstd-komprimiert)")
+    parser.add_argument("--concurrency", type=int, default=MANY_MAX_CONCURRENCY,
+                       help=f"Gleichzeitig abgerufene Partitionen (Standard: {MANY_MAX_CONCURRENCY})")
+    parser.add_argument("--rate", type=float, default=BULK_RATE_LIMIT,
+                       help=f"Request-Budget gegenüber der API in Requests/s, 0 = unbegrenzt (Standard: {BULK_RATE_LIMIT:g})")
+    parser.add_argument("--point-interval", type=int, default=RANGE_POINT_INTERVAL_MS // 1000,
+                       help=f"Erwarteter Abstand zweier Werte in Sekunden (Standard: {RANGE_POINT_INTERVAL_MS // 1000})")
+    parser.add_argument("--pg", action="store_true",
+                       help="Direkt aus PostgreSQL (ts_kv) lesen, siehe telemetry_pg.py (benötigt psycopg2)")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für die gespeicherte Session (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true", help="Immer neu anmelden")
+    tracing.add_arguments(parser)
+
+    args = parser.parse_args()
+    tracing.start(args, "telemetry_bulk_export")
+    if not args.month and not args.start:
+        parser.error("Zeitraum angeben (--month oder --start)")
+    try:
+        period = parse_period(args)
+    except ValueError as e:
+        parser.error(f"Ungültiger Zeitraum: {e}")
+    # subtree_telemetry benötigt numpy, daher erst hier
+    from subtree_telemetry import needs_login, resolve_devices
+    login = needs_login(args)
+    if login and not (args.username and args.password):
+        parser.error("--username und --password sind erforderlich (außer mit --pg und Devices aus Liste, Datei oder Datenbank)")
+    if not args.pg and aiohttp is None:
+        print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+        sys.exit(1)
+    keys = [key.strip() for key in args.keys.split(',') if key.strip()]
+    try:
+        types = column_types(keys, parse_column_types(args.types))
+    except ValueError as e:
+        parser.error(f"Ungültige Spaltentypen: {e}")
+
+    client = None
+    if login:
+        client = TelemetryClient(args.url, session_store=None if args.no_session_cache else SessionStore(args.session_file))
+        with tracing.span("Anmeldung"):
+            logged_in = client.login(args.username, args.password)
+        if not logged_in:
+            print("❌ Anmeldung fehlgeschlagen. Beende Programm.")
+            sys.exit(1)
+
+    with tracing.span("Devices bestimmen"):
+        devices = resolve_devices(args, client)
+
+    try:
+        manifest = ExportManifest.open(args.out, keys, args.format, types)
+    except (ValueError, OSError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    partitions = plan_partitions(list(devices), *period)
+    todo = [partition for partition in partitions if partition_key(partition) not in manifest]
+    print(f"📦 {len(devices)} Devices, {period[0]} bis {period[1] - timedelta(days=1)}: {len(partitions)} Partitionen, "
+          f"{len(partitions) - len(todo)} bereits exportiert, {len(todo)} offen "
+          f"({'ts_kv' if args.pg else f'API, max. {args.rate:g} Requests/s' if args.rate else 'API'})", file=sys.stderr)
+
+    job = BulkExport(manifest, keys, args.format)
+    interrupted = False
+    try:
+        with tracing.span("Export", partitions=len(todo)):
+            if args.pg:
+                run_pg(job, todo, args.concurrency)
+            else:
+                asyncio.run(run_api(job, client, todo, ','.join(keys), args.concurrency, args.rate or None,
+                                    args.point_interval * 1000))
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        manifest.close()
+        summary = manifest.write_summary(partitions, job.failed, period, devices)
+
+    if todo:
+        job.progress(len(todo), force=True)
+    if not summary['open'] and not interrupted:
+        print(f"✅ Export vollständig: {summary['completed']} Partitionen, {summary['rows']} Zeilen, "
+              f"{summary['bytes'] / 1e6:.1f} MB in {args.out}", file=sys.stderr)
+        if summary['waiting']:
+            print(f"ℹ️  {len(summary['waiting'])} Partitionen des laufenden Tages sind vorläufig und werden "
+                  f"beim nächsten Lauf nach Tagesende abgeschlossen", file=sys.stderr)
+        return
+    if interrupted:
+        print("⏸️  Abgebrochen", file=sys.stderr)
+    print(f"⚠️  {len(summary['open'])} Partitionen offen ({len(job.failed)} fehlgeschlagen); "
+          f"zum Fortsetzen denselben Befehl erneut ausführen", file=sys.stderr)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -8,19 +8,91 @@ import requests
 import json
 import sys
 import os
+import time
+import asyncio
 from datetime import datetime, timedelta
 import argparse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+
+try:
+    import aiohttp
+except ImportError:  # Nur für get_telemetry_many benötigt
+    aiohttp = None
+
+from telemetry_store import TelemetryStore, DEFAULT_STORE_DIR, merge_ranges, subtract_ranges, storable_end
+from telemetry_export import TelemetryExporter, open_exporter, EXPORT_FORMATS
+from session_store import SessionStore, DEFAULT_SESSION_FILE, format_expiry
+import tracing
+
+DEFAULT_KEYS = "fCnt,sensorTemperature,targetTemperature,batteryVoltage,PercentValveOpen,rssi,snr,sf,signalQuality"
+
+# Parallele Abfragen mehrerer Geräte (get_telemetry_many)
+MANY_MAX_CONCURRENCY = 10
+MANY_MAX_RETRIES = 3
+MANY_REQUEST_TIMEOUT = 30
+MANY_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Lange Zeitbereiche in Fenstern abfragen (get_telemetry_range)
+RANGE_POINT_INTERVAL_MS = 10 * 60 * 1000  # Erwarteter Abstand zweier Werte (Sendeintervall der Geräte)
+RANGE_MAX_POINTS = 1000  # limit pro Fenster und Key
+RANGE_FILL_FACTOR = 0.5  # Fenster nur zur Hälfte füllen, damit Ausreißer nicht abgeschnitten werden
+RANGE_ALIGN_MS = 60 * 60 * 1000  # Fenstergrenzen auf volle Stunden
+RANGE_MIN_WINDOW_MS = 60 * 1000
+RANGE_MAX_ROUNDS = 4
+THINGSBOARD_DEFAULT_LIMIT = 100  # ThingsBoard-Standard wenn kein limit übergeben wird
+
+# Export: so viele Zeitfenster pro Block abrufen und schreiben, bevor der nächste Block folgt
+EXPORT_WINDOWS_PER_CHUNK = MANY_MAX_CONCURRENCY
 
 class TelemetryClient:
-    def __init__(self, base_url: str = "http://localhost:3000"):
+    def __init__(self, base_url: str = "http://localhost:3000", store: Optional[TelemetryStore] = None,
+                 session_store: Optional[SessionStore] = None):
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        self.session = tracing.trace_session(requests.Session())
         self.auth_token = None
+        self.session_data = None
+        self.store = store
+        self.session_store = session_store
+        self._credentials: Optional[Tuple[str, str]] = None
         
     def login(self, username: str, password: str) -> bool:
         """
-        Anmeldung über NextAuth
+        Anmeldung über NextAuth; mit session_store wird eine gespeicherte, noch gültige
+        Session wiederverwendet und nach einer neuen Anmeldung gespeichert
+        """
+        self._credentials = (username, password)
+        if self.session_store is not None:
+            entry = self.session_store.load(self.base_url, username)
+            if entry and entry.get('token'):
+                SessionStore.restore(self.session, entry)
+                self.auth_token = entry['token']
+                self.session_data = entry.get('session')
+                print(f"🔑 Gespeicherte Session wiederverwendet (gültig bis {format_expiry(entry)})")
+                return True
+        
+        if not self._login(username, password):
+            return False
+        if self.session_store is not None:
+            try:
+                self.session_store.save(self.base_url, username, self.session, self.session_data, self.auth_token)
+            except OSError as e:
+                print(f"⚠️  Session konnte nicht gespeichert werden: {e}")
+        return True
+    
+    def relogin(self) -> bool:
+        """Neue Anmeldung mit den Zugangsdaten von login(), z.B. nach 401 wegen abgelaufener Session"""
+        if not self._credentials:
+            return False
+        print("🔄 Session abgelaufen, melde neu an...", file=sys.stderr)
+        if self.session_store is not None:
+            self.session_store.clear(self.base_url, self._credentials[0])
+        self.session.cookies.clear()
+        self.auth_token = None
+        return self.login(*self._credentials)
+    
+    def _login(self, username: str, password: str) -> bool:
+        """
+        Anmeldung über NextAuth (signin + session)
         """
         try:
             login_url = f"{self.base_url}/api/auth/signin"
@@ -66,6 +138,7 @@ class TelemetryClient:
                 session_data = response.json()
                 if session_data and 'accessToken' in session_data:
                     self.auth_token = session_data['accessToken']
+                    self.session_data = session_data
                     print("✅ Auth-Token erfolgreich erhalten")
                     return True
                 else:
@@ -89,10 +162,15 @@ class TelemetryClient:
             print("❌ Kein Auth-Token verfügbar. Bitte zuerst anmelden.")
             return None
         
+        if self.store is not None and start_ts and end_ts:
+            if aiohttp is not None:
+                return self._get_telemetry_cached(device_id, keys or DEFAULT_KEYS, start_ts, end_ts)
+            print("⚠️  aiohttp ist nicht installiert, lokaler Speicher wird nicht verwendet")
+        
         try:
             # Standard-Keys falls keine angegeben
             if not keys:
-                keys = "fCnt,sensorTemperature,targetTemperature,batteryVoltage,PercentValveOpen,rssi,snr,sf,signalQuality"
+                keys = DEFAULT_KEYS
             
             # API-Endpunkt
             url = f"{self.base_url}/api/thingsboard/devices/telemetry"
@@ -122,6 +200,10 @@ class TelemetryClient:
             # API-Aufruf
             response = self.session.get(url, params=params, headers=headers)
             
+            if response.status_code == 401 and self.relogin():
+                headers["Authorization"] = f"Bearer {self.auth_token}"
+                response = self.session.get(url, params=params, headers=headers)
+            
             if response.status_code == 200:
                 data = response.json()
                 print("✅ Telemetriedaten erfolgreich abgerufen!")
@@ -135,6 +217,242 @@ class TelemetryClient:
             print(f"❌ Fehler beim API-Aufruf: {e}")
             return None
     
+    def _get_telemetry_cached(self, device_id: str, keys: str, start_ts: int, end_ts: int) -> Optional[Dict[str, Any]]:
+        """
+        Liest vorhandene Werte aus dem lokalen Speicher und lädt nur die fehlenden Teilbereiche
+        von der API (get_telemetry_range), die anschließend angehängt werden. Abgeschnittene Zeitfenster
+        werden nicht als abgedeckt gespeichert, der Aufruf liefert dann None.
+        """
+        key_list = [key.strip() for key in keys.split(',') if key.strip()]
+        index = self.store.load_index(device_id)
+        cacheable = [key for key in key_list if self.store.is_cacheable(device_id, key, index)]
+        missing = {key: self.store.missing_ranges(device_id, key, start_ts, end_ts, index) for key in cacheable}
+        gaps = merge_ranges([gap for ranges in missing.values() for gap in ranges])
+        remote: List[Dict[str, Any]] = []
+        incomplete = False
+        
+        for gap_start, gap_end in gaps:
+            gap_keys = [key for key in cacheable
+                        if any(start < gap_end and end > gap_start for start, end in missing[key])]
+            truncated: List[Tuple[int, int]] = []
+            data = asyncio.run(self.get_telemetry_range(device_id, ','.join(gap_keys), gap_start, gap_end,
+                                                        truncated=truncated))
+            if data is None:
+                return None
+            remote.append(data)
+            cutoff = storable_end(gap_end)
+            # endTs ist inklusiv: das abgeschnittene Fenster bleibt einschließlich seines Endes offen
+            unconfirmed = [(window_start, window_end + 1) for window_start, window_end in truncated]
+            for key in gap_keys:
+                for start, end in missing[key]:
+                    start, end = max(start, gap_start), min(end, gap_end, cutoff)
+                    for confirmed_start, confirmed_end in subtract_ranges(start, end, unconfirmed):
+                        self.store.append(device_id, key, confirmed_start, confirmed_end, data.get(key, []))
+            if truncated:
+                incomplete = True
+                print(f"❌ Device {device_id}: {len(truncated)} Zeitfenster abgeschnitten, "
+                      f"werden beim nächsten Abruf erneut geladen")
+        if incomplete:
+            return None
+        
+        # Nicht speicherbare Keys (auch neu als nicht-numerisch erkannte) immer vollständig abrufen
+        index = self.store.load_index(device_id)
+        remote_keys = [key for key in key_list if not self.store.is_cacheable(device_id, key, index)]
+        if remote_keys:
+            data = asyncio.run(self.get_telemetry_range(device_id, ','.join(remote_keys), start_ts, end_ts))
+            if data is None:
+                return None
+            remote.append(data)
+        
+        local_points = 0
+        result = {}
+        for key in key_list:
+            stored = []
+            if key not in remote_keys:
+                stored = self.store.to_response(self.store.read(device_id, key, start_ts, end_ts, index))
+                local_points += len(stored)
+            fetched = [point for data in remote for point in data.get(key, []) if start_ts <= point['ts'] < end_ts]
+            merged = merge_telemetry_windows([{key: stored}, {key: fetched}]).get(key)
+            if merged:
+                result[key] = merged
+        
+        print(f"💾 {local_points} Werte aus dem lokalen Speicher, {len(gaps)} fehlende Bereiche von der API geladen",
+              file=sys.stderr)
+        return result
+    
+    def _async_http_session(self, concurrency: int) -> "aiohttp.ClientSession":
+        """aiohttp-Session mit begrenztem Connection-Pool und den Cookies der Login-Session"""
+        if aiohttp is None:
+            raise RuntimeError("aiohttp ist nicht installiert (pip install aiohttp)")
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=concurrency),
+            timeout=aiohttp.ClientTimeout(total=MANY_REQUEST_TIMEOUT),
+            cookies=self.session.cookies.get_dict(),
+            trace_configs=tracing.aiohttp_trace_configs()
+        )
+    
+    async def _fetch_telemetry_async(self, http: "aiohttp.ClientSession", params: Dict[str, str],
+                                     max_retries: int, queued_since: Optional[float] = None
+                                     ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Einzelne Telemetrie-Abfrage mit Retries; liefert (Daten, Fehler).
+        queued_since (time.perf_counter()) ist der Zeitpunkt des Einreihens, für die Wartezeit im Trace.
+        """
+        url = f"{self.base_url}/api/thingsboard/devices/telemetry"
+        error = None
+        reauthenticated = False
+        for attempt in range(max_retries + 1):
+            token = self.auth_token
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            with tracing.http_span("GET", url, queued_since if attempt == 0 else None) as span:
+                span.start_inflight()
+                span.set(deviceId=params.get("deviceId"), attempt=attempt)
+                try:
+                    async with http.get(url, params=params, headers=headers) as response:
+                        span.set(status=response.status)
+                        if response.status == 200:
+                            return await response.json(), None
+                        if response.status == 401 and not reauthenticated:
+                            reauthenticated = True
+                            # Blockierend: parallele Abfragen mit derselben 401 sehen danach den neuen Token
+                            if token == self.auth_token and not self.relogin():
+                                return None, "HTTP 401 (Neuanmeldung fehlgeschlagen)"
+                            http.cookie_jar.update_cookies(self.session.cookies.get_dict())
+                            continue
+                        if response.status not in MANY_RETRY_STATUS:
+                            return None, f"HTTP {response.status}"
+                        error = f"HTTP {response.status}"
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = str(e) or type(e).__name__
+                    span.set(error=error)
+            if attempt < max_retries:
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        return None, f"{error} (nach {max_retries + 1} Versuchen)"
+    
+    async def get_telemetry_many(self, device_ids: List[str], keys: Optional[str] = None,
+                                 start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+                                 concurrency: int = MANY_MAX_CONCURRENCY,
+                                 max_retries: int = MANY_MAX_RETRIES) -> AsyncIterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """
+        Ruft Telemetriedaten für viele Geräte parallel ab und liefert (device_id, Daten) in der
+        Reihenfolge der Fertigstellung; Daten sind None wenn alle Versuche fehlschlagen.
+        Nutzt die Session-Cookies und den Auth-Token von login().
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp ist nicht installiert (pip install aiohttp)")
+        if not self.auth_token:
+            print("❌ Kein Auth-Token verfügbar. Bitte zuerst anmelden.")
+            return
+        
+        base_params = {"keys": keys or DEFAULT_KEYS}
+        if start_ts:
+            base_params["startTs"] = str(start_ts)
+        if end_ts:
+            base_params["endTs"] = str(end_ts)
+        
+        pending: asyncio.Queue = asyncio.Queue()
+        enqueued = time.perf_counter()
+        for device_id in device_ids:
+            pending.put_nowait(device_id)
+        results: asyncio.Queue = asyncio.Queue()
+        
+        async def worker(http: "aiohttp.ClientSession"):
+            while True:
+                try:
+                    device_id = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                data, error = await self._fetch_telemetry_async(http, dict(base_params, deviceId=device_id),
+                                                                max_retries, queued_since=enqueued)
+                if error:
+                    print(f"❌ Device {device_id}: {error}")
+                await results.put((device_id, data))
+        
+        async with self._async_http_session(concurrency) as http:
+            workers = [asyncio.ensure_future(worker(http)) for _ in range(min(concurrency, len(device_ids)))]
+            try:
+                for _ in range(len(device_ids)):
+                    yield await results.get()
+            finally:
+                # Bei vorzeitigem Abbruch des Iterators laufende Abfragen beenden
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+    
+    async def get_telemetry_range(self, device_id: str, keys: Optional[str], start_ts: int, end_ts: int,
+                                  point_interval_ms: int = RANGE_POINT_INTERVAL_MS,
+                                  max_points: int = RANGE_MAX_POINTS,
+                                  concurrency: int = MANY_MAX_CONCURRENCY,
+                                  max_retries: int = MANY_MAX_RETRIES,
+                                  verbose: bool = True,
+                                  truncated: Optional[List[Tuple[int, int]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ruft einen langen Zeitbereich in ausgerichteten Zeitfenstern parallel ab (siehe plan_time_windows).
+        Fenster, die das Limit erreichen, werden bis RANGE_MIN_WINDOW_MS geteilt; ist ein Fenster dann
+        noch abgeschnitten, gilt der Abruf als fehlgeschlagen; mit truncated wird es stattdessen dort
+        eingetragen und seine Werte bleiben im Ergebnis (für den lokalen Speicher). Fehlgeschlagene Fenster werden in bis zu
+        RANGE_MAX_ROUNDS Runden einzeln wiederholt. Liefert die zusammengeführten Daten oder None.
+        verbose=False unterdrückt die Fortschrittsausgaben (Fehler werden weiterhin ausgegeben).
+        """
+        if not self.auth_token:
+            print("❌ Kein Auth-Token verfügbar. Bitte zuerst anmelden.")
+            return None
+        
+        keys = keys or DEFAULT_KEYS
+        windows = plan_time_windows(start_ts, end_ts, point_interval_ms, max_points)
+        if verbose:
+            print(f"📡 Rufe {device_id} in {len(windows)} Zeitfenstern ab (max. {concurrency} parallel)...", file=sys.stderr)
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        completed: List[Dict[str, Any]] = []
+        
+        async def fetch_window(http: "aiohttp.ClientSession", window: Tuple[int, int]):
+            params = {"deviceId": device_id, "keys": keys, "startTs": str(window[0]),
+                      "endTs": str(window[1]), "limit": str(max_points)}
+            queued = time.perf_counter()
+            async with semaphore:
+                data, error = await self._fetch_telemetry_async(http, params, max_retries, queued_since=queued)
+            return window, data, error
+        
+        async with self._async_http_session(concurrency) as http:
+            # Nur Fehlschläge verbrauchen Runden, abgeschnittene Fenster werden immer weiter geteilt
+            failed_rounds = 0
+            while windows:
+                failed = []
+                split = []
+                for window, data, error in await asyncio.gather(*(fetch_window(http, w) for w in windows)):
+                    if data is None:
+                        failed.append((window, error))
+                    elif is_window_truncated(data, max_points):
+                        if window[1] - window[0] <= RANGE_MIN_WINDOW_MS:
+                            if truncated is not None:
+                                truncated.append(window)
+                                completed.append(data)
+                                continue
+                            print(f"❌ Zeitfenster {window[0]}-{window[1]}: mehr als {max_points} Werte, "
+                                  f"auch nach dem Teilen abgeschnitten")
+                            return None
+                        # Mehr Werte als erwartet: Fenster halbieren statt Daten abzuschneiden
+                        middle = (window[0] + window[1]) // 2
+                        split.extend([(window[0], middle), (middle, window[1])])
+                    else:
+                        completed.append(data)
+                windows = [window for window, _ in failed] + split
+                if failed:
+                    failed_rounds += 1
+                    if failed_rounds >= RANGE_MAX_ROUNDS:
+                        for window, error in failed:
+                            print(f"❌ Zeitfenster {window[0]}-{window[1]}: {error}")
+                        return None
+                    if verbose:
+                        print(f"⚠️  {len(failed)} Zeitfenster fehlgeschlagen (Runde {failed_rounds}), wiederhole nur diese...",
+                              file=sys.stderr)
+        
+        return merge_telemetry_windows(completed)
+    
     def format_telemetry_data(self, data: Dict[str, Any]) -> str:
         """
         Formatiert die Telemetriedaten für die Anzeige
@@ -191,47 +509,359 @@ class TelemetryClient:
         start_time = int((datetime.now() - timedelta(hours=hours)).timestamp() * 1000)
         return start_time, end_time
 
+def range_window_ms(point_interval_ms: int = RANGE_POINT_INTERVAL_MS, max_points: int = RANGE_MAX_POINTS) -> int:
+    """Fenstergröße für plan_time_windows (Vielfaches von RANGE_ALIGN_MS)"""
+    window_ms = int(point_interval_ms * max_points * RANGE_FILL_FACTOR)
+    return max(RANGE_ALIGN_MS, window_ms - window_ms % RANGE_ALIGN_MS)
+
+def plan_time_windows(start_ts: int, end_ts: int, point_interval_ms: int = RANGE_POINT_INTERVAL_MS,
+                      max_points: int = RANGE_MAX_POINTS) -> List[Tuple[int, int]]:
+    """
+    Teilt [start_ts, end_ts] in Fenster, die bei der erwarteten Punktdichte höchstens zur Hälfte
+    des Limits gefüllt sind. Die Grenzen liegen auf Vielfachen der Fenstergröße (ab Epoch),
+    damit wiederholte Abfragen dieselben Fenster erzeugen; benachbarte Fenster teilen ihre Grenze.
+    """
+    window_ms = range_window_ms(point_interval_ms, max_points)
+    windows = []
+    boundary = start_ts - start_ts % window_ms
+    while boundary < end_ts:
+        next_boundary = boundary + window_ms
+        windows.append((max(boundary, start_ts), min(next_boundary, end_ts)))
+        boundary = next_boundary
+    return windows or [(start_ts, end_ts)]
+
+def is_window_truncated(data: Dict[str, Any], max_points: int) -> bool:
+    """Ein Key mit genau max_points Werten deutet auf abgeschnittene Daten hin"""
+    return any(isinstance(values, list) and len(values) >= max_points for values in data.values())
+
+def merge_telemetry_windows(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Führt die Ergebnisse mehrerer Zeitfenster pro Key zusammen: Werte an gemeinsamen
+    Fenstergrenzen werden über den Zeitstempel dedupliziert, sortiert wird absteigend
+    wie in der ThingsBoard-Antwort.
+    """
+    merged: Dict[str, Dict[int, Dict[str, Any]]] = {}
+    for data in results:
+        for key, values in data.items():
+            by_ts = merged.setdefault(key, {})
+            for value in values or []:
+                by_ts[value['ts']] = value
+    return {key: [by_ts[ts] for ts in sorted(by_ts, reverse=True)] for key, by_ts in merged.items()}
+
+def format_telemetry_stats(data: Dict[str, Any]) -> str:
+    """Vektorisierte Kennzahlen pro Key (benötigt numpy, siehe telemetry_arrays.py)"""
+    from telemetry_arrays import response_to_columns
+    return format_column_stats(response_to_columns(data))
+
+def format_column_stats(columns: Dict[str, Tuple[Any, Any]]) -> str:
+    """Kennzahlen für bereits spaltenweise vorliegende Werte (z.B. aus telemetry_pg.read_columns)"""
+    from telemetry_arrays import column_stats, resample, BUCKET_MS
+    
+    def fmt(value) -> str:
+        return f"{value:.2f}" if value is not None else "-"
+    
+    result = ["📊 TELEMETRIE-STATISTIK", "=" * 95,
+              f"{'Key':<20} {'Werte':>9} {'NaN':>6} {'Min':>9} {'Max':>9} {'Mittel':>9} {'p5':>9} {'p50':>9} {'p95':>9} {'10min':>7}"]
+    for key, (timestamps, values) in columns.items():
+        stats = column_stats(timestamps, values)
+        buckets = resample(timestamps, values, BUCKET_MS)[0].size
+        result.append(f"{key:<20} {stats['count']:>9} {stats['nanCount']:>6} {fmt(stats['min']):>9} {fmt(stats['max']):>9} "
+                      f"{fmt(stats['mean']):>9} {fmt(stats.get('p5')):>9} {fmt(stats.get('p50')):>9} "
+                      f"{fmt(stats.get('p95')):>9} {buckets:>7}")
+    return "\n".join(result)
+
+def load_device_ids(args) -> List[str]:
+    """Device IDs aus --device-id, --device-ids und --device-file (ohne Duplikate, Reihenfolge bleibt)"""
+    device_ids = []
+    if args.device_id:
+        device_ids.append(args.device_id)
+    if args.device_ids:
+        device_ids.extend(d.strip() for d in args.device_ids.split(','))
+    if args.device_file:
+        with open(args.device_file, encoding='utf-8') as f:
+            device_ids.extend(line.strip() for line in f if not line.lstrip().startswith('#'))
+    return list(dict.fromkeys(d for d in device_ids if d))
+
+async def export_telemetry_range(client: TelemetryClient, exporter: TelemetryExporter, device_id: str,
+                                 keys: Optional[str], start_ts: int, end_ts: int,
+                                 point_interval_ms: int = RANGE_POINT_INTERVAL_MS,
+                                 concurrency: int = MANY_MAX_CONCURRENCY) -> bool:
+    """
+    Exportiert einen langen Zeitbereich blockweise: jeder Block umfasst EXPORT_WINDOWS_PER_CHUNK
+    Zeitfenster, wird parallel abgerufen (get_telemetry_range), geschrieben und verworfen.
+    Der Speicherbedarf hängt so nur von der Blockgröße ab, nicht von der Länge des Zeitbereichs.
+    """
+    chunk_ms = range_window_ms(point_interval_ms) * max(EXPORT_WINDOWS_PER_CHUNK, concurrency)
+    boundary = start_ts - start_ts % chunk_ms
+    while boundary < end_ts:
+        chunk_start, chunk_end = max(boundary, start_ts), min(boundary + chunk_ms, end_ts)
+        data = await client.get_telemetry_range(device_id, keys, chunk_start, chunk_end,
+                                                point_interval_ms=point_interval_ms, concurrency=concurrency)
+        if data is None:
+            return False
+        if chunk_end < end_ts:
+            # Werte auf der Blockgrenze gehören zum nächsten Block
+            data = {key: [point for point in values if point['ts'] < chunk_end] for key, values in data.items()}
+        exporter.write(device_id, data)
+        print(f"💾 {exporter.rows} Zeilen bis {datetime.fromtimestamp(chunk_end / 1000):%Y-%m-%d %H:%M} exportiert",
+              file=sys.stderr)
+        boundary += chunk_ms
+    return True
+
+async def print_telemetry_many(client: TelemetryClient, device_ids: List[str], keys: Optional[str],
+                               start_ts: int, end_ts: int, concurrency: int, raw: bool, stats: bool = False,
+                               exporter: Optional[TelemetryExporter] = None) -> int:
+    """
+    Gibt die Daten jedes Geräts aus (oder schreibt sie in den Export), sobald sie vorliegen;
+    liefert die Anzahl fehlgeschlagener Geräte
+    """
+    print(f"📡 Rufe Telemetriedaten für {len(device_ids)} Geräte ab (max. {concurrency} parallel)...", file=sys.stderr)
+    failed = 0
+    async for device_id, data in client.get_telemetry_many(device_ids, keys, start_ts, end_ts, concurrency=concurrency):
+        if data is None:
+            failed += 1
+        elif exporter is not None:
+            exporter.write(device_id, data)
+        elif raw:
+            # Eine JSON-Zeile pro Gerät
+            print(json.dumps({"deviceId": device_id, "data": data}, ensure_ascii=False))
+        else:
+            print(f"\n📟 Device {device_id}")
+            print(format_telemetry_stats(data) if stats else client.format_telemetry_data(data))
+    return failed
+
+def export_telemetry(client: TelemetryClient, args, device_ids: List[str], start_ts: int, end_ts: int,
+                     reader=None) -> bool:
+    """
+    --export: schreibt die Werte blockweise in die Datei statt sie auszugeben; False bei Fehlern.
+    Mit reader (telemetry_pg.TsKvReader, --pg) direkt aus ts_kv über einen Server-Side-Cursor.
+    """
+    keys = args.keys or DEFAULT_KEYS
+    try:
+        exporter = open_exporter(args.export, [key.strip() for key in keys.split(',') if key.strip()], args.export_format)
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"❌ Export nicht möglich: {e}")
+        return False
+    
+    point_interval_ms = args.point_interval * 1000
+    with exporter:
+        if reader is not None:
+            for device_id in device_ids:
+                rows = reader.export(exporter, device_id, exporter.keys, start_ts, end_ts)
+                print(f"💾 Device {device_id}: {rows} Zeilen aus ts_kv exportiert", file=sys.stderr)
+            success = True
+        elif len(device_ids) > 1:
+            failed = asyncio.run(print_telemetry_many(client, device_ids, keys, start_ts, end_ts,
+                                                      args.concurrency, False, exporter=exporter))
+            if failed:
+                print(f"❌ Keine Telemetriedaten für {failed} von {len(device_ids)} Geräten.")
+            success = not failed
+        elif client.store is None and not args.downsample and aiohttp is not None:
+            success = asyncio.run(export_telemetry_range(client, exporter, device_ids[0], keys, start_ts, end_ts,
+                                                         point_interval_ms, args.concurrency))
+        else:
+            data = client.get_telemetry(device_ids[0], keys, start_ts, end_ts)
+            if data and args.downsample:
+                from telemetry_arrays import downsample_response
+                data = downsample_response(data, args.downsample, args.downsample_method)
+            if data:
+                exporter.write(device_ids[0], data)
+            success = bool(data)
+    
+    size_mb = os.path.getsize(args.export) / (1024 * 1024)
+    print(f"{'✅' if success else '⚠️ '} {exporter.points} Werte in {exporter.rows} Zeilen exportiert: "
+          f"{args.export} ({size_mb:.1f} MB)")
+    return success
+
+def read_postgres(client: TelemetryClient, args, device_ids: List[str], start_ts: int, end_ts: int) -> bool:
+    """--pg: Telemetrie direkt aus ts_kv lesen (Export, Statistik per COPY oder Ausgabe wie über die API)"""
+    from telemetry_pg import TsKvReader
+    try:
+        reader = TsKvReader()
+    except Exception as e:
+        print(f"❌ Keine Verbindung zu PostgreSQL: {e}")
+        return False
+    keys = [key.strip() for key in (args.keys or DEFAULT_KEYS).split(',') if key.strip()]
+    try:
+        if args.export:
+            return export_telemetry(client, args, device_ids, start_ts, end_ts, reader=reader)
+        for device_id in device_ids:
+            if len(device_ids) > 1 and not args.raw:
+                print(f"\n📟 Device {device_id}")
+            if args.stats:
+                print(format_column_stats(reader.read_columns(device_id, keys, start_ts, end_ts)))
+                continue
+            data = reader.read_telemetry(device_id, keys, start_ts, end_ts)
+            if data and args.downsample:
+                from telemetry_arrays import downsample_response
+                data = downsample_response(data, args.downsample, args.downsample_method)
+            if args.raw:
+                print(json.dumps({"deviceId": device_id, "data": data} if len(device_ids) > 1 else data,
+                                 indent=None if len(device_ids) > 1 else 2, ensure_ascii=False))
+            else:
+                print(client.format_telemetry_data(data))
+        return True
+    finally:
+        reader.close()
+
+def follow(client: TelemetryClient, args, device_ids: List[str]) -> bool:
+    """--follow: neue Werte ausgeben oder an den Export anhängen, bis Strg+C oder --follow-duration"""
+    if aiohttp is None:
+        print("❌ aiohttp ist nicht installiert (pip install aiohttp)")
+        return False
+    from telemetry_follow import follow_telemetry, TelemetryFollower
+    
+    keys = args.keys or DEFAULT_KEYS
+    exporter = None
+    if args.export:
+        try:
+            exporter = open_exporter(args.export, [key.strip() for key in keys.split(',') if key.strip()],
+                                     args.export_format, append=True)
+        except (RuntimeError, ValueError, OSError) as e:
+            print(f"❌ Export nicht möglich: {e}")
+            return False
+    
+    print(f"👀 Verfolge {len(device_ids)} Geräte (Strg+C zum Beenden)...", file=sys.stderr)
+    follower = TelemetryFollower(client, device_ids, keys, exporter, args.concurrency)
+    try:
+        asyncio.run(follow_telemetry(follower, args.ws_url, args.follow_duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if exporter is not None:
+            exporter.close()
+    print(f"⏹️  {follower.new_points} neue Werte in {follower.requests} Abfragen", file=sys.stderr)
+    return True
+
 def main():
     parser = argparse.ArgumentParser(description="HEATMANAGER Telemetrie-API Client")
     parser.add_argument("--url", default="http://localhost:3000", 
                        help="Base URL der API (Standard: http://localhost:3000)")
-    parser.add_argument("--username", required=True, help="Benutzername für die Anmeldung")
-    parser.add_argument("--password", required=True, help="Passwort für die Anmeldung")
-    parser.add_argument("--device-id", required=True, help="Device ID für Telemetriedaten")
+    parser.add_argument("--username", help="Benutzername für die Anmeldung")
+    parser.add_argument("--password", help="Passwort für die Anmeldung")
+    parser.add_argument("--device-id", help="Device ID für Telemetriedaten")
+    parser.add_argument("--device-ids", help="Komma-getrennte Liste von Device IDs (parallele Abfrage)")
+    parser.add_argument("--device-file", help="Datei mit einer Device ID pro Zeile (parallele Abfrage)")
+    parser.add_argument("--concurrency", type=int, default=MANY_MAX_CONCURRENCY,
+                       help=f"Maximale Anzahl paralleler Abfragen (Standard: {MANY_MAX_CONCURRENCY})")
     parser.add_argument("--keys", help="Komma-getrennte Liste der Telemetrie-Keys")
     parser.add_argument("--hours", type=int, default=24, 
                        help="Anzahl der Stunden für den Zeitbereich (Standard: 24)")
     parser.add_argument("--raw", action="store_true", 
                        help="Rohe JSON-Ausgabe")
+    parser.add_argument("--stats", action="store_true",
+                       help="Statistik pro Key ausgeben (Min/Max/Mittel/Perzentile, benötigt numpy)")
+    parser.add_argument("--downsample", type=int, metavar="N",
+                       help="Jede Zeitreihe auf höchstens N Punkte reduzieren (benötigt numpy)")
+    parser.add_argument("--downsample-method", choices=["lttb", "minmax", "stride"], default="lttb",
+                       help="Verfahren für --downsample (Standard: lttb)")
+    parser.add_argument("--cache", action="store_true",
+                       help="Lokalen Telemetrie-Speicher verwenden (nur fehlende Zeitbereiche abrufen)")
+    parser.add_argument("--cache-dir", default=DEFAULT_STORE_DIR,
+                       help=f"Verzeichnis des lokalen Speichers (Standard: {DEFAULT_STORE_DIR})")
+    parser.add_argument("--chunked", action="store_true",
+                       help="Zeitbereich in parallelen Zeitfenstern abfragen (automatisch bei langen Zeitbereichen)")
+    parser.add_argument("--session-file", default=DEFAULT_SESSION_FILE,
+                       help=f"Datei für die gespeicherte Session (Standard: {DEFAULT_SESSION_FILE})")
+    parser.add_argument("--no-session-cache", action="store_true",
+                       help="Immer neu anmelden und keine Session speichern")
+    parser.add_argument("--export", metavar="DATEI",
+                       help="Werte blockweise in eine Datei exportieren (.ndjson, .csv, .parquet, .arrow; .gz für NDJSON/CSV)")
+    parser.add_argument("--export-format", choices=EXPORT_FORMATS,
+                       help="Exportformat (Standard: aus der Dateiendung, sonst ndjson)")
+    parser.add_argument("--follow", action="store_true",
+                       help="Live-Modus: nur neue Werte abfragen und ausgeben (mit --export anhängen), Ende mit Strg+C")
+    parser.add_argument("--ws-url",
+                       help="Im Live-Modus ThingsBoard-WebSocket verwenden, z.B. wss://thingsboard.heatmanager.de")
+    parser.add_argument("--follow-duration", type=float, metavar="SEKUNDEN",
+                       help="Live-Modus nach dieser Zeit beenden")
+    parser.add_argument("--point-interval", type=int, default=RANGE_POINT_INTERVAL_MS // 1000,
+                       help=f"Erwarteter Abstand zweier Werte in Sekunden für die Fensterplanung (Standard: {RANGE_POINT_INTERVAL_MS // 1000})")
+    parser.add_argument("--pg", action="store_true",
+                       help="Direkt aus PostgreSQL (ts_kv) lesen statt über die API; Verbindung über PG_HOST, PG_USER, ... (benötigt psycopg2)")
+    tracing.add_arguments(parser)
     
     args = parser.parse_args()
+    tracing.start(args, "telemetry_client")
+    
+    device_ids = load_device_ids(args)
+    if not device_ids:
+        parser.error("Mindestens eine Device ID angeben (--device-id, --device-ids oder --device-file)")
+    if not args.pg and not (args.username and args.password):
+        parser.error("--username und --password sind erforderlich (außer mit --pg)")
     
     # Client erstellen
-    client = TelemetryClient(args.url)
+    client = TelemetryClient(args.url, store=TelemetryStore(args.cache_dir) if args.cache else None,
+                             session_store=None if args.no_session_cache else SessionStore(args.session_file))
+    
+    if args.pg:
+        start_ts, end_ts = client.get_current_time_range(args.hours)
+        with tracing.span("PostgreSQL lesen"):
+            ok = read_postgres(client, args, device_ids, start_ts, end_ts)
+        sys.exit(0 if ok else 1)
     
     # Anmelden
-    if not client.login(args.username, args.password):
+    with tracing.span("Anmeldung"):
+        logged_in = client.login(args.username, args.password)
+    if not logged_in:
         print("❌ Anmeldung fehlgeschlagen. Beende Programm.")
         sys.exit(1)
     
+    if args.follow:
+        sys.exit(0 if follow(client, args, device_ids) else 1)
+    
     # Zeitbereich berechnen
     start_ts, end_ts = client.get_current_time_range(args.hours)
     
-    # Telemetriedaten abrufen
-    telemetry_data = client.get_telemetry(
-        device_id=args.device_id,
-        keys=args.keys,
-        start_ts=start_ts,
-        end_ts=end_ts
-    )
+    if args.export:
+        with tracing.span("Export", devices=len(device_ids)):
+            ok = export_telemetry(client, args, device_ids, start_ts, end_ts)
+        if not ok:
+            sys.exit(1)
+        return
     
-    if telemetry_data:
-        if args.raw:
-            # Rohe JSON-Ausgabe
-            print(json.dumps(telemetry_data, indent=2, ensure_ascii=False))
+    if len(device_ids) > 1:
+        with tracing.span("Abruf und Ausgabe", devices=len(device_ids)):
+            failed = asyncio.run(print_telemetry_many(client, device_ids, args.keys, start_ts, end_ts,
+                                                      args.concurrency, args.raw, args.stats))
+        if failed:
+            print(f"❌ Keine Telemetriedaten für {failed} von {len(device_ids)} Geräten.")
+            sys.exit(1)
+        return
+    
+    # Mehr erwartete Werte als ThingsBoard ohne limit liefert: in Zeitfenstern abfragen
+    point_interval_ms = args.point_interval * 1000
+    expected_points = (end_ts - start_ts) // max(1, point_interval_ms)
+    with tracing.span("Abruf"):
+        if client.store is None and (args.chunked or (aiohttp is not None and expected_points > THINGSBOARD_DEFAULT_LIMIT)):
+            telemetry_data = asyncio.run(client.get_telemetry_range(
+                device_ids[0], args.keys, start_ts, end_ts,
+                point_interval_ms=point_interval_ms, concurrency=args.concurrency
+            ))
         else:
-            # Formatierte Ausgabe
-            print(client.format_telemetry_data(telemetry_data))
+            # Telemetriedaten abrufen
+            telemetry_data = client.get_telemetry(
+                device_id=device_ids[0],
+                keys=args.keys,
+                start_ts=start_ts,
+                end_ts=end_ts
+            )
+    
+    if telemetry_data and args.downsample:
+        from telemetry_arrays import downsample_response
+        with tracing.span("Downsampling"):
+            telemetry_data = downsample_response(telemetry_data, args.downsample, args.downsample_method)
+    
+    if telemetry_data:
+        with tracing.span("Ausgabe"):
+            if args.raw:
+                # Rohe JSON-Ausgabe
+                print(json.dumps(telemetry_data, indent=2, ensure_ascii=False))
+            elif args.stats:
+                print(format_telemetry_stats(telemetry_data))
+            else:
+                # Formatierte Ausgabe
+                print(client.format_telemetry_data(telemetry_data))
     else:
         print("❌ Konnte keine Telemetriedaten abrufen.")
         sys.exit(1)
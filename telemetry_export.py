@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Streaming-Export von Telemetriedaten für die Telemetrie-Clients
+Schreibt die Antworten von /api/thingsboard/devices/telemetry blockweise als NDJSON, CSV
+(eine Spalte pro Key) oder spaltenorientiert als Parquet/Arrow, ohne den gesamten Export
+im Speicher zu halten. Pro Zeile: Gerät, Zeitstempel und die Werte aller Keys.
+"""
+
+import os
+import csv
+import gzip
+import json
+import math
+import heapq
+from abc import ABC, abstractmethod
+from operator import itemgetter
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+from telemetry_store import parse_value
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'parquet', 'arrow')
+
+# Dateiendung -> Format (ohne .gz)
+EXPORT_EXTENSIONS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.json': 'ndjson',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow'
+}
+
+EXPORT_BUFFER_BYTES = 1024 * 1024  # Schreibpuffer für NDJSON/CSV
+EXPORT_ROW_GROUP_ROWS = 65536  # Zeilen pro Parquet-Row-Group bzw. Arrow-Batch
+EXPORT_COMPRESSION = 'zstd'
+
+# Spaltentypen für Parquet/Arrow; unbekannte Keys werden als string exportiert (verlustfrei)
+EXPORT_COLUMN_TYPES = ('float64', 'string')
+NUMERIC_KEYS = ('fCnt', 'sensorTemperature', 'targetTemperature', 'batteryVoltage', 'PercentValveOpen',
+                'rssi', 'snr', 'sf')
+STRING_KEYS = ('signalQuality',)
+
+def detect_format(path: str) -> str:
+    """Format anhand der Dateiendung (Standard: ndjson)"""
+    base = path[:-3] if path.endswith('.gz') else path
+    return EXPORT_EXTENSIONS.get(os.path.splitext(base)[1].lower(), 'ndjson')
+
+def column_types(keys: List[str], types: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Spaltentyp pro Key: explizit übergeben, sonst aus der bekannten Key-Semantik (NUMERIC_KEYS,
+    STRING_KEYS). Unbekannte Keys werden string, damit keine Werte verloren gehen.
+    """
+    types = types or {}
+    result = {}
+    for key in keys:
+        column_type = types.get(key) or ('float64' if key in NUMERIC_KEYS else 'string')
+        if column_type not in EXPORT_COLUMN_TYPES:
+            raise ValueError(f"Unbekannter Spaltentyp für {key}: {column_type} (erlaubt: {', '.join(EXPORT_COLUMN_TYPES)})")
+        result[key] = column_type
+    return result
+
+def _key_points(values: List[Dict[str, Any]], index: int) -> Iterator[Tuple[int, int, Any]]:
+    if len(values) > 1 and values[0]['ts'] > values[-1]['ts']:
+        values = reversed(values)
+    for point in values:
+        yield point['ts'], index, point.get('value')
+
+def iter_rows(data: Dict[str, Any], keys: List[str]) -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Führt die Werte aller Keys zu Zeilen (ts, [Wert pro Key]) zusammen, aufsteigend nach Zeit.
+    Die Listen der Antwort sind bereits sortiert (ThingsBoard: absteigend), daher genügt ein
+    k-Wege-Merge ohne Zwischenkopie.
+    """
+    columns = [_key_points(data.get(key) or [], index) for index, key in enumerate(keys)]
+    row_ts, row = None, None
+    for ts, index, value in heapq.merge(*columns, key=itemgetter(0)):
+        if ts != row_ts:
+            if row is not None:
+                yield row_ts, row
+            row_ts, row = ts, [None] * len(keys)
+        row[index] = value
+    if row is not None:
+        yield row_ts, row
+
+def json_value(value: Any) -> Any:
+    """Numerische Strings als Zahl (kompakter als NDJSON-String), alles andere unverändert"""
+    number = parse_value(value) if isinstance(value, str) else None
+    if number is None or not math.isfinite(number):
+        return value
+    return int(number) if number.is_integer() else number
+
+class TelemetryExporter(ABC):
+    """
+    Basisklasse: write() nimmt die Antwort eines Geräts (oder eines Zeitfensters davon) entgegen
+    und schreibt sie sofort bzw. nach EXPORT_ROW_GROUP_ROWS Zeilen; die Antwort kann danach
+    verworfen werden. Als Kontextmanager verwenden, damit die Datei abgeschlossen wird.
+    """
+
+    def __init__(self, path: str, keys: List[str]):
+        self.path = path
+        self.keys = list(keys)
+        self.rows = 0
+        self.points = 0
+        self.skipped_keys = set()
+
+    def write(self, device_id: str, data: Dict[str, Any]) -> int:
+        """Schreibt die Werte eines Geräts; liefert die Anzahl geschriebener Zeilen"""
+        unknown = [key for key in data if key not in self.keys and key not in self.skipped_keys]
+        if unknown:
+            print(f"⚠️  Keys ohne Spalte im Export werden übersprungen: {', '.join(unknown)}")
+            self.skipped_keys.update(unknown)
+        rows = self._write_rows(device_id, iter_rows(data, self.keys))
+        self.rows += rows
+        self.points += sum(len(data.get(key) or []) for key in self.keys)
+        return rows
+
+    @abstractmethod
+    def _write_rows(self, device_id: str, rows: Iterator[Tuple[int, List[Any]]]) -> int:
+        """Schreibt die Zeilen (ts, [Wert pro Key]) eines Geräts; liefert deren Anzahl"""
+
+    def flush(self):
+        """Geschriebene Zeilen sofort in die Datei übernehmen (z.B. im Live-Modus)"""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _has_content(path: str) -> bool:
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def _open_text(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, f'{mode}t', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='', buffering=EXPORT_BUFFER_BYTES)
+
+class _TextExporter(TelemetryExporter):
+    """
+    Gemeinsame Dateibehandlung für NDJSON und CSV (.gz wird komprimiert). Mit append=True wird an
+    eine vorhandene Datei angehängt (--follow), .gz als weiteres gzip-Member.
+    """
+
+    def __init__(self, path: str, keys: List[str], append: bool = False):
+        super().__init__(path, keys)
+        self.appending = append and _has_content(path)
+        self.file = _open_text(path, 'a' if append else 'w')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class NdjsonExporter(_TextExporter):
+    """Eine JSON-Zeile pro Gerät und Zeitstempel; fehlende Keys werden weggelassen"""
+
+    def _write_rows(self, device_id: str, rows: Iterator[Tuple[int, List[Any]]]) -> int:
+        count = 0
+        lines = []
+        for ts, values in rows:
+            record = {'deviceId': device_id, 'ts': ts}
+            for key, value in zip(self.keys, values):
+                if value is not None:
+                    record[key] = json_value(value)
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            count += 1
+            if len(lines) >= EXPORT_ROW_GROUP_ROWS:
+                self.file.write('\n'.join(lines) + '\n')
+                lines = []
+        if lines:
+            self.file.write('\n'.join(lines) + '\n')
+        return count
+
+class CsvExporter(_TextExporter):
+    """Spalten deviceId, ts und ein Key pro Spalte; fehlende Werte bleiben leer"""
+
+    def __init__(self, path: str, keys: List[str], append: bool = False):
+        header = ['deviceId', 'ts'] + list(keys)
+        if append and _has_content(path):
+            with _open_text(path, 'r') as f:
+                existing = next(csv.reader(f), None)
+            if existing != header:
+                raise ValueError(f"{path} hat andere Spalten ({','.join(existing or [])}), Anhängen nicht möglich")
+        super().__init__(path, keys, append)
+        self.writer = csv.writer(self.file)
+        if not self.appending:
+            self.writer.writerow(header)
+
+    def _write_rows(self, device_id: str, rows: Iterator[Tuple[int, List[Any]]]) -> int:
+        count = 0
+        for ts, values in rows:
+            self.writer.writerow([device_id, ts] + ['' if value is None else value for value in values])
+            count += 1
+        return count
+
+class ArrowExporter(TelemetryExporter):
+    """
+    Spaltenorientierter Export (Parquet oder Arrow IPC, zstd-komprimiert, benötigt pyarrow).
+    Der Typ jeder Key-Spalte steht vor dem ersten Block fest (siehe column_types), damit alle
+    Dateien eines Exports dasselbe Schema haben. Nicht-numerische Werte in float64-Spalten
+    werden null und gezählt.
+    """
+
+    def __init__(self, path: str, keys: List[str], fmt: str = 'parquet', types: Optional[Dict[str, str]] = None):
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError("pyarrow ist nicht installiert (pip install pyarrow)")
+        super().__init__(path, keys)
+        self.pa = pyarrow
+        self.fmt = fmt
+        self.types = column_types(keys, types)
+        fields = [pyarrow.field('deviceId', pyarrow.string()), pyarrow.field('ts', pyarrow.timestamp('ms', tz='UTC'))]
+        for key in keys:
+            fields.append(pyarrow.field(key, pyarrow.float64() if self.types[key] == 'float64' else pyarrow.string()))
+        self.schema = pyarrow.schema(fields)
+        self.writer = None
+        self.dropped = 0
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        self._device_ids: List[str] = []
+        self._timestamps: List[int] = []
+        self._columns: List[List[Any]] = [[] for _ in self.keys]
+
+    def _write_rows(self, device_id: str, rows: Iterator[Tuple[int, List[Any]]]) -> int:
+        count = 0
+        for ts, values in rows:
+            self._device_ids.append(device_id)
+            self._timestamps.append(ts)
+            for column, value in zip(self._columns, values):
+                column.append(value)
+            count += 1
+            if len(self._timestamps) >= EXPORT_ROW_GROUP_ROWS:
+                self._flush()
+        return count
+
+    def _open(self):
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=EXPORT_COMPRESSION)
+        else:
+            import pyarrow.ipc as ipc
+            self.writer = ipc.new_file(self.path, self.schema,
+                                       options=ipc.IpcWriteOptions(compression=EXPORT_COMPRESSION))
+
+    def _flush(self):
+        if not self._timestamps:
+            return
+        if self.writer is None:
+            self._open()
+        pa = self.pa
+        arrays = [pa.array(self._device_ids, pa.string()), pa.array(self._timestamps, pa.timestamp('ms', tz='UTC'))]
+        for field, column in zip(list(self.schema)[2:], self._columns):
+            if pa.types.is_floating(field.type):
+                parsed = [parse_value(value) if value is not None else None for value in column]
+                self.dropped += sum(1 for value, number in zip(column, parsed) if value is not None and number is None)
+                arrays.append(pa.array(parsed, pa.float64()))
+            else:
+                arrays.append(pa.array([str(value) if value is not None else None for value in column], pa.string()))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.fmt == 'parquet':
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write(batch)
+        self._reset_buffer()
+
+    def close(self):
+        self._flush()
+        if self.writer is None:
+            # Leerer Export: Datei trotzdem mit Schema anlegen
+            self._open()
+        self.writer.close()
+        if self.dropped:
+            print(f"⚠️  {self.dropped} nicht-numerische Werte in numerischen Spalten als null exportiert")
+
+def open_exporter(path: str, keys: List[str], fmt: Optional[str] = None,
+                  types: Optional[Dict[str, str]] = None, append: bool = False) -> TelemetryExporter:
+    """
+    Exporter für das angegebene (oder aus der Dateiendung erkannte) Format; types nur für Parquet/Arrow.
+    append hängt an eine vorhandene NDJSON-/CSV-Datei an, Parquet/Arrow lassen sich nicht fortsetzen.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unbekanntes Exportformat: {fmt} (erlaubt: {', '.join(EXPORT_FORMATS)})")
+    if fmt == 'ndjson':
+        return NdjsonExporter(path, keys, append)
+    if fmt == 'csv':
+        return CsvExporter(path, keys, append)
+    if append and _has_content(path):
+        raise ValueError(f"An {fmt}-Dateien kann nicht angehängt werden ({path} existiert), ndjson oder csv verwenden")
+    return ArrowExporter(path, keys, fmt, types)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Live-Modus für telemetry_client.py (--follow)
+Fragt für viele Geräte nur noch Werte nach dem zuletzt gesehenen Zeitstempel ab und gibt neue
+Werte aus (oder hängt sie an einen Export an). Das Abfrageintervall passt sich pro Gerät an das
+beobachtete Sendeintervall an: abgefragt wird kurz nach dem erwarteten nächsten Uplink, ohne
+neue Werte wird das Intervall schrittweise verlängert.
+
+Mit --ws-url werden stattdessen die ThingsBoard-WebSocket-Abonnements (LATEST_TELEMETRY) mit dem
+tbToken der Session verwendet; bei einem Verbindungsfehler geht es per Polling weiter.
+"""
+
+import sys
+import json
+import time
+import heapq
+import asyncio
+from collections import deque
+from datetime import datetime
+from statistics import median
+from typing import Dict, List, Any, Optional
+
+import aiohttp
+
+from telemetry_client import TelemetryClient, MANY_MAX_CONCURRENCY, MANY_MAX_RETRIES, RANGE_MAX_POINTS
+from telemetry_export import TelemetryExporter
+
+FOLLOW_MIN_INTERVAL_S = 5
+FOLLOW_MAX_INTERVAL_S = 300
+FOLLOW_BACKOFF = 1.5  # Intervall-Faktor nach einer Abfrage ohne neue Werte
+FOLLOW_SLACK_S = 15  # Abstand nach dem erwarteten Uplink (Verarbeitung in ThingsBoard)
+FOLLOW_GAP_HISTORY = 5  # Anzahl der letzten Sendeabstände für die Schätzung
+WS_PATH = "/api/ws/plugins/telemetry"
+
+class DeviceState:
+    """Zuletzt gesehene Zeitstempel pro Key und Schätzung des Sendeintervalls eines Geräts"""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.last_ts: Dict[str, int] = {}
+        self.gaps: deque = deque(maxlen=FOLLOW_GAP_HISTORY)
+        self.interval = FOLLOW_MIN_INTERVAL_S
+        self.polls = 0
+
+    def since(self) -> Optional[int]:
+        """
+        Neuester gesehener Zeitstempel über alle Keys (Beginn der nächsten Abfrage). Selten sendende
+        Keys halten den Cursor so nicht zurück; take_new filtert weiterhin pro Key.
+        """
+        return max(self.last_ts.values()) if self.last_ts else None
+
+    def take_new(self, data: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """Nur Werte, die neuer sind als der zuletzt gesehene Wert des jeweiligen Keys"""
+        new = {}
+        newest_before = max(self.last_ts.values()) if self.last_ts else None
+        for key, values in data.items():
+            last = self.last_ts.get(key)
+            points = [point for point in values or [] if last is None or point['ts'] > last]
+            if points:
+                new[key] = points
+                self.last_ts[key] = max(point['ts'] for point in points)
+        if new and newest_before is not None:
+            newest = max(self.last_ts.values())
+            if newest > newest_before:
+                self.gaps.append(newest - newest_before)
+        return new
+
+    def next_poll(self, now: float, found_new: bool) -> float:
+        """Zeitpunkt der nächsten Abfrage (Unix-Sekunden)"""
+        if found_new:
+            self.interval = FOLLOW_MIN_INTERVAL_S
+            if self.gaps and self.last_ts:
+                # Kurz nach dem erwarteten nächsten Uplink abfragen
+                expected = max(self.last_ts.values()) / 1000 + median(self.gaps) / 1000 + FOLLOW_SLACK_S
+                return min(max(expected, now + FOLLOW_MIN_INTERVAL_S), now + FOLLOW_MAX_INTERVAL_S)
+        else:
+            self.interval = min(FOLLOW_MAX_INTERVAL_S, self.interval * FOLLOW_BACKOFF)
+        return now + self.interval
+
+def format_new_points(device_id: str, new: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+    """Eine Zeile pro Zeitstempel: Uhrzeit, Gerät und alle Keys mit Wert"""
+    by_ts: Dict[int, List[str]] = {}
+    for key, points in new.items():
+        for point in points:
+            by_ts.setdefault(point['ts'], []).append(f"{key}={point.get('value')}")
+    return [f"{datetime.fromtimestamp(ts / 1000).strftime('%H:%M:%S')} 📟 {device_id} {' '.join(values)}"
+            for ts, values in sorted(by_ts.items())]
+
+class TelemetryFollower:
+    """Verfolgt neue Telemetriewerte vieler Geräte; Ausgabe auf stdout oder in einen Export"""
+
+    def __init__(self, client: TelemetryClient, device_ids: List[str], keys: str,
+                 exporter: Optional[TelemetryExporter] = None, concurrency: int = MANY_MAX_CONCURRENCY):
+        self.client = client
+        self.keys = keys
+        self.exporter = exporter
+        self.concurrency = concurrency
+        self.devices = {device_id: DeviceState(device_id) for device_id in device_ids}
+        self.new_points = 0
+        self.requests = 0
+
+    def emit(self, device_id: str, data: Dict[str, Any]) -> bool:
+        """Gibt neue Werte aus; liefert True wenn es neue Werte gab"""
+        new = self.devices[device_id].take_new(data)
+        if not new:
+            return False
+        self.new_points += sum(len(points) for points in new.values())
+        if self.exporter is not None:
+            self.exporter.write(device_id, new)
+            self.exporter.flush()
+        else:
+            for line in format_new_points(device_id, new):
+                print(line, flush=True)
+        return True
+
+    async def _poll(self, http: aiohttp.ClientSession, state: DeviceState, queued: Optional[float] = None) -> bool:
+        params = {"deviceId": state.device_id, "keys": self.keys}
+        since = state.since()
+        if since is not None:
+            # Nur Werte nach dem zuletzt gesehenen Zeitstempel; endTs mit Reserve für Uhrabweichungen
+            params.update({"startTs": str(since + 1), "endTs": str(int(time.time() * 1000) + 60000),
+                           "limit": str(RANGE_MAX_POINTS)})
+        self.requests += 1
+        data, error = await self.client._fetch_telemetry_async(http, params, MANY_MAX_RETRIES, queued_since=queued)
+        state.polls += 1
+        if data is None:
+            print(f"⚠️  Device {state.device_id}: {error}", file=sys.stderr)
+            return False
+        return self.emit(state.device_id, data)
+
+    async def run_polling(self, duration_s: Optional[float] = None):
+        """
+        Polling mit einem Zeitplan pro Gerät (Heap nach nächstem Abfragezeitpunkt); höchstens
+        concurrency Abfragen gleichzeitig. Die erste Abfrage ohne Zeitbereich liefert den letzten Wert.
+        """
+        deadline = time.time() + duration_s if duration_s else None
+        schedule = [(time.time(), device_id) for device_id in self.devices]
+        heapq.heapify(schedule)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        in_flight = set()
+
+        async def poll(http: aiohttp.ClientSession, state: DeviceState):
+            queued = time.perf_counter()
+            async with semaphore:
+                found_new = await self._poll(http, state, queued)
+            heapq.heappush(schedule, (state.next_poll(time.time(), found_new), state.device_id))
+
+        async with self.client._async_http_session(self.concurrency) as http:
+            try:
+                while schedule or in_flight:
+                    now = time.time()
+                    if deadline and now >= deadline:
+                        break
+                    if not schedule or schedule[0][0] > now:
+                        wake = schedule[0][0] if schedule else now + FOLLOW_MIN_INTERVAL_S
+                        if deadline:
+                            wake = min(wake, deadline)
+                        # Kurz schlafen; fertige Abfragen tragen sich neu in den Zeitplan ein
+                        await asyncio.sleep(min(max(0.0, wake - now), 1.0))
+                        continue
+                    _, device_id = heapq.heappop(schedule)
+                    task = asyncio.ensure_future(poll(http, self.devices[device_id]))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+            finally:
+                for task in list(in_flight):
+                    task.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
+
+    async def run_websocket(self, ws_url: str, tb_token: str, duration_s: Optional[float] = None) -> bool:
+        """
+        Abonniert LATEST_TELEMETRY aller Geräte über den ThingsBoard-WebSocket. Die erste Nachricht
+        pro Abonnement enthält die aktuellen Werte. Liefert False, wenn die Verbindung nicht
+        aufgebaut werden konnte oder abbricht (Aufrufer setzt dann mit Polling fort).
+        """
+        device_ids = list(self.devices)
+        commands = [{"entityType": "DEVICE", "entityId": device_id, "scope": "LATEST_TELEMETRY",
+                     "cmdId": index + 1, "keys": self.keys} for index, device_id in enumerate(device_ids)]
+        url = f"{ws_url.rstrip('/')}{WS_PATH}?token={tb_token}"
+        try:
+            async with aiohttp.ClientSession() as http:
+                async with http.ws_connect(url, heartbeat=30) as ws:
+                    await ws.send_str(json.dumps({"tsSubCmds": commands, "historyCmds": [], "attrSubCmds": []}))
+                    print(f"🔌 WebSocket verbunden, {len(commands)} Geräte abonniert", file=sys.stderr)
+                    deadline = time.time() + duration_s if duration_s else None
+                    while True:
+                        timeout = max(0.0, deadline - time.time()) if deadline else None
+                        try:
+                            message = await ws.receive(timeout=timeout)
+                        except asyncio.TimeoutError:
+                            return True
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            print(f"⚠️  WebSocket geschlossen ({message.type.name})", file=sys.stderr)
+                            return False
+                        update = json.loads(message.data)
+                        if update.get('errorCode'):
+                            print(f"⚠️  WebSocket-Fehler: {update.get('errorMsg')}", file=sys.stderr)
+                            continue
+                        index = update.get('subscriptionId', 0) - 1
+                        if 0 <= index < len(device_ids):
+                            data = {key: [{'ts': ts, 'value': value} for ts, value in points]
+                                    for key, points in (update.get('data') or {}).items()}
+                            self.emit(device_ids[index], data)
+        except (aiohttp.ClientError, OSError) as e:
+            print(f"⚠️  WebSocket nicht verfügbar: {e}", file=sys.stderr)
+            return False
+
+async def follow_telemetry(follower: TelemetryFollower, ws_url: Optional[str] = None,
+                           duration_s: Optional[float] = None):
+    """--follow: WebSocket falls angegeben und ein tbToken vorhanden ist, sonst (oder danach) Polling"""
+    started = time.time()
+    tb_token = (follower.client.session_data or {}).get('tbToken')
+    if ws_url and not tb_token:
+        print("⚠️  Kein tbToken in der Session, verwende Polling", file=sys.stderr)
+    if ws_url and tb_token:
+        if await follower.run_websocket(ws_url, tb_token, duration_s):
+            return
+        print("🔄 Weiter mit Polling ab den zuletzt gesehenen Werten...", file=sys.stderr)
+    remaining = duration_s - (time.time() - started) if duration_s else None
+    if remaining is None or remaining > 0:
+        await follower.run_polling(remaining)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Direkter Lesezugriff auf die ThingsBoard-Telemetrie in PostgreSQL (ts_kv / ts_kv_dictionary)
+Für große historische Abfragen ohne den Umweg über die Next.js-API und JSON:
+
+- iter_blocks(): Named (Server-Side) Cursor, liefert Blöcke im Format der Telemetrie-API
+  ({key: [{'ts', 'value'}, ...]}, aufsteigend) für die Exporter; im Speicher liegt nur ein Block.
+- read_columns(): COPY ... TO STDOUT (FORMAT binary) direkt in NumPy-Spalten (ts, float64) für
+  telemetry_arrays; der COPY-Strom wird in Stücken von PG_COPY_BUFFER_BYTES verarbeitet.
+
+Verbindung wie lib/pgdb.js über PG_HOST, PG_PORT, PG_USER, PG_PASSWORD, PG_DATABASE, PG_SSL.
+Zum Testen legt "python telemetry_pg.py --seed" Tabellen und synthetische Daten in einer lokalen
+Datenbank an.
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from typing import Dict, List, Any, Iterator, Tuple
+
+import tracing
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+PG_CURSOR_ITERSIZE = 20000  # Zeilen pro Roundtrip des Server-Side-Cursors (= Blockgröße)
+PG_COPY_BUFFER_BYTES = 4 * 1024 * 1024  # COPY-Daten werden in Stücken dieser Größe umgewandelt
+PG_CONNECT_TIMEOUT_S = 10  # wie connectionTimeoutMillis in lib/pgdb.js
+
+PGCOPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+PGCOPY_HEADER_BYTES = len(PGCOPY_SIGNATURE) + 8  # Signatur, Flags, Länge der Header-Erweiterung
+
+# Numerischer Wert einer Zeile; Strings nur wenn sie wie eine Zahl aussehen, sonst NaN
+NUMERIC_VALUE_SQL = r"""COALESCE(dbl_v, long_v::float8, bool_v::int::float8,
+         CASE WHEN str_v ~ '^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$' THEN str_v::float8 END,
+         'NaN'::float8)"""
+
+# Namensraum für die Device-IDs der synthetischen Testdaten
+SEED_NAMESPACE = uuid.UUID('6f1c1b9e-2d0a-4c55-9a53-7b0f3c1e8d21')
+SEED_INTERVAL_MS = 10 * 60 * 1000
+
+def _psycopg2():
+    try:
+        import psycopg2
+    except ImportError:
+        raise RuntimeError("psycopg2 ist nicht installiert (pip install psycopg2-binary)")
+    return psycopg2
+
+def pg_connect(readonly: bool = True):
+    """Verbindung mit den Einstellungen aus der Umgebung (wie lib/pgdb.js)"""
+    psycopg2 = _psycopg2()
+    conn = psycopg2.connect(
+        host=os.getenv('PG_HOST'),
+        port=os.getenv('PG_PORT') or 5432,
+        user=os.getenv('PG_USER'),
+        password=os.getenv('PG_PASSWORD'),
+        dbname=os.getenv('PG_DATABASE'),
+        sslmode='require' if os.getenv('PG_SSL') == 'true' else 'disable',
+        connect_timeout=PG_CONNECT_TIMEOUT_S,
+        application_name='heatmanager-telemetry'
+    )
+    conn.set_session(readonly=readonly)
+    return tracing.traced_connection(conn)
+
+def row_value(bool_v, str_v, long_v, dbl_v, json_v) -> Any:
+    """Wert einer ts_kv-Zeile in derselben Reihenfolge wie pages/api/telemetry/ts-kv.js"""
+    for value in (bool_v, str_v, long_v, dbl_v, json_v):
+        if value is not None:
+            return value
+    return None
+
+class _BinaryCopySink:
+    """
+    Dateiobjekt für copy_expert(): nimmt den binären COPY-Strom (key int4, ts int8, value float8)
+    entgegen und übergibt vollständige Datensätze blockweise als NumPy-Arrays an on_records.
+    """
+
+    def __init__(self, on_records):
+        import numpy as np
+        self.np = np
+        self.record = np.dtype([('fields', '>i2'), ('key_len', '>i4'), ('key', '>i4'), ('ts_len', '>i4'),
+                                ('ts', '>i8'), ('value_len', '>i4'), ('value', '>f8')])
+        self.on_records = on_records
+        self.buffer = bytearray()
+        self.header_done = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= PG_COPY_BUFFER_BYTES:
+            self._drain()
+        return len(data)
+
+    def _drain(self, final: bool = False):
+        offset = 0
+        if not self.header_done:
+            if len(self.buffer) < PGCOPY_HEADER_BYTES:
+                return
+            if bytes(self.buffer[:len(PGCOPY_SIGNATURE)]) != PGCOPY_SIGNATURE:
+                raise ValueError("Unerwartetes COPY-Format (keine PGCOPY-Signatur)")
+            offset = PGCOPY_HEADER_BYTES + int.from_bytes(self.buffer[PGCOPY_HEADER_BYTES - 4:PGCOPY_HEADER_BYTES], 'big')
+            self.header_done = True
+        available = len(self.buffer) - offset - (2 if final else 0)  # Trailer: int16 -1
+        count = max(0, available) // self.record.itemsize
+        if count:
+            records = self.np.frombuffer(self.buffer, self.record, count, offset)
+            if (records['fields'] != 3).any() or (records['value_len'] != 8).any():
+                raise ValueError("Unerwartete NULL-Werte oder Spaltenanzahl im COPY-Strom")
+            keys, timestamps, values = (records['key'].astype(self.np.int32), records['ts'].astype(self.np.int64),
+                                        records['value'].astype(self.np.float64))
+            del records
+            self.on_records(keys, timestamps, values)
+        del self.buffer[:offset + count * self.record.itemsize]
+
+    def close(self):
+        self._drain(final=True)
+
+class TsKvReader:
+    """Liest Zeitreihen eines Devices direkt aus ts_kv (Zeitbereich [start_ts, end_ts))"""
+
+    def __init__(self, conn=None):
+        self.conn = conn if conn is not None else pg_connect()
+        self._key_ids: Dict[str, int] = {}
+
+    def key_ids(self, keys: List[str]) -> Dict[str, int]:
+        """key -> key_id aus ts_kv_dictionary (unbekannte Keys fehlen im Ergebnis)"""
+        missing = [key for key in keys if key not in self._key_ids]
+        if missing:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT key, key_id FROM ts_kv_dictionary WHERE key = ANY(%s)", (missing,))
+                self._key_ids.update(cursor.fetchall())
+            self.conn.rollback()
+            unknown = [key for key in missing if key not in self._key_ids]
+            if unknown:
+                print(f"⚠️  Keys nicht in ts_kv_dictionary: {', '.join(unknown)}", file=sys.stderr)
+        return {key: self._key_ids[key] for key in keys if key in self._key_ids}
+
+    def iter_blocks(self, device_id: str, keys: List[str], start_ts: int, end_ts: int,
+                    block_rows: int = PG_CURSOR_ITERSIZE) -> Iterator[Dict[str, List[Dict[str, Any]]]]:
+        """
+        Blöcke im Format der Telemetrie-API, aufsteigend nach Zeit. Ein Zeitstempel wird nie auf
+        zwei Blöcke verteilt, damit die Exporter die Werte aller Keys zu einer Zeile zusammenfassen.
+        """
+        key_ids = self.key_ids(keys)
+        if not key_ids:
+            return
+        names = {key_id: key for key, key_id in key_ids.items()}
+        try:
+            with self.conn.cursor(name=f"ts_kv_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = block_rows
+                cursor.execute(
+                    "SELECT key, ts, bool_v, str_v, long_v, dbl_v, json_v FROM ts_kv "
+                    "WHERE entity_id = %s AND key = ANY(%s) AND ts >= %s AND ts < %s ORDER BY ts, key",
+                    (device_id, list(names), start_ts, end_ts))
+                carry: List[Tuple] = []
+                while True:
+                    rows = cursor.fetchmany(block_rows)
+                    if not rows:
+                        break
+                    rows = carry + rows
+                    # Zeilen mit dem letzten Zeitstempel in den nächsten Block übernehmen
+                    cut = len(rows)
+                    while cut > 0 and rows[cut - 1][1] == rows[-1][1]:
+                        cut -= 1
+                    if cut == 0:
+                        carry = rows
+                        continue
+                    carry = rows[cut:]
+                    yield self._block(rows[:cut], names)
+                if carry:
+                    yield self._block(carry, names)
+        finally:
+            self.conn.rollback()
+
+    @staticmethod
+    def _block(rows: List[Tuple], names: Dict[int, str]) -> Dict[str, List[Dict[str, Any]]]:
+        block: Dict[str, List[Dict[str, Any]]] = {}
+        for key_id, ts, *values in rows:
+            block.setdefault(names[key_id], []).append({'ts': ts, 'value': row_value(*values)})
+        return block
+
+    def read_telemetry(self, device_id: str, keys: List[str], start_ts: int, end_ts: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Gesamter Zeitbereich im Format der Telemetrie-API (absteigend wie ThingsBoard)"""
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for block in self.iter_blocks(device_id, keys, start_ts, end_ts):
+            for key, points in block.items():
+                result.setdefault(key, []).extend(points)
+        return {key: points[::-1] for key, points in result.items()}
+
+    def read_columns(self, device_id: str, keys: List[str], start_ts: int, end_ts: int) -> Dict[str, Tuple[Any, Any]]:
+        """Spalten (ts int64, Wert float64, aufsteigend) pro Key über binäres COPY; nicht-numerisch = NaN"""
+        import numpy as np
+        key_ids = self.key_ids(keys)
+        names = {key_id: key for key, key_id in key_ids.items()}
+        chunks: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {key_id: [] for key_id in names}
+
+        def on_records(key_column: np.ndarray, timestamps: np.ndarray, values: np.ndarray):
+            # Sortiert nach key, ts: jeder Key bildet einen zusammenhängenden Abschnitt
+            bounds = np.flatnonzero(np.diff(key_column)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, key_column.size]):
+                chunks[int(key_column[start])].append((timestamps[start:end], values[start:end]))
+
+        if names:
+            with self.conn.cursor() as cursor:
+                query = cursor.mogrify(
+                    f"COPY (SELECT key, ts, {NUMERIC_VALUE_SQL} FROM ts_kv "
+                    "WHERE entity_id = %s AND key = ANY(%s) AND ts >= %s AND ts < %s ORDER BY key, ts) "
+                    "TO STDOUT WITH (FORMAT binary)",
+                    (device_id, list(names), start_ts, end_ts)).decode()
+                sink = _BinaryCopySink(on_records)
+                try:
+                    cursor.copy_expert(query, sink)
+                    sink.close()
+                finally:
+                    self.conn.rollback()
+        columns = {}
+        for key_id, parts in chunks.items():
+            if len(parts) == 1:
+                columns[names[key_id]] = parts[0]
+            else:
+                columns[names[key_id]] = (np.concatenate([ts for ts, _ in parts]) if parts else np.empty(0, np.int64),
+                                          np.concatenate([v for _, v in parts]) if parts else np.empty(0, np.float64))
+        return columns
+
+    def export(self, exporter, device_id: str, keys: List[str], start_ts: int, end_ts: int) -> int:
+        """Schreibt den Zeitbereich blockweise in einen TelemetryExporter; liefert die Anzahl Zeilen"""
+        rows = 0
+        for block in self.iter_blocks(device_id, keys, start_ts, end_ts):
+            rows += exporter.write(device_id, block)
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+# Synthetische Testdaten: Key -> (Spalte, SQL-Ausdruck in Abhängigkeit von ts und dem Device-Index i)
+SEED_KEYS = {
+    'sensorTemperature': ('dbl_v', "round((21 + 2 * sin(ts / 3600000.0 + i) + random() * 0.5)::numeric, 2)::float8"),
+    'targetTemperature': ('dbl_v', "CASE WHEN mod(ts / 3600000, 24) BETWEEN 6 AND 21 THEN 21.0 ELSE 17.0 END"),
+    'PercentValveOpen': ('long_v', "(50 + 40 * sin(ts / 7200000.0 + i))::bigint"),
+    'batteryVoltage': ('dbl_v', "round((3.6 - (ts - {start}) / 1e12 - i * 0.01)::numeric, 3)::float8"),
+    'rssi': ('long_v', "(-90 - mod(i, 30) + random() * 6)::bigint"),
+    'snr': ('dbl_v', "round((5 - mod(i, 15) + random() * 2)::numeric, 1)::float8"),
+    'sf': ('long_v', "7 + mod(i, 6)"),
+    'fCnt': ('long_v', "(ts - {start}) / {interval}"),
+    'signalQuality': ('str_v', "CASE WHEN mod(i, 15) > 10 THEN 'Bad' WHEN mod(i, 15) > 5 THEN 'Fair' ELSE 'Good' END")
+}
+
+SEED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ts_kv_dictionary (
+    key varchar(255) NOT NULL,
+    key_id serial UNIQUE,
+    CONSTRAINT ts_key_id_pkey PRIMARY KEY (key)
+);
+CREATE TABLE IF NOT EXISTS ts_kv (
+    entity_id uuid NOT NULL,
+    key int NOT NULL,
+    ts bigint NOT NULL,
+    bool_v boolean,
+    str_v varchar(10000000),
+    long_v bigint,
+    dbl_v double precision,
+    json_v json,
+    CONSTRAINT ts_kv_pkey PRIMARY KEY (entity_id, key, ts)
+);
+"""
+
+def seed_device_ids(count: int) -> List[str]:
+    return [str(uuid.uuid5(SEED_NAMESPACE, f"device-{index}")) for index in range(count)]
+
+def seed_synthetic(conn, devices: int, start_ts: int, end_ts: int, interval_ms: int = SEED_INTERVAL_MS) -> List[str]:
+    """
+    Legt ts_kv/ts_kv_dictionary (ThingsBoard-Schema, ohne Partitionierung) an, falls nicht vorhanden,
+    und füllt sie serverseitig per generate_series mit synthetischen Werten; liefert die Device-IDs
+    """
+    device_ids = seed_device_ids(devices)
+    with conn.cursor() as cursor:
+        cursor.execute(SEED_SCHEMA)
+        cursor.execute("INSERT INTO ts_kv_dictionary (key) SELECT unnest(%s::varchar[]) ON CONFLICT DO NOTHING",
+                       (list(SEED_KEYS),))
+        cursor.execute("SELECT key, key_id FROM ts_kv_dictionary WHERE key = ANY(%s)", (list(SEED_KEYS),))
+        key_ids = dict(cursor.fetchall())
+        first = start_ts - start_ts % interval_ms
+        for index, device_id in enumerate(device_ids):
+            for key, (column, expression) in SEED_KEYS.items():
+                expression = expression.format(start=first, interval=interval_ms)
+                cursor.execute(
+                    f"INSERT INTO ts_kv (entity_id, key, ts, {column}) "
+                    f"SELECT %s, %s, ts, {expression} FROM generate_series(%s::bigint, %s::bigint, %s::bigint) AS ts, "
+                    f"(SELECT %s::int AS i) AS device ON CONFLICT DO NOTHING",
+                    (device_id, key_ids[key], first, end_ts - 1, interval_ms, index))
+            print(f"   {index + 1}/{devices} Devices angelegt", file=sys.stderr)
+        cursor.execute("ANALYZE ts_kv")
+    conn.commit()
+    return device_ids
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetische Telemetrie in einer lokalen ThingsBoard-Datenbank (ts_kv) anlegen")
+    parser.add_argument("--seed", action="store_true", required=True,
+                       help="Tabellen anlegen (falls nicht vorhanden) und Testdaten schreiben")
+    parser.add_argument("--devices", type=int, default=10, help="Anzahl Devices (Standard: 10)")
+    parser.add_argument("--days", type=int, default=30, help="Zeitbereich bis jetzt in Tagen (Standard: 30)")
+    parser.add_argument("--interval", type=int, default=SEED_INTERVAL_MS // 1000,
+                       help=f"Abstand zweier Werte in Sekunden (Standard: {SEED_INTERVAL_MS // 1000})")
+    args = parser.parse_args()
+
+    end_ts = int(time.time() * 1000)
+    start_ts = end_ts - args.days * 24 * 3600 * 1000
+    print(f"🌱 Schreibe {args.devices} Devices x {len(SEED_KEYS)} Keys über {args.days} Tage nach "
+          f"{os.getenv('PG_HOST')}/{os.getenv('PG_DATABASE')}...", file=sys.stderr)
+    conn = pg_connect(readonly=False)
+    try:
+        device_ids = seed_synthetic(conn, args.devices, start_ts, end_ts, args.interval * 1000)
+    finally:
+        conn.close()
+    print("\n".join(device_ids))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Lokaler Telemetrie-Speicher für telemetry_client.py
+Pro Gerät und Key liegen Zeitstempel (int64) und Werte (float64) in append-only Dateien,
+die per mmap gelesen werden. Ein Index speichert die bereits abgerufenen Zeitbereiche
+(Segmente), so dass nur fehlende Teilbereiche von der API geladen werden müssen.
+"""
+
+import os
+import json
+import mmap
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: ohne Dateisperre
+    fcntl = None
+
+DEFAULT_STORE_DIR = os.getenv('TELEMETRY_STORE_DIR', os.path.join('.cache', 'telemetry_store'))
+
+# Die letzten Minuten werden nicht als abgedeckt gespeichert (verspätete Uplinks)
+RECENT_MARGIN_MS = 15 * 60 * 1000
+
+INDEX_VERSION = 1
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Vereinigt halboffene Bereiche [start, end)"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+def subtract_ranges(start: int, end: int, covered: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Teilbereiche von [start, end), die nicht in covered liegen"""
+    missing = []
+    cursor = start
+    for covered_start, covered_end in merge_ranges(covered):
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            missing.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+def format_value(value: float) -> str:
+    """Wert wie in der ThingsBoard-Antwort als String"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def parse_value(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class TelemetryStore:
+    """
+    Append-only Spaltenspeicher: <root>/<device_id>/<key>.ts, <key>.val und index.json.
+    Jedes Segment im Index beschreibt einen abgerufenen Bereich [start, end) und die Position
+    seiner (aufsteigend sortierten) Werte in den Dateien; Segmente überlappen sich nie.
+    """
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+        self._maps: Dict[str, Tuple[int, mmap.mmap]] = {}
+
+    def _device_dir(self, device_id: str) -> str:
+        return os.path.join(self.root, device_id)
+
+    def _index_path(self, device_id: str) -> str:
+        return os.path.join(self._device_dir(device_id), 'index.json')
+
+    def _column_path(self, device_id: str, key: str, suffix: str) -> str:
+        return os.path.join(self._device_dir(device_id), f"{key}.{suffix}")
+
+    def load_index(self, device_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._index_path(device_id), encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {'version': INDEX_VERSION, 'keys': {}}
+
+    def _store_index(self, device_id: str, index: Dict[str, Any]):
+        path = self._index_path(device_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def _locked(self, device_id: str):
+        """Exklusive Sperre pro Gerät, damit parallele Läufe nicht gleichzeitig anhängen"""
+        os.makedirs(self._device_dir(device_id), mode=0o700, exist_ok=True)
+        with open(os.path.join(self._device_dir(device_id), '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def is_cacheable(self, device_id: str, key: str, index: Optional[Dict] = None) -> bool:
+        """Keys mit nicht-numerischen Werten werden nicht gespeichert"""
+        index = index or self.load_index(device_id)
+        return index['keys'].get(key, {}).get('numeric', True)
+
+    def coverage(self, device_id: str, key: str, index: Optional[Dict] = None) -> List[Tuple[int, int]]:
+        index = index or self.load_index(device_id)
+        return merge_ranges([(s['start'], s['end']) for s in index['keys'].get(key, {}).get('segments', [])])
+
+    def missing_ranges(self, device_id: str, key: str, start: int, end: int,
+                       index: Optional[Dict] = None) -> List[Tuple[int, int]]:
+        return subtract_ranges(start, end, self.coverage(device_id, key, index))
+
+    def _column(self, device_id: str, key: str, suffix: str, fmt: str) -> memoryview:
+        """Spalte als memoryview auf das mmap (ohne Kopie); wird bei gewachsener Datei neu gemappt"""
+        path = self._column_path(device_id, key, suffix)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size == 0:
+            return memoryview(b'').cast(fmt)
+        cached = self._maps.get(path)
+        if cached is None or cached[0] != size:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            # Alte Mappings bleiben gültig, solange noch Views darauf existieren
+            self._maps[path] = cached = (size, mapped)
+        return memoryview(cached[1]).cast(fmt)
+
+    def read(self, device_id: str, key: str, start: int, end: int,
+             index: Optional[Dict] = None) -> List[Tuple[memoryview, memoryview]]:
+        """
+        Liefert die gespeicherten Werte in [start, end) als (Zeitstempel, Werte)-Views pro Segment,
+        aufsteigend nach Zeit. Die Views zeigen direkt in die gemappten Dateien.
+        """
+        index = index or self.load_index(device_id)
+        segments = sorted(index['keys'].get(key, {}).get('segments', []), key=lambda s: s['start'])
+        timestamps = self._column(device_id, key, 'ts', 'q')
+        values = self._column(device_id, key, 'val', 'd')
+        parts = []
+        for segment in segments:
+            if segment['end'] <= start or segment['start'] >= end or segment['count'] == 0:
+                continue
+            offset, count = segment['offset'], segment['count']
+            segment_ts = timestamps[offset:offset + count]
+            lo = bisect_left(segment_ts, start)
+            hi = bisect_left(segment_ts, end)
+            if hi > lo:
+                parts.append((segment_ts[lo:hi], values[offset + lo:offset + hi]))
+        return parts
+
+    def append(self, device_id: str, key: str, start: int, end: int, points: List[Dict[str, Any]]) -> bool:
+        """
+        Speichert die Werte eines abgerufenen Bereichs [start, end) als neues Segment.
+        Bereits abgedeckte Teilbereiche werden übersprungen; bei nicht-numerischen Werten wird
+        der Key als nicht speicherbar markiert. Liefert False wenn nichts gespeichert wurde.
+        """
+        with self._locked(device_id):
+            index = self.load_index(device_id)
+            key_index = index['keys'].setdefault(key, {'numeric': True, 'segments': []})
+            if not key_index['numeric']:
+                return False
+
+            parsed = []
+            for point in points:
+                value = parse_value(point.get('value'))
+                if value is None:
+                    key_index['numeric'] = False
+                    key_index['segments'] = []
+                    self._store_index(device_id, index)
+                    return False
+                parsed.append((point['ts'], value))
+            parsed.sort()
+
+            ranges = subtract_ranges(start, end, [(s['start'], s['end']) for s in key_index['segments']])
+            if not ranges:
+                return False
+
+            ts_path = self._column_path(device_id, key, 'ts')
+            val_path = self._column_path(device_id, key, 'val')
+            with open(ts_path, 'ab') as ts_file, open(val_path, 'ab') as val_file:
+                # Nach einem Abbruch können die Dateien unterschiedlich lang sein: auffüllen statt kürzen,
+                # damit bestehende Mappings anderer Prozesse gültig bleiben
+                sizes = (ts_file.tell(), val_file.tell())
+                offset = (max(sizes) + 7) // 8
+                ts_file.write(bytes(offset * 8 - sizes[0]))
+                val_file.write(bytes(offset * 8 - sizes[1]))
+                for range_start, range_end in ranges:
+                    lo = bisect_left(parsed, (range_start,))
+                    hi = bisect_left(parsed, (range_end,))
+                    chunk = parsed[lo:hi]
+                    ts_file.write(array('q', [ts for ts, _ in chunk]).tobytes())
+                    val_file.write(array('d', [value for _, value in chunk]).tobytes())
+                    key_index['segments'].append({'start': range_start, 'end': range_end,
+                                                  'offset': offset, 'count': len(chunk)})
+                    offset += len(chunk)
+                ts_file.flush()
+                val_file.flush()
+                os.fsync(ts_file.fileno())
+                os.fsync(val_file.fileno())
+
+            # Index erst nach den Daten schreiben: ein Abbruch hinterlässt höchstens ungenutzte Bytes
+            self._store_index(device_id, index)
+            return True
+
+    def to_response(self, parts: List[Tuple[memoryview, memoryview]]) -> List[Dict[str, Any]]:
+        """Werte im Format der ThingsBoard-Antwort (absteigend nach Zeit)"""
+        points = []
+        for timestamps, values in reversed(parts):
+            for i in range(len(timestamps) - 1, -1, -1):
+                points.append({'ts': timestamps[i], 'value': format_value(values[i])})
+        return points
+
+def storable_end(end: int, now_ms: Optional[int] = None) -> int:
+    """Ende des Bereichs, der als vollständig abgerufen gespeichert werden darf"""
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    return min(end, now_ms - RECENT_MARGIN_MS)
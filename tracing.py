@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Profiling und Trace-Export für die Python-CLIs (--profile, --trace)
+
+--profile [DATEI]  cProfile über den ganzen Lauf; pstats-Dump (Standard: <skript>.prof) und die
+                   teuersten Funktionen (kumuliert) auf stderr. Erfasst wird nur der Hauptthread.
+--trace DATEI      Chrome-Trace-Event-JSON (chrome://tracing, https://ui.perfetto.dev) mit einem
+                   Span pro HTTP-Request, DB-Statement und Verarbeitungsphase.
+
+HTTP-Spans zeigen die Wartezeit (eigene Warteschlange/Slot, Verbindungspool) als Unter-Spans;
+queue_ms, pool_ms und inflight_ms stehen zusätzlich in den args. Gleichzeitige Spans (asyncio,
+Threads) werden beim Schreiben auf Spuren pro Kategorie verteilt: verschachtelte Phasen landen
+auf derselben Spur, überlappende Spans auf der nächsten freien.
+
+Ohne die Optionen sind alle Funktionen No-ops (kein Overhead für Sessions, Cursor, Spans).
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextvars
+from typing import Dict, List, Any, Optional
+
+PROFILE_TOP_FUNCTIONS = 25  # Anzahl der Funktionen in der Übersicht auf stderr
+TRACE_SQL_CHARS = 1000  # SQL-Text in den args wird auf diese Länge gekürzt
+TRACE_NAME_CHARS = 60
+
+# Spuren im Trace-Viewer pro Kategorie
+TRACE_GROUPS = {'phase': 'Ablauf', 'http': 'HTTP', 'db': 'DB'}
+
+_tracer: Optional["Tracer"] = None
+_profiler = None
+_profile_path: Optional[str] = None
+_current_span: contextvars.ContextVar = contextvars.ContextVar('tracing_span', default=None)
+
+def add_arguments(parser):
+    """Fügt --profile und --trace zu einem ArgumentParser hinzu"""
+    parser.add_argument("--profile", nargs="?", const="", metavar="DATEI",
+                        help="cProfile-Dump schreiben (Standard: <skript>.prof) und teuerste Funktionen ausgeben")
+    parser.add_argument("--trace", metavar="DATEI",
+                        help="Chrome-Trace (JSON) mit Spans für HTTP-Requests, DB-Statements und Phasen schreiben")
+
+def start(args, name: str):
+    """Startet Profiling/Tracing gemäß --profile/--trace; Ausgabe beim Prozessende (auch nach sys.exit)"""
+    global _tracer, _profiler, _profile_path
+    if getattr(args, 'trace', None):
+        _tracer = Tracer(args.trace, name)
+    if getattr(args, 'profile', None) is not None:
+        import cProfile
+        _profile_path = args.profile or f"{name}.prof"
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    if _tracer is not None or _profiler is not None:
+        atexit.register(finish)
+
+def enabled() -> bool:
+    return _tracer is not None
+
+def finish():
+    """Schreibt pstats-Dump und Trace (einmalig)"""
+    global _tracer, _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(_profile_path)
+        print(f"\n⏱️  Profil gespeichert in {_profile_path} (python -m pstats {_profile_path})", file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        try:
+            tracer.write()
+            print(f"🧭 Trace mit {len(tracer.records)} Spans gespeichert in {tracer.path}", file=sys.stderr)
+        except OSError as e:
+            print(f"⚠️  Trace konnte nicht gespeichert werden: {e}", file=sys.stderr)
+
+class Span:
+    """
+    Laufender Span. start_inflight() beendet die Wartephase (Slot/Warteschlange), add_wait() trägt
+    eine weitere Wartezeit ein (z.B. Verbindungspool), set() ergänzt args (Status, Zeilen, ...).
+    """
+
+    __slots__ = ('name', 'cat', 'args', 'start', 'end', 'inflight', 'waits', '_token')
+
+    def __init__(self, name: str, cat: str, args: Dict[str, Any], since: Optional[float] = None):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = since if since is not None else time.perf_counter()
+        self.end = None
+        self.inflight = None
+        self.waits: List[tuple] = []
+        self._token = None
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def start_inflight(self):
+        self.inflight = time.perf_counter()
+
+    def add_wait(self, name: str, start: float, end: float):
+        self.waits.append((name, start, end))
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        tracer = _tracer
+        if tracer is not None:
+            tracer.add(self)
+        return False
+
+class _NullSpan:
+    """Span bei ausgeschaltetem Tracing"""
+
+    __slots__ = ()
+
+    def set(self, **args):
+        pass
+
+    def start_inflight(self):
+        pass
+
+    def add_wait(self, name: str, start: float, end: float):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name: str, cat: str = 'phase', since: Optional[float] = None, **args):
+    """
+    Span als Kontextmanager (auch in async-Code, da ohne await). since (time.perf_counter())
+    datiert den Beginn zurück, z.B. auf den Zeitpunkt des Einreihens in eine Warteschlange.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(name, cat, args, since)
+
+class Phases:
+    """Aufeinanderfolgende Phasen ohne Einrückung: next() beendet die vorige Phase und beginnt die nächste"""
+
+    def __init__(self):
+        self._span: Optional[Span] = None
+
+    def next(self, name: str, **args):
+        self.close()
+        if _tracer is not None:
+            self._span = Span(name, 'phase', args)
+
+    def close(self):
+        current, self._span = self._span, None
+        tracer = _tracer
+        if current is not None and tracer is not None:
+            current.end = time.perf_counter()
+            tracer.add(current)
+
+def current_span():
+    """Innerster aktive Span des laufenden Tasks/Threads (oder None)"""
+    return _current_span.get()
+
+class Tracer:
+    """Sammelt abgeschlossene Spans und schreibt sie als Chrome-Trace-Events"""
+
+    def __init__(self, path: str, process_name: str):
+        self.path = path
+        self.process_name = process_name
+        self.t0 = time.perf_counter()
+        self.records: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Span):
+        with self._lock:
+            self.records.append(record)
+
+    def _us(self, t: float) -> float:
+        return round((t - self.t0) * 1e6, 3)
+
+    def _events(self, record: Span, tid: int) -> List[Dict[str, Any]]:
+        base = {'ph': 'X', 'pid': os.getpid(), 'tid': tid, 'cat': record.cat}
+        args = dict(record.args)
+        waits = list(record.waits)
+        if record.inflight is not None and record.inflight > record.start:
+            waits.insert(0, ('Warten', record.start, record.inflight))
+            args['queue_ms'] = round((record.inflight - record.start) * 1000, 3)
+        pool = sum(end - start for name, start, end in record.waits)
+        if record.waits:
+            args['pool_ms'] = round(pool * 1000, 3)
+        if waits:
+            waited = (record.inflight or record.start) - record.start + pool
+            args['inflight_ms'] = round((record.end - record.start - waited) * 1000, 3)
+        events = [dict(base, name=record.name, ts=self._us(record.start),
+                       dur=self._us(record.end) - self._us(record.start), args=args)]
+        for name, start, end in waits:
+            events.append(dict(base, name=name, cat='queue', ts=self._us(start),
+                               dur=self._us(end) - self._us(start)))
+        return events
+
+    def write(self):
+        """
+        Verteilt die Spans pro Kategorie auf Spuren (Intervall-Färbung nach Startzeit): ein Span
+        kommt auf die erste Spur, auf der er nach dem Ende aller offenen Spans beginnt. Phasen
+        dürfen außerdem ganz im zuletzt geöffneten Span liegen (verschachtelte Phasen); HTTP- und
+        DB-Spans mit gleicher Startzeit (gemeinsame Warteschlange) liegen dagegen nebeneinander.
+        """
+        events: List[Dict[str, Any]] = [
+            {'ph': 'M', 'pid': os.getpid(), 'name': 'process_name', 'args': {'name': self.process_name}}]
+        groups: Dict[str, List[List[float]]] = {}
+        for record in sorted(self.records, key=lambda r: (r.start, -r.end)):
+            group = TRACE_GROUPS.get(record.cat, record.cat)
+            if group not in groups:
+                groups[group] = []
+            lanes = groups[group]
+            group_index = list(groups).index(group)
+            nested = record.cat == 'phase'
+            for lane_index, stack in enumerate(lanes):
+                while stack and stack[-1] <= record.start:
+                    stack.pop()
+                if not stack or (nested and record.end <= stack[-1]):
+                    break
+            else:
+                lane_index = len(lanes)
+                lanes.append([])
+                tid = (group_index + 1) * 1000 + lane_index
+                events.append({'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'name': 'thread_name',
+                               'args': {'name': f"{group} {lane_index + 1}"}})
+                events.append({'ph': 'M', 'pid': os.getpid(), 'tid': tid, 'name': 'thread_sort_index',
+                               'args': {'sort_index': tid}})
+            lanes[lane_index].append(record.end)
+            events.extend(self._events(record, (group_index + 1) * 1000 + lane_index))
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+def _sql_name(sql: str) -> str:
+    """Kurzname eines Statements: erste Zeile ohne überflüssige Leerzeichen"""
+    text = ' '.join(str(sql).split())
+    return text if len(text) <= TRACE_NAME_CHARS else text[:TRACE_NAME_CHARS - 1] + '…'
+
+class _TracedCursor:
+    """Cursor-Proxy (pyodbc/psycopg2): execute, executemany, fetchmany und copy_expert als DB-Spans"""
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def _traced(self, method: str, sql, *args, **extra):
+        with span(_sql_name(sql), cat='db', sql=str(sql)[:TRACE_SQL_CHARS], **extra) as current:
+            result = getattr(self._cursor, method)(sql, *args)
+            rowcount = getattr(self._cursor, 'rowcount', -1)
+            if rowcount is not None and rowcount >= 0:
+                current.set(rowcount=rowcount)
+        # pyodbc liefert den Cursor zurück (cursor.execute(...).fetchone())
+        return self if result is self._cursor else result
+
+    def execute(self, sql, *args):
+        return self._traced('execute', sql, *args)
+
+    def executemany(self, sql, params, *args):
+        return self._traced('executemany', sql, params, *args, rows=len(params))
+
+    def copy_expert(self, sql, file, *args):
+        return self._traced('copy_expert', sql, file, *args)
+
+    def fetchmany(self, *args):
+        with span('fetchmany', cat='db') as current:
+            rows = self._cursor.fetchmany(*args)
+            current.set(rows=len(rows))
+        return rows
+
+class _TracedConnection:
+    """Verbindungs-Proxy, dessen cursor() einen _TracedCursor liefert"""
+
+    def __init__(self, conn):
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def cursor(self, *args, **kwargs):
+        return _TracedCursor(self._conn.cursor(*args, **kwargs))
+
+def traced_connection(conn):
+    """DB-Verbindung mit DB-Spans pro Statement (unverändert, wenn --trace nicht aktiv ist)"""
+    if _tracer is None:
+        return conn
+    return _TracedConnection(conn)
+
+def trace_session(session):
+    """requests.Session: jeder Request als HTTP-Span (inkl. Lesen der Antwort); sonst unverändert"""
+    if _tracer is None:
+        return session
+    request = session.request
+
+    def traced_request(method, url, *args, **kwargs):
+        with span(f"{method.upper()} {_url_path(url)}", cat='http', url=str(url)) as current:
+            response = request(method, url, *args, **kwargs)
+            current.set(status=response.status_code, bytes=len(response.content))
+        return response
+
+    session.request = traced_request
+    return session
+
+def _url_path(url) -> str:
+    from urllib.parse import urlsplit
+    return urlsplit(str(url)).path or '/'
+
+def http_span(method: str, url, since: Optional[float] = None):
+    """HTTP-Span für aiohttp-Requests; Aufrufer setzen status und rufen start_inflight() nach dem Slot"""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(f"{method} {_url_path(url)}", 'http', {'url': str(url)}, since)
+
+def aiohttp_trace_configs() -> List[Any]:
+    """trace_configs für aiohttp.ClientSession: Wartezeit auf eine Pool-Verbindung am aktiven HTTP-Span"""
+    if _tracer is None:
+        return []
+    import aiohttp
+
+    async def on_queued_start(session, context, params):
+        context.queued = time.perf_counter()
+
+    async def on_queued_end(session, context, params):
+        current = _current_span.get()
+        if current is not None and getattr(context, 'queued', None) is not None:
+            current.add_wait('Verbindungspool', context.queued, time.perf_counter())
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_queued_start.append(on_queued_start)
+    config.on_connection_queued_end.append(on_queued_end)
+    return [config]
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Kompakte Tree-Snapshots und strukturelle Diffs für customer_tree_history
+Ein Snapshot speichert den Tree als flache Knotenliste (Preorder) mit internierten
+Strings, serialisiert mit msgpack (Fallback JSON) und zlib-komprimiert.
+Diffs beschreiben Änderungen auf Knotenebene: hinzugefügt, entfernt, verschoben,
+umbenannt, Attribut- und Device-Änderungen.
+"""
+
+import json
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:  # Optional: ohne msgpack wird JSON verwendet
+    msgpack = None
+
+SNAPSHOT_FORMAT_VERSION = 1
+ENCODING_MSGPACK = 'msgpack+zlib'
+ENCODING_JSON = 'json+zlib'
+
+# Felder, die nicht als Attribute behandelt werden
+STRUCTURE_KEYS = ('id', 'name', 'type', 'label', 'hasDevices', 'children', 'relatedDevices')
+DEVICE_KEYS = ('id', 'name', 'type', 'label')
+
+def iter_tree(tree: List[Dict]):
+    """Liefert (Knoten, Parent-ID) in Preorder"""
+    stack = [(node, None) for node in reversed(tree)]
+    while stack:
+        node, parent_id = stack.pop()
+        yield node, parent_id
+        stack.extend((child, node['id']) for child in reversed(node.get('children', [])))
+
+def encode_snapshot(tree: List[Dict]) -> Tuple[bytes, str]:
+    """Kodiert einen Tree als kompakten Snapshot; liefert (Bytes, Encoding)"""
+    strings: Dict[str, int] = {}
+    table: List[str] = []
+
+    def intern(value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(table)
+            table.append(value)
+        return index
+
+    positions: Dict[str, int] = {}
+    nodes = []
+    for node, parent_id in iter_tree(tree):
+        positions[node['id']] = len(nodes)
+        devices = [[intern(device.get(key)) for key in DEVICE_KEYS] for device in node.get('relatedDevices', [])]
+        attributes = [[intern(key), value] for key, value in node.items() if key not in STRUCTURE_KEYS]
+        nodes.append([
+            positions[parent_id] if parent_id is not None else -1,
+            intern(node['id']),
+            intern(node.get('name')),
+            intern(node.get('type')),
+            intern(node.get('label')),
+            1 if node.get('hasDevices') else 0,
+            devices,
+            attributes
+        ])
+
+    payload = {'v': SNAPSHOT_FORMAT_VERSION, 's': table, 'n': nodes}
+    if msgpack is not None:
+        return zlib.compress(msgpack.packb(payload, use_bin_type=True), 6), ENCODING_MSGPACK
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6), ENCODING_JSON
+
+def decode_snapshot(data: bytes, encoding: str) -> List[Dict]:
+    """Baut den Tree aus einem Snapshot wieder auf (Knotenformat wie build_sub_tree)"""
+    raw = zlib.decompress(data)
+    if encoding == ENCODING_MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack is required to decode this snapshot')
+        payload = msgpack.unpackb(raw, raw=False)
+    elif encoding == ENCODING_JSON:
+        payload = json.loads(raw.decode('utf-8'))
+    else:
+        raise ValueError(f'Unknown snapshot encoding: {encoding}')
+
+    table = payload['s']
+
+    def text(index: int) -> Optional[str]:
+        return table[index] if index >= 0 else None
+
+    tree: List[Dict] = []
+    built: List[Dict] = []
+    for parent, node_id, name, node_type, label, has_devices, devices, attributes in payload['n']:
+        node = {
+            'id': text(node_id),
+            'name': text(name),
+            'type': text(node_type),
+            'label': text(label),
+            'hasDevices': bool(has_devices),
+            'children': []
+        }
+        if devices:
+            node['relatedDevices'] = [
+                {key: text(index) for key, index in zip(DEVICE_KEYS, device)} for device in devices
+            ]
+        for key_index, value in attributes:
+            node[text(key_index)] = value
+        built.append(node)
+        (built[parent]['children'] if parent >= 0 else tree).append(node)
+    return tree
+
+def index_tree(tree: List[Dict]) -> Dict[str, Dict]:
+    """Flacher Index id -> Knotendaten ohne Children für den Vergleich"""
+    index = {}
+    for node, parent_id in iter_tree(tree):
+        index[node['id']] = {
+            'parentId': parent_id,
+            'name': node.get('name'),
+            'label': node.get('label'),
+            'type': node.get('type'),
+            'attributes': {key: value for key, value in node.items() if key not in STRUCTURE_KEYS},
+            'devices': {device['id']: device for device in node.get('relatedDevices', [])}
+        }
+    return index
+
+def diff_trees(old_tree: List[Dict], new_tree: List[Dict]) -> Dict[str, List]:
+    """Berechnet die Änderungen auf Knotenebene von old_tree nach new_tree"""
+    old_index = index_tree(old_tree)
+    new_index = index_tree(new_tree)
+    diff = {'added': [], 'removed': [], 'moved': [], 'renamed': [], 'attributes': [], 'devices': []}
+
+    for node_id, new in new_index.items():
+        old = old_index.get(node_id)
+        if old is None:
+            diff['added'].append({
+                'id': node_id,
+                'parentId': new['parentId'],
+                'name': new['name'],
+                'label': new['label'],
+                'type': new['type'],
+                'attributes': new['attributes'],
+                'relatedDevices': list(new['devices'].values())
+            })
+            continue
+
+        if old['parentId'] != new['parentId']:
+            diff['moved'].append({'id': node_id, 'fromParentId': old['parentId'], 'toParentId': new['parentId']})
+
+        if old['name'] != new['name'] or old['label'] != new['label']:
+            diff['renamed'].append({
+                'id': node_id,
+                'oldName': old['name'], 'newName': new['name'],
+                'oldLabel': old['label'], 'newLabel': new['label']
+            })
+
+        old_attributes = dict(old['attributes'], type=old['type'])
+        new_attributes = dict(new['attributes'], type=new['type'])
+        changes = {
+            key: [old_attributes.get(key), new_attributes.get(key)]
+            for key in old_attributes.keys() | new_attributes.keys()
+            if old_attributes.get(key) != new_attributes.get(key)
+        }
+        if changes:
+            diff['attributes'].append({'id': node_id, 'changes': changes})
+
+        added_devices = [device for device_id, device in new['devices'].items()
+                         if old['devices'].get(device_id) != device]
+        removed_devices = [device_id for device_id in old['devices'] if device_id not in new['devices']]
+        if added_devices or removed_devices:
+            diff['devices'].append({'id': node_id, 'upserted': added_devices, 'removed': removed_devices})
+
+    for node_id, old in old_index.items():
+        if node_id not in new_index:
+            diff['removed'].append({'id': node_id, 'parentId': old['parentId'], 'name': old['name']})
+
+    return diff
+
+def is_empty_diff(diff: Dict[str, List]) -> bool:
+    return not any(diff.values())
+
+def summarize_diff(diff: Dict[str, List]) -> Dict[str, int]:
+    return {key: len(entries) for key, entries in diff.items()}